@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import create_backend, estimate_tokens, make_request
+from engine.llamacpp_stub import StubServer
+from scheduling import POLICIES, schedule_indices
+
+# 调度策略基准测试：对同一批条目按不同调度策略提交，比较总耗时、吞吐和平均完成时间
+# 默认在进程内启动engine.llamacpp_stub作为服务端，不需要显卡：
+#     python benchmark.py --entries 400 --workers 8 --slots 8
+# 也可以使用真实的待翻译文件和服务端：
+#     python benchmark.py --task ManualTransFile.json --endpoint http://127.0.0.1:8080/v1/chat/completions
+
+# 生成长度分布接近RPG游戏文本的条目：大量按钮和名称，部分对话，少量长说明
+def synthetic_entries(count, seed):
+    rng = random.Random(seed)
+    chars = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん"
+    entries = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < 0.6:
+            length = rng.randint(2, 8)
+        elif roll < 0.92:
+            length = rng.randint(15, 60)
+        else:
+            length = rng.randint(150, 400)
+        entries.append("".join(rng.choice(chars) for _ in range(length)))
+    return entries
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+# 按policy的顺序提交全部条目，返回统计结果
+def run_policy(entries, policy, backend, workers, model_type):
+    order = schedule_indices(range(len(entries)), lambda i: entries[i], policy)
+    latencies = []
+    finished = []
+    tokens = []
+    lock = threading.Lock()
+    began = time.time()
+
+    def translate(index):
+        start = time.time()
+        response = backend.complete(make_request(entries[index], model_type, max_tokens=1024), 600)
+        end = time.time()
+        with lock:
+            latencies.append(end - start)
+            finished.append(end - began)
+            tokens.append(response.get("usage", {}).get("completion_tokens", 0))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(translate, index) for index in order]:
+            future.result()
+    elapsed = time.time() - began
+    return {
+        "policy": policy,
+        "elapsed": elapsed,
+        "entries_per_second": len(entries) / elapsed,
+        "tokens_per_second": sum(tokens) / elapsed,
+        "mean_completion": sum(finished) / len(finished),
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="调度策略基准测试")
+    parser.add_argument("--task", help="待翻译的Mtool JSON文件，默认生成合成条目")
+    parser.add_argument("--entries", type=int, default=400, help="合成条目数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--endpoint", help="服务端地址，默认在进程内启动llama.cpp替身")
+    parser.add_argument("--workers", type=int, default=8, help="并发请求数")
+    parser.add_argument("--slots", type=int, default=8, help="替身的slot数")
+    parser.add_argument("--prefill-ms", type=float, default=0.2, help="替身每个提示词token的prefill耗时（毫秒）")
+    parser.add_argument("--decode-ms", type=float, default=2.0, help="替身每个生成token的耗时（毫秒）")
+    parser.add_argument("--batch-penalty", type=float, default=0.1, help="替身每多一个同时生成的slot，单个token耗时增加的比例")
+    parser.add_argument("--policies", default=",".join(POLICIES), help="逗号分隔的调度策略")
+    parser.add_argument("--model-type", default="SakuraV1_0")
+    args = parser.parse_args()
+
+    if args.task:
+        with open(args.task, 'r', encoding='utf-8') as file:
+            entries = list(json.load(file).keys())
+    else:
+        entries = synthetic_entries(args.entries, args.seed)
+    total_tokens = sum(estimate_tokens(entry) for entry in entries)
+    print(f"条目 {len(entries)} 条，预估 {total_tokens} token，并发 {args.workers}")
+
+    server = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        server = StubServer(("127.0.0.1", 0), args.slots, args.prefill_ms, args.decode_ms, args.batch_penalty)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        endpoint = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+    backend = create_backend(endpoint)
+
+    print(f"{'策略':<8}{'耗时(s)':>10}{'条目/秒':>10}{'token/秒':>10}{'平均完成(s)':>12}{'延迟p50':>10}{'延迟p95':>10}")
+    for policy in args.policies.split(","):
+        result = run_policy(entries, policy, backend, args.workers, args.model_type)
+        print(f"{result['policy']:<8}{result['elapsed']:>10.2f}{result['entries_per_second']:>10.1f}{result['tokens_per_second']:>10.1f}"
+              f"{result['mean_completion']:>12.2f}{result['p50']:>10.3f}{result['p95']:>10.3f}")
+    if server is not None:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
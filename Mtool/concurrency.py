@@ -0,0 +1,178 @@
+import threading
+import time
+from collections import deque
+
+# 单个endpoint的AIMD并发状态
+class EndpointLimiter:
+    def __init__(self, backend, initial_limit, min_limit, max_limit):
+        self.backend = backend
+        self.endpoint = backend.name
+        # 被移除的endpoint不再分配新请求
+        self.enabled = True
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.inflight = 0
+        # 每个completion token的耗时，消除译文长度对延迟的影响
+        self.samples = deque(maxlen=100)
+        self.smoothed = None
+        self.finished = deque(maxlen=1000)
+        self.completed = 0
+        self.errors = 0
+        self.last_decrease = 0
+        self.last_latency = 0
+
+    def available(self):
+        return int(self.limit) - self.inflight
+
+    def baseline(self):
+        return min(self.samples) if self.samples else None
+
+    # 每秒完成的请求数（最近60秒）
+    def throughput(self):
+        now = time.time()
+        recent = [t for t in self.finished if now - t <= 60]
+        if len(recent) < 2:
+            return 0.0
+        return len(recent) / max(now - recent[0], 1e-6)
+
+    # 乘性减少，每个冷却周期内最多一次，避免一次拥塞连续触发
+    def decrease(self, factor):
+        now = time.time()
+        if now - self.last_decrease < max(self.last_latency, 1.0):
+            return
+        self.last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
+
+    def record(self, latency, tokens, ok, latency_tolerance, decrease_factor):
+        self.completed += 1
+        self.finished.append(time.time())
+        self.last_latency = latency
+        if not ok:
+            self.errors += 1
+            self.decrease(decrease_factor)
+            return
+        # 加上固定的token数近似prefill开销，避免短译文的单token耗时偏高
+        sample = latency / (tokens + 16)
+        self.samples.append(sample)
+        self.smoothed = sample if self.smoothed is None else self.smoothed * 0.8 + sample * 0.2
+        if len(self.samples) >= 5 and self.smoothed > self.baseline() * latency_tolerance:
+            # 延迟明显升高，说明请求已在服务端排队
+            self.decrease(decrease_factor)
+        else:
+            # 加性增加，每个并发窗口约增加1
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+# 按endpoint自适应调整并发数的控制器，backends为engine.create_backend创建的后端列表
+class ConcurrencyController:
+    def __init__(self, backends, initial_limit=1, min_limit=1, max_limit=16, latency_tolerance=2.0, decrease_factor=0.7, log=print):
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limiters = [EndpointLimiter(backend, initial_limit, min_limit, max_limit) for backend in backends]
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        self.log = log
+        self.cond = threading.Condition()
+
+    # 运行中添加endpoint，下标与RequestDispatcher.backends一致
+    def add_backend(self, backend):
+        with self.cond:
+            self.limiters.append(EndpointLimiter(backend, self.initial_limit, self.min_limit, self.max_limit))
+            self.cond.notify_all()
+
+    def set_enabled(self, index, enabled):
+        with self.cond:
+            self.limiters[index].enabled = enabled
+            self.cond.notify_all()
+
+    # 获取一个并发名额，优先使用preferred，否则使用空闲比例最高的endpoint
+    def acquire(self, preferred=0):
+        with self.cond:
+            while True:
+                preferred_limiter = self.limiters[preferred % len(self.limiters)]
+                if preferred_limiter.enabled and preferred_limiter.available() > 0:
+                    chosen = preferred % len(self.limiters)
+                else:
+                    enabled = [i for i in range(len(self.limiters)) if self.limiters[i].enabled]
+                    chosen = max(enabled, key=lambda i: self.limiters[i].available() / max(self.limiters[i].limit, 1))
+                    if self.limiters[chosen].available() <= 0:
+                        self.cond.wait()
+                        continue
+                self.limiters[chosen].inflight += 1
+                return chosen
+
+    def release(self, index, latency, tokens, ok):
+        with self.cond:
+            limiter = self.limiters[index]
+            limiter.inflight -= 1
+            old_limit = int(limiter.limit)
+            limiter.record(latency, tokens, ok, self.latency_tolerance, self.decrease_factor)
+            new_limit = int(limiter.limit)
+            self.cond.notify_all()
+        if new_limit != old_limit:
+            self.log(f"endpoint {limiter.endpoint} 并发上限 {old_limit} -> {new_limit}，"
+                     f"延迟 {latency:.2f}s，错误率 {limiter.errors / limiter.completed:.1%}，吞吐 {limiter.throughput():.2f} 请求/秒")
+
+    # 通过控制器发送请求，返回响应JSON，on_send在取得并发名额、实际发出请求前调用
+    def post(self, preferred, data, timeout=None, on_send=None):
+        index = self.acquire(preferred)
+        if on_send is not None:
+            on_send()
+        start = time.time()
+        ok = False
+        tokens = 0
+        try:
+            response_data = self.limiters[index].backend.complete(data, timeout)
+            tokens = response_data.get("usage", {}).get("completion_tokens", 0)
+            ok = True
+            return response_data
+        finally:
+            self.release(index, time.time() - start, tokens, ok)
+
+    def stats(self):
+        with self.cond:
+            return [{
+                "endpoint": limiter.endpoint,
+                "enabled": limiter.enabled,
+                "limit": int(limiter.limit),
+                "inflight": limiter.inflight,
+                "completed": limiter.completed,
+                "errors": limiter.errors,
+                "throughput": limiter.throughput()
+            } for limiter in self.limiters]
+
+# 未开启自适应并发时限制同时进行的请求总数，多行条目拆分出的段落请求也计入
+# get_limit()返回当前上限，可随运行中调整的线程数变化
+class RequestSlots:
+    def __init__(self, get_limit):
+        self.get_limit = get_limit
+        self.inflight = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            # 上限可能在其它线程中被调高，定期重新检查
+            while self.inflight >= max(1, self.get_limit()):
+                self.cond.wait(0.5)
+            self.inflight += 1
+
+    def release(self):
+        with self.cond:
+            self.inflight -= 1
+            self.cond.notify()
+
+    # 占用一个名额发送请求，返回post()的结果
+    def post(self, post):
+        self.acquire()
+        try:
+            return post()
+        finally:
+            self.release()
+
+# 格式化各endpoint最终并发上限
+def format_concurrency_stats(stats):
+    return "\n".join(
+        f"endpoint {item['endpoint']}{'' if item['enabled'] else '（已移除）'}: 并发上限 {item['limit']}，完成 {item['completed']}，错误 {item['errors']}，吞吐 {item['throughput']:.2f} 请求/秒"
+        for item in stats
+    )
@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 运行中任务的控制状态：暂停和目标线程数，由控制接口、主线程和工作线程共享
+class JobControl:
+    def __init__(self, max_workers):
+        self.target_workers = max(1, max_workers)
+        self.running = threading.Event()
+        self.running.set()
+        self.lock = threading.Lock()
+        self.workers = {}
+        self.started = time.time()
+
+    # 调整线程数，多出的线程完成手头的条目后退出，缺少的线程由run_workers启动
+    def set_workers(self, count):
+        if count < 1:
+            raise ValueError("线程数至少为1，需要停止时请使用暂停")
+        with self.lock:
+            self.target_workers = count
+
+    # 暂停后工作线程完成手头的条目后等待，已发出的请求不受影响
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    def is_paused(self):
+        return not self.running.is_set()
+
+    def should_retire(self, worker_id):
+        return worker_id >= self.target_workers
+
+    # 工作线程开始每个条目前调用：暂停时阻塞，线程需要退出时返回False
+    def checkpoint(self, worker_id):
+        while not self.running.wait(0.5):
+            if self.should_retire(worker_id):
+                return False
+        return not self.should_retire(worker_id)
+
+    def alive_workers(self):
+        with self.lock:
+            return sorted(worker_id for worker_id, thread in self.workers.items() if thread.is_alive())
+
+    # 按目标线程数维持工作线程，直到没有可分配的条目且所有线程都已退出
+    # has_work()判断是否还有可分配的条目，start_worker(worker_id)启动并返回一个工作线程
+    def run_workers(self, has_work, start_worker, interval=0.5):
+        while True:
+            if has_work():
+                with self.lock:
+                    for worker_id in range(self.target_workers):
+                        thread = self.workers.get(worker_id)
+                        if thread is None or not thread.is_alive():
+                            self.workers[worker_id] = start_worker(worker_id)
+            if not self.alive_workers() and not has_work():
+                return
+            time.sleep(interval)
+
+    def status(self):
+        return {
+            "paused": self.is_paused(),
+            "target_workers": self.target_workers,
+            "alive_workers": self.alive_workers(),
+            "uptime": round(time.time() - self.started, 1)
+        }
+
+# 本机控制接口，默认只监听127.0.0.1
+class ControlServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # get_status()返回任务状态，add_endpoint(endpoint)和remove_endpoint(endpoint)返回当前的endpoint列表，失败时抛出ValueError
+    def __init__(self, address, control, get_status, add_endpoint, remove_endpoint):
+        super().__init__(address, ControlHandler)
+        self.control = control
+        self.get_status = get_status
+        self.add_endpoint = add_endpoint
+        self.remove_endpoint = remove_endpoint
+        # endpoint的增减依次执行，避免同时创建本地模型进程池
+        self.endpoint_lock = threading.Lock()
+
+class ControlHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/status":
+            self.send_json(self.server.get_status())
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        server = self.server
+        control = server.control
+        try:
+            body = self.read_json()
+        except ValueError:
+            self.send_json({"error": "invalid json"}, 400)
+            return
+        try:
+            if self.path == "/pause":
+                control.pause()
+                self.send_json(control.status())
+            elif self.path == "/resume":
+                control.resume()
+                self.send_json(control.status())
+            elif self.path == "/workers":
+                control.set_workers(int(body["count"]))
+                self.send_json(control.status())
+            elif self.path == "/endpoints":
+                with server.endpoint_lock:
+                    if "add" in body:
+                        endpoints = server.add_endpoint(body["add"])
+                    elif "remove" in body:
+                        endpoints = server.remove_endpoint(body["remove"])
+                    else:
+                        raise ValueError("需要add或remove")
+                self.send_json({"endpoint": endpoints})
+            else:
+                self.send_json({"error": "not found"}, 404)
+        except (KeyError, TypeError, ValueError) as e:
+            self.send_json({"error": str(e)}, 400)
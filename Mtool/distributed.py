@@ -0,0 +1,243 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# 分段状态
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+
+# 基于租约的分段队列
+class SegmentQueue:
+    def __init__(self, lease_timeout=300, context_size=0):
+        self.lease_timeout = lease_timeout
+        self.context_size = context_size
+        self.segments = []
+        self.leases = {}
+        # 租用过分段的工作者线程，以及已收到全部完成通知的工作者线程
+        self.workers = set()
+        self.notified = set()
+        self.lock = threading.Lock()
+
+    # 添加一个任务文件的分段，done_starts为已完成分段的起始下标
+    def add_task(self, task_name, total_items, segment_size, done_starts=()):
+        done_starts = set(done_starts)
+        with self.lock:
+            for start in range(0, total_items, segment_size):
+                self.segments.append({
+                    "segment_id": len(self.segments),
+                    "task_name": task_name,
+                    "start": start,
+                    "end": min(start + segment_size, total_items) - 1,
+                    "state": DONE if start in done_starts else PENDING,
+                    "lease_id": None,
+                    "worker": None,
+                    "expires": 0,
+                    "tail": []
+                })
+
+    # 将过期租约重新放回队列，调用方需持有锁
+    def _requeue_expired(self):
+        now = time.time()
+        requeued = []
+        for lease_id, segment in list(self.leases.items()):
+            if segment["expires"] < now:
+                del self.leases[lease_id]
+                segment["state"] = PENDING
+                segment["lease_id"] = None
+                requeued.append(segment)
+        return requeued
+
+    # 租用下一个待处理分段，没有可用分段时返回None
+    def lease(self, worker):
+        with self.lock:
+            self.workers.add(worker)
+            self._requeue_expired()
+            for segment in self.segments:
+                if segment["state"] != PENDING:
+                    continue
+                segment["state"] = LEASED
+                segment["lease_id"] = uuid.uuid4().hex
+                segment["worker"] = worker
+                segment["expires"] = time.time() + self.lease_timeout
+                self.leases[segment["lease_id"]] = segment
+                return dict(segment, previous_translations=self._previous_tail(segment))
+            return None
+
+    # 获取同一文件中前一分段的末尾译文，作为历史上文
+    # 只有前一分段在本分段被租用时已经完成才有上文，因此分段开头几条是否带上文取决于各工作者的完成顺序，
+    # 同一文件重新翻译的结果不保证一致；需要稳定的上文时把segment_size调大，或只启动一个工作者线程
+    def _previous_tail(self, segment):
+        index = segment["segment_id"] - 1
+        if index < 0 or self.context_size <= 0:
+            return []
+        previous = self.segments[index]
+        if previous["task_name"] != segment["task_name"] or previous["state"] != DONE:
+            return []
+        return previous["tail"][-self.context_size:]
+
+    # 续租，租约已失效时返回False
+    def renew(self, lease_id):
+        with self.lock:
+            segment = self.leases.get(lease_id)
+            if segment is None:
+                return False
+            segment["expires"] = time.time() + self.lease_timeout
+            return True
+
+    # 完成分段，租约已失效（已被重新分配）时返回None
+    # 译文条数与分段条数（end为闭区间）不一致时分段立即重新排队，并抛出ValueError
+    def complete(self, lease_id, translations):
+        with self.lock:
+            segment = self.leases.pop(lease_id, None)
+            if segment is None:
+                return None
+            expected = segment["end"] - segment["start"] + 1
+            if not isinstance(translations, list) or len(translations) != expected:
+                segment["state"] = PENDING
+                segment["lease_id"] = None
+                count = len(translations) if isinstance(translations, list) else type(translations).__name__
+                raise ValueError(f"分段 {segment['task_name']} {segment['start']}-{segment['end']} 应有 {expected} 条译文，收到 {count}")
+            segment["state"] = DONE
+            segment["lease_id"] = None
+            if self.context_size > 0:
+                segment["tail"] = translations[-self.context_size:]
+            return segment
+
+    # 主动放弃租约，分段立即重新排队
+    def release(self, lease_id):
+        with self.lock:
+            segment = self.leases.pop(lease_id, None)
+            if segment is not None:
+                segment["state"] = PENDING
+                segment["lease_id"] = None
+
+    def done_starts(self, task_name):
+        with self.lock:
+            return [s["start"] for s in self.segments if s["task_name"] == task_name and s["state"] == DONE]
+
+    def is_finished(self, task_name=None):
+        with self.lock:
+            return all(s["state"] == DONE for s in self.segments if task_name is None or s["task_name"] == task_name)
+
+    # 记录已通知工作者全部分段完成，返回是否所有租用过分段的工作者都已收到通知
+    def notify_finished(self, worker=None):
+        with self.lock:
+            if worker is not None:
+                self.notified.add(worker)
+            return self.workers <= self.notified
+
+    def stats(self):
+        with self.lock:
+            self._requeue_expired()
+            result = {}
+            for segment in self.segments:
+                task = result.setdefault(segment["task_name"], {PENDING: 0, LEASED: 0, DONE: 0})
+                task[segment["state"]] += 1
+            workers = sorted({s["worker"] for s in self.leases.values()})
+            return {"tasks": result, "active_leases": len(self.leases), "workers": workers}
+
+# 协调者HTTP服务
+class CoordinatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # get_texts(task_name, start, end) 返回分段原文列表
+    # on_complete(segment, translations) 在分段完成后由协调者写回数据
+    def __init__(self, address, queue, get_texts, on_complete):
+        super().__init__(address, CoordinatorHandler)
+        self.queue = queue
+        self.get_texts = get_texts
+        self.on_complete = on_complete
+        self.complete_lock = threading.Lock()
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/status":
+            self.send_json(self.server.queue.stats())
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        server = self.server
+        queue = server.queue
+        try:
+            body = self.read_json()
+        except ValueError:
+            self.send_json({"error": "invalid json"}, 400)
+            return
+        if self.path == "/lease":
+            worker = body.get("worker", self.client_address[0])
+            segment = queue.lease(worker)
+            if segment is None:
+                finished = queue.is_finished()
+                self.send_json({"segment": None, "finished": finished})
+                if finished:
+                    queue.notify_finished(worker)
+                return
+            segment["texts"] = server.get_texts(segment["task_name"], segment["start"], segment["end"])
+            segment["lease_timeout"] = queue.lease_timeout
+            del segment["tail"]
+            self.send_json({"segment": segment, "finished": False})
+        elif self.path == "/renew":
+            self.send_json({"ok": queue.renew(body.get("lease_id"))})
+        elif self.path == "/complete":
+            translations = body.get("translations", [])
+            with server.complete_lock:
+                try:
+                    segment = queue.complete(body.get("lease_id"), translations)
+                except ValueError as e:
+                    self.send_json({"error": str(e)}, 400)
+                    return
+                if segment is not None:
+                    server.on_complete(segment, translations)
+            self.send_json({"ok": segment is not None})
+        elif self.path == "/release":
+            queue.release(body.get("lease_id"))
+            self.send_json({"ok": True})
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+# 工作者使用的协调者客户端
+class CoordinatorClient:
+    def __init__(self, url, timeout=30):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.worker = f"{socket.gethostname()}-{os.getpid()}"
+
+    def post(self, path, data):
+        response = requests.post(self.url + path, json=data, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def lease(self, thread_id):
+        return self.post("/lease", {"worker": f"{self.worker}-{thread_id}"})
+
+    def renew(self, lease_id):
+        return self.post("/renew", {"lease_id": lease_id})["ok"]
+
+    def complete(self, lease_id, translations):
+        return self.post("/complete", {"lease_id": lease_id, "translations": translations})["ok"]
+
+    def release(self, lease_id):
+        return self.post("/release", {"lease_id": lease_id})["ok"]
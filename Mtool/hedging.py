@@ -0,0 +1,187 @@
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from engine import BackendError, BackendTimeout
+
+# 带截止时间、指数退避重试和对冲请求的请求发送器
+class RequestDispatcher:
+    # backends为engine.create_backend创建的后端列表，controller为自适应并发控制器，为None时直接请求后端
+    # slots为未开启自适应并发时的RequestSlots，每个实际发出的请求（含对冲和落选后仍未返回的请求）各占一个名额
+    # 运行中可以增减后端：backends只追加不删除，active为仍在使用的后端下标，api_idx按active取模
+    def __init__(self, backends, controller=None, timeout=120, budget=600, max_retries=3,
+                 hedge=False, hedge_percentile=0.95, hedge_min_delay=1.0, hedge_workers=64, slots=None, log=print):
+        self.backends = list(backends)
+        self.active = list(range(len(self.backends)))
+        self.controller = controller
+        self.slots = slots
+        self.timeout = timeout
+        self.budget = budget
+        self.max_retries = max_retries
+        self.hedge_enabled = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.log = log
+        self.latencies = deque(maxlen=200)
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        # 对冲后落选但仍未返回的请求数，这些请求继续占用连接和并发名额直到完成或超时
+        self.abandoned = 0
+        self.executor = ThreadPoolExecutor(max_workers=hedge_workers) if hedge else None
+
+    # 只有一个后端时不对冲
+    @property
+    def hedge(self):
+        return self.hedge_enabled and len(self.active) > 1
+
+    # 把调用方的api_idx换算为后端下标
+    def resolve(self, api_idx):
+        with self.lock:
+            return self.active[api_idx % len(self.active)]
+
+    # 添加后端，返回其下标
+    def add_backend(self, backend):
+        with self.lock:
+            self.backends.append(backend)
+            index = len(self.backends) - 1
+            if self.controller is not None:
+                self.controller.add_backend(backend)
+            self.active.append(index)
+        return index
+
+    # 停止向后端发送新请求，已发出的请求继续完成，不能移除最后一个后端
+    def remove_backend(self, index):
+        with self.lock:
+            if index not in self.active or len(self.active) == 1:
+                return False
+            self.active.remove(index)
+            if self.controller is not None:
+                self.controller.set_enabled(index, False)
+        return True
+
+    # 仍在使用的后端名称，顺序与api_idx取模的顺序一致
+    def endpoints(self):
+        with self.lock:
+            return [self.backends[index].name for index in self.active]
+
+    # 单次请求，index为后端下标，timeout为本次请求的超时秒数，sent在取得并发名额、实际发出请求时设置
+    # 延迟从实际发出时开始计算，等待并发名额的时间不计入
+    def _attempt(self, index, data, timeout, sent=None):
+        start = [time.time()]
+        def on_send():
+            start[0] = time.time()
+            if sent is not None:
+                sent.set()
+        if self.controller is not None:
+            response_data = self.controller.post(index, data, timeout=timeout, on_send=on_send)
+        elif self.slots is not None:
+            self.slots.acquire()
+            try:
+                on_send()
+                response_data = self.backends[index].complete(data, timeout)
+            finally:
+                self.slots.release()
+        else:
+            on_send()
+            response_data = self.backends[index].complete(data, timeout)
+        with self.lock:
+            self.latencies.append(time.time() - start[0])
+        return response_data
+
+    # 在独立线程中发送主请求，不在对冲线程池中排队，返回其Future
+    def _start_primary(self, index, data, timeout, sent):
+        future = Future()
+        def run():
+            try:
+                future.set_result(self._attempt(index, data, timeout, sent))
+            except BaseException as e:
+                future.set_exception(e)
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    # 先返回的请求胜出后，仍未返回的请求无法中断，记录其数量直到完成
+    def _abandon(self, future):
+        with self.lock:
+            self.stats["hedge_abandoned"] += 1
+            self.abandoned += 1
+        def finished(_):
+            with self.lock:
+                self.abandoned -= 1
+        future.add_done_callback(finished)
+
+    # 对冲延迟：最近请求延迟的p95，样本不足时不对冲
+    def hedge_delay(self):
+        with self.lock:
+            if len(self.latencies) < 20:
+                return None
+            ordered = sorted(self.latencies)
+        return max(self.hedge_min_delay, ordered[int(len(ordered) * self.hedge_percentile) - 1])
+
+    # 主请求发出后超过p95仍未返回时向另一个endpoint发送相同请求，返回先完成的结果
+    def _hedged_attempt(self, index, data, timeout):
+        delay = self.hedge_delay()
+        if delay is None or delay >= timeout:
+            return self._attempt(index, data, timeout)
+        sent = threading.Event()
+        primary = self._start_primary(index, data, timeout, sent)
+        # 对冲延迟从主请求实际发出时开始计算，等待并发名额期间不对冲
+        while not sent.wait(0.1):
+            if primary.done():
+                break
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        with self.lock:
+            hedge_idx = self.active[(self.active.index(index) + 1) % len(self.active)] if index in self.active else self.active[0]
+            self.stats["hedged"] += 1
+        hedge = self.executor.submit(self._attempt, hedge_idx, data, timeout - delay)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        with self.lock:
+                            self.stats["hedge_won"] += 1
+                    for loser in pending:
+                        self._abandon(loser)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    # 发送请求并返回响应JSON，失败时在总预算内按指数退避重试
+    def post(self, api_idx, data):
+        deadline = time.time() + self.budget
+        attempt = 0
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                with self.lock:
+                    self.stats["budget_exhausted"] += 1
+                raise BackendTimeout(f"请求超出总预算 {self.budget} 秒")
+            timeout = min(self.timeout, remaining)
+            # 每次重试重新换算，期间被移除的后端不再使用
+            index = self.resolve(api_idx)
+            try:
+                if self.hedge:
+                    return self._hedged_attempt(index, data, timeout)
+                return self._attempt(index, data, timeout)
+            except BackendError as e:
+                attempt += 1
+                with self.lock:
+                    self.stats["timeouts" if isinstance(e, BackendTimeout) else "errors"] += 1
+                if attempt > self.max_retries:
+                    raise
+                backoff = min(2 ** (attempt - 1), 30, max(0, deadline - time.time()))
+                self.log(f"请求失败，{backoff:.0f} 秒后第 {attempt} 次重试: {e}")
+                with self.lock:
+                    self.stats["retries"] += 1
+                time.sleep(backoff)
+
+# 格式化请求统计
+def format_request_stats(stats):
+    return (f"请求统计: 超时 {stats['timeouts']} 次，错误 {stats['errors']} 次，重试 {stats['retries']} 次，"
+            f"对冲 {stats['hedged']} 次（对冲请求先返回 {stats['hedge_won']} 次，落选时仍未返回 {stats['hedge_abandoned']} 次），"
+            f"超出总预算 {stats['budget_exhausted']} 次")
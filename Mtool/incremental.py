@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+import pandas as pd
+
+# 计算文本内容哈希
+def content_hash(text):
+    return hashlib.sha1(str(text).encode('utf-8')).hexdigest()
+
+# 判断条目是否已有译文：译文非空且与原文不同，或原文本身不含日文
+def is_translated(source, translation):
+    if translation is None or translation in ("", "nan"):
+        return False
+    if translation != source:
+        return True
+    return not re.search(r'[\u3040-\u30ff\u3400-\u4DBF\u4E00-\u9FFF]', unicodedata.normalize('NFKC', source))
+
+# 读取任务文件中的（原文, 译文）对
+def get_pairs(task_name, data):
+    if task_name.endswith(".json"):
+        return list(data.items())
+    return list(zip(data['Original Text'].astype(str), data['Machine translation'].astype(str)))
+
+# 读取旧版本的译文文件
+def load_previous_pairs(filename):
+    if filename.endswith(".json"):
+        with open(filename, 'r', encoding='utf-8') as file:
+            return get_pairs(filename, json.load(file))
+    elif filename.endswith(".csv"):
+        return get_pairs(filename, pd.read_csv(filename, encoding='utf-8'))
+    return []
+
+# 比较新导出文件与旧译文，返回沿用的译文、需要翻译的下标和差异统计
+def diff_translations(new_pairs, old_pairs):
+    old_index = {}
+    for source, translation in old_pairs:
+        if is_translated(source, translation):
+            old_index[content_hash(source)] = translation
+    new_hashes = set()
+    carried = {}
+    pending = []
+    already = 0
+    for index, (source, translation) in enumerate(new_pairs):
+        source_hash = content_hash(source)
+        new_hashes.add(source_hash)
+        if is_translated(source, translation):
+            # 中断后重新运行时，本次已经翻译过的条目不再重复翻译
+            already += 1
+        elif source_hash in old_index:
+            carried[index] = old_index[source_hash]
+        else:
+            pending.append(index)
+    old_hashes = {content_hash(source) for source, _ in old_pairs}
+    report = {
+        "total": len(new_pairs),
+        "carried": len(carried),
+        "already_translated": already,
+        "pending": len(pending),
+        "removed": len(old_hashes - new_hashes)
+    }
+    return carried, pending, report
+
+# 增量翻译：沿用旧版本中内容未变的译文，返回需要翻译的下标列表和差异统计
+def apply_incremental(task_name, data, previous_dir):
+    previous_file = os.path.join(previous_dir, os.path.basename(task_name))
+    if os.path.exists(previous_file):
+        old_pairs = load_previous_pairs(previous_file)
+    else:
+        old_pairs = []
+    carried, pending, report = diff_translations(get_pairs(task_name, data), old_pairs)
+    report["previous_file"] = previous_file if old_pairs else None
+    if task_name.endswith(".json"):
+        keys = list(data.keys())
+        for index, translation in carried.items():
+            data[keys[index]] = translation
+    else:
+        for index, translation in carried.items():
+            data.loc[index, 'Machine translation'] = translation
+    return pending, report
+
+# 格式化差异统计
+def format_report(task_name, report):
+    return (f"增量翻译 {task_name}: 共 {report['total']} 条，沿用旧译文 {report['carried']} 条，"
+            f"已有译文或无需翻译 {report['already_translated']} 条，新增或变更 {report['pending']} 条，"
+            f"旧版本中已删除 {report['removed']} 条（旧译文: {report['previous_file'] or '无'}）")
@@ -1,5 +1,5 @@
+import argparse
 import json
-import requests
 import re
 import os
 import pandas as pd
@@ -9,6 +9,35 @@ import csv
 import sys
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import (
+    RPGMAKER_CODES, BackendError, CaptureLog, CapturingBackend, GenerationBudget, LocalBackend,
+    clean_output, create_backend, format_budget_stats, get_translation_model, make_request_json,
+)
+from engine.tmpack import TranslationMemory
+from template import TemplateCache, format_template_stats
+from validation import ValidationStage, format_validation_stats
+from concurrency import ConcurrencyController, RequestSlots, format_concurrency_stats
+from hedging import RequestDispatcher, format_request_stats
+from incremental import apply_incremental, format_report
+from planning import JobPlanner, load_profiles, profile_paths
+from scheduling import format_length_histogram, schedule_indices
+from workqueue import PrefixProgress, format_file_done
+
+# 模板译文缓存，跨文件共享
+template_cache = TemplateCache()
+# 自适应并发控制器，未开启时为None
+concurrency_controller = None
+# 带截止时间、重试和对冲的请求发送器
+request_dispatcher = None
+# 未开启自适应并发时限制同时进行的请求总数
+request_slots = None
+# 只读翻译记忆包，未配置时为None
+translation_memory = None
+# 按原文长度设置max_tokens的生成预算，关闭时为None
+generation_budget = None
+# 返工线程写回译文与主线程写入、保存文件互斥
+save_lock = threading.Lock()
 
 # 读取全局配置信息
 def load_config():
@@ -25,7 +54,18 @@ def load_config():
             "save_frequency": 100,
             "shutdown": 0,
             "max_workers": 1,
-            "context_size": 0
+            "context_size": 0,
+            "use_template": False,
+            "use_validation": False,
+            "adaptive_concurrency": False,
+            "request_timeout": 120,
+            "request_budget": 600,
+            "hedge_requests": False,
+            "local_processes": 1,
+            "local_devices": ["0"],
+            "capture_file": "",
+            "memory_pack": "",
+            "schedule_policy": "file"
         }
         with open("config.json", 'w') as file:
             json.dump(config_data, file, indent=4)
@@ -66,34 +106,6 @@ def get_dict_string_list(kv_pairs):
             dict_list.append(f"{src}->{dst}")
     return dict_list
 
-# 模型版本管理
-def get_translation_model(model_name, model_version):
-    if model_name.lower() == "sakura":
-        if model_version == "0.8":
-            return "SakuraV0_8"
-        elif model_version == "0.9":
-            return "SakuraV0_9"
-        elif model_version == "0.10":
-            return "SakuraV0_10"
-        elif model_version == "1.0":
-            return "SakuraV1_0"
-        else:
-            return "SakuraV1_0"
-    elif model_name.lower() == "sakura32b":
-        if model_version == "0.10":
-            return "Sakura32bV0_10"
-        else:
-            return "Sakura32bV0_10"
-    elif model_name.lower() == "galtransl":
-        if model_version == "2.6":
-            return "GalTranslV2_6"
-        elif model_version == "3.0":
-            return "GalTranslV3"
-        else:
-            return "GalTranslV2_6"
-    else:
-        return "SakuraV1_0"
-
 # 检查文本是否包含日文字符
 def contains_japanese(text):
     text = unicodedata.normalize('NFKC', text)
@@ -127,136 +139,178 @@ def unescape_translation(original, translation):
     return translation
 
 # 翻译文本，按段落翻译
-def translate_text_by_paragraph(text, index, api_idx=0, config=None, previous_translations=None):
+# 多行文本的各段落作为一组并发请求，按位置拼回原文中的换行符
+# slot_key标识上下文链（如main_dev.py的下标范围），llamacpp后端按它固定slot，各段落使用各自的key以免挤在同一个slot中排队
+def translate_text_by_paragraph(text, index, api_idx=0, config=None, previous_translations=None, sampling=None, slot_key=None):
     # 如果是文件路径或者文件，直接跳过
     if is_file_path(text):
         return text
+    # 翻译记忆包中有整条原文时直接使用
+    if translation_memory is not None:
+        remembered = translation_memory.get(text)
+        if remembered is not None:
+            return remembered
     
     contains_jp, updated_text = contains_japanese(text)
-    if contains_jp:
-        segments = split_text_with_newlines(updated_text)
-        translated_segments = []
-        for segment in segments:
-            if segment in ['\r\n', '\r', '\n']:
-                translated_segments.append(segment)
-            else:
-                if segment:
-                    translated_segments.append(translate_text(segment, index, api_idx=api_idx, config=config, previous_translations=previous_translations))
-                else:
-                    translated_segments.append(segment)
-        translated_text = ''.join(translated_segments)
-        return translated_text
-    else:
+    if not contains_jp:
         return text
+    segments = split_text_with_newlines(updated_text)
+    positions = [i for i, segment in enumerate(segments) if segment and segment not in ['\r\n', '\r', '\n']]
+    translate = lambda segment, key: translate_segment(segment, index, api_idx, config, previous_translations, sampling, key)
+    if len(positions) > 1:
+        keys = [None if slot_key is None else f"{slot_key}/{n}" for n in range(len(positions))]
+        with ThreadPoolExecutor(max_workers=min(len(positions), config.get('segment_concurrency', 8))) as executor:
+            results = list(executor.map(translate, [segments[i] for i in positions], keys))
+    else:
+        results = [translate(segments[i], slot_key) for i in positions]
+    for position, result in zip(positions, results):
+        segments[position] = result
+    return ''.join(segments)
+
+# 计划模式使用：返回条目中需要请求模型的段落，文件路径或不含日文的条目返回None，与translate_text_by_paragraph的过滤规则一致
+def plan_segments(text):
+    if is_file_path(text):
+        return None
+    contains_jp, updated_text = contains_japanese(text)
+    if not contains_jp:
+        return None
+    return [segment for segment in split_text_with_newlines(updated_text) if segment and segment not in ['\r\n', '\r', '\n']]
+
+# 翻译单个段落，请求失败（返回空译文）或控制符不一致时只重试该段落，并换用下一个endpoint
+def translate_segment(segment, index, api_idx, config, previous_translations, sampling, slot_key=None):
+    if translation_memory is not None:
+        remembered = translation_memory.get(segment)
+        if remembered is not None:
+            return remembered
+    translated = ""
+    fallback = ""
+    for attempt in range(config.get('segment_retries', 1) + 1):
+        idx = (api_idx + attempt) % len(config['endpoint'])
+        if config.get('use_template', False):
+            # 模板复用：数字、控制符和术语名称不同的文本只翻译一次
+            translated = template_cache.translate(
+                segment,
+                lambda text: translate_text(text, index, api_idx=idx, config=config, previous_translations=previous_translations, sampling=sampling, slot_key=slot_key),
+                config['dict'] if config['use_dict'] else None
+            )
+        else:
+            translated = translate_text(segment, index, api_idx=idx, config=config, previous_translations=previous_translations, sampling=sampling, slot_key=slot_key)
+        if translated and RPGMAKER_CODES.verify(segment, translated):
+            return translated
+        # 控制符丢失或重复时同样换用下一个endpoint重试，全部未通过时使用最后一次非空的译文
+        fallback = translated or fallback
+    if fallback:
+        print(f"警告：行号 {index} 的译文控制符与原文不一致：'{fallback}'")
+    return fallback
 
 # 调用API进行翻译
-def translate_text(text, index, api_idx=0, attempt=1, config=None, previous_translations=None):
+# sampling用于返工时覆盖默认采样参数
+def translate_text(text, index, api_idx=0, attempt=1, config=None, previous_translations=None, sampling=None, slot_key=None):
     try:
-        endpoint = config['endpoint'][api_idx]
         model_type = get_translation_model(config['model_type'], config['model_version'])
         context_size = config.get('context_size', 0)
         context = previous_translations[-context_size:] if previous_translations else []
-        data = make_request_json(text, model_type, config['use_dict'], config['dict_mode'], config['dict'], context)
-        response = requests.post(endpoint, json=data)
-        response.raise_for_status()
-
-        response_data = response.json()
-        completion_tokens = response_data.get("usage", {}).get("completion_tokens", 0)
-        max_tokens = data["max_tokens"]
+        # 控制符替换为占位符后再请求，避免模型改写或丢失，收到译文后换回
+        request_text, code_mapping = RPGMAKER_CODES.protect(text)
+        data = make_request_json(request_text, model_type, config['use_dict'], config['dict_mode'], config['dict'], context, config.get('max_tokens', 384))
+        if generation_budget is not None:
+            generation_budget.apply(data, request_text)
+        if sampling:
+            data.update(sampling)
+        if slot_key is not None:
+            data["slot_key"] = slot_key
+        response_data = send_request(config, api_idx, data)
 
-        # 检查是否发生退化，重试时调整 frequency_penalty
-        if completion_tokens == max_tokens:
+        # 检查是否发生退化（生成数达到max_tokens），重试时调整 frequency_penalty，并且只在重试时放宽生成预算
+        if record_budget(request_text, data, response_data):
             print("模型可能发生退化，调整 frequency_penalty 并重试...")
             data["frequency_penalty"] = 0.8
-            response = requests.post(endpoint, json=data)
-            response.raise_for_status()
-            response_data = response.json()
+            if generation_budget is not None:
+                generation_budget.apply(data, request_text, attempt=1)
+            response_data = send_request(config, api_idx, data)
+            record_budget(request_text, data, response_data, 1)
 
-    except requests.RequestException as e:
+    except BackendError as e:
         print(f'请求翻译API错误: {e}')
         return ""
     
     translated_text = response_data.get("choices")[0].get("message", {}).get("content", "")
-    translated_text = translated_text.replace("将下面的日文文本翻译成中文：", "").replace("<|im_end|>", "")
+    translated_text = clean_output(translated_text)
+    translated_text = RPGMAKER_CODES.restore(translated_text, code_mapping)
     translated_text = fix_translation_end(text, translated_text)
     translated_text = unescape_translation(text, translated_text)
     print(f"原文: {text}\n翻译: {translated_text}\n")  # 调试信息，输出翻译前后的文本
     return translated_text
 
-# 处理翻译请求的JSON构造
-def make_request_json(text, model_type, use_dict, dict_mode, dict_data, context):    
-    messages = []
-    
-    if model_type == "SakuraV0_8":
-        messages.append({"role": "system", "content": "你是一个简单的日文翻译模型，将日文翻译成简体中文。"})
-        messages.append({"role": "user", "content": f"将下面的日文文本翻译成中文：{text}"})
-    else:
-        if model_type == "SakuraV0_9":
-            messages.append({"role": "system", "content": "你是一个轻小说翻译模型，可以流畅地将日文翻译成简体中文，并正确使用人称代词。"})
-        elif model_type == "SakuraV0_10":
-            messages.append({"role": "system", "content": "你是一个轻小说翻译模型，可以流畅通顺地以日本轻小说的风格将日文翻译成简体中文，并联系上下文正确使用人称代词，不擅自添加原文中没有的代词。"})
-        elif model_type == "SakuraV1_0":
-            messages.append({"role": "system", "content": "你是一个轻小说翻译模型，可以流畅通顺地以日本轻小说的风格将日文翻译成简体中文，并联系上下文正确使用人称代词，不擅自添加原文中没有的代词。"})
-        elif model_type == "GalTranslV2_6":
-            messages.append({"role": "system", "content": "你是一个视觉小说翻译模型，可以通顺地使用给定的术语表以指定的风格将日文翻译成简体中文，并联系上下文正确使用人称代词。"})
-        elif model_type == "GalTranslV3":
-            messages.append({"role": "system", "content": "你是一个视觉小说翻译模型，可以通顺地使用给定的术语表以指定的风格将日文翻译成简体中文，并联系上下文正确使用人称代词。"})
-        else:
-            messages.append({"role": "system", "content": "你是一个轻小说翻译模型，可以流畅通顺地将日文翻译成简体中文。"})
-        
-        if context:
-            history_text = "历史翻译：" + "\n".join(context)
-        else:
-            history_text = ""
-        
-        if model_type == "GalTranslV3":
-            if use_dict:
-                dict_str = '\n'.join([f"{k}->{v[0]}" for k, v in dict_data.items()])
-                user_content = f"{history_text}\n参考以下术语表\n{dict_str}\n根据以上术语表的对应关系和备注，结合历史剧情和上下文，将下面的文本从日文翻译成简体中文：\n{text}"
-            else:
-                user_content = f"{history_text}\n结合历史剧情和上下文，将下面的文本从日文翻译成简体中文：\n{text}"
-            messages.append({"role": "user", "content": user_content})
-        else:
-            if context:
-                for c in context:
-                    messages.append({"role": "assistant", "content": c})
-            
-            if use_dict:
-                dict_str = '\n'.join([f"{k}->{v[0]}" for k, v in dict_data.items()])
-                messages.append({"role": "user", "content": f"根据上文和以下术语表：\n{dict_str}\n将下面的日文文本翻译成中文：{text}"})
-            else:
-                messages.append({"role": "user", "content": f"根据上文，将下面的日文文本翻译成中文：{text}"})
-    
-    temperature = 0.6 if model_type == "GalTranslV3" else 0.2
-    
-    data = {
-        "model": "sukinishiro",
-        "messages": messages,
-        "temperature": temperature,
-        "top_p": 0.3,
-        "max_tokens": 384,
-        "frequency_penalty": 0.2,
-        "do_sample": True,
-        "num_beams": 1,
-        "repetition_penalty": 1.0
-    }
-    return data
-
-# 保存翻译进度
-def save_progress(data, filename, index, task_list):
-    if filename.endswith(".json"):
-        with open(filename, 'w', encoding='utf-8') as file:
-            json.dump(data, file, ensure_ascii=False, indent=4)
-    elif filename.endswith(".csv"):
-        data.to_csv(filename, index=False, quoting=csv.QUOTE_ALL)
+# 记录响应的生成token数供生成预算学习，返回是否达到了max_tokens
+def record_budget(request_text, data, response_data, attempt=0):
+    completion_tokens = response_data.get("usage", {}).get("completion_tokens", 0)
+    if generation_budget is not None:
+        return generation_budget.record(request_text, completion_tokens, data["max_tokens"], attempt)
+    return completion_tokens >= data["max_tokens"]
+
+# 发送翻译请求并返回响应JSON，超时、重试和对冲由request_dispatcher处理，同时进行的请求数由request_slots或并发控制器限制
+def send_request(config, api_idx, data):
+    return request_dispatcher.post(api_idx, data)
+
+# 保存翻译进度，checkpoint为该文件按提交顺序已连续完成的条目数，记录在config的task_progress中，为None时只保存译文
+def save_progress(data, filename, checkpoint=None):
+    with save_lock:
+        if filename.endswith(".json"):
+            with open(filename, 'w', encoding='utf-8') as file:
+                json.dump(data, file, ensure_ascii=False, indent=4)
+        elif filename.endswith(".csv"):
+            data.to_csv(filename, index=False, quoting=csv.QUOTE_ALL)
+    if checkpoint is None:
+        return
     config = load_config()
-    config['last_processed'] = index
-    config['task_list'] = task_list
+    config.setdefault('task_progress', {})[filename] = checkpoint
     with open('config.json', 'w', encoding='utf-8') as file:
         json.dump(config, file, indent=4)
 
+# 解析命令行参数
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mtool翻译脚本")
+    parser.add_argument("--incremental", metavar="DIR", help="增量翻译：沿用DIR中同名旧译文文件里内容未变的条目，只翻译新增或变更的条目")
+    parser.add_argument("--plan", action="store_true", help="计划模式：不请求模型，估算task_list的请求数、token数和耗时")
+    parser.add_argument("--profile", action="append", default=[], metavar="FILE", help="计划模式使用的录制日志，可指定多次，默认使用config中的capture_file")
+    return parser.parse_args()
+
+# 计划模式：按与翻译时相同的过滤规则统计每个文件需要请求的段落，不创建后端也不修改任何文件
+def run_plan(config, args):
+    api_num = len(config['endpoint'])
+    max_workers = config['max_workers']
+    if config.get('adaptive_concurrency', False):
+        max_workers = config.get('max_concurrency', 16) * api_num
+    # 条目按下标轮流分配给各endpoint，线程数平均分给各endpoint
+    threads = [max(1, max_workers // api_num)] * api_num
+    planner = JobPlanner(config, load_profiles(profile_paths(config, args.profile)), threads, plan_segments, translation_memory)
+    for task_name in config['task_list']:
+        if not os.path.exists(task_name):
+            print(f"文件{task_name}不存在，跳过。")
+            continue
+        if task_name.endswith(".json"):
+            with open(task_name, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            texts = list(data.keys())
+        elif task_name.endswith(".csv"):
+            data = pd.read_csv(task_name, encoding='utf-8')
+            data['Original Text'] = data['Original Text'].astype(str)
+            data['Machine translation'] = data['Machine translation'].astype(str)
+            texts = list(data['Original Text'])
+        else:
+            print(f"不支持的文件类型: {task_name}")
+            continue
+        if args.incremental:
+            indices, report = apply_incremental(task_name, data, args.incremental)
+            print(format_report(task_name, report))
+            texts = [texts[i] for i in indices]
+        planner.add_file(task_name, texts)
+    print(planner.report())
+
 # 主流程
 def main():
+    args = parse_args()
     config = load_config()
     if not config['endpoint']:
         print("请配置API endpoint后再运行程序。")
@@ -265,17 +319,77 @@ def main():
     # 初始化字典
     dict_data, full_dict_str = initialize_dict(json.dumps(config.get('dict', {})))
     config['dict'] = dict_data
+
+    # 只读翻译记忆包，以mmap方式打开，多个进程共享页缓存，命中的原文不再请求模型
+    global translation_memory
+    if config.get('memory_pack'):
+        translation_memory = TranslationMemory(config['memory_pack'])
+
+    if args.plan:
+        run_plan(config, args)
+        return
+
+    # endpoint为HTTP地址或"local:<模型路径>"，后者直接使用本机的LLM进程池
+    backends = [create_backend(endpoint, config) for endpoint in config['endpoint']]
+    # 录制每次模型请求和响应，可用engine.replay离线回放
+    capture_log = None
+    if config.get('capture_file'):
+        capture_log = CaptureLog(config['capture_file'])
+        backends = [CapturingBackend(backend, capture_log) for backend in backends]
+
+    # 按endpoint自适应调整并发，线程数按所有endpoint的并发上限之和分配
+    global concurrency_controller
+    max_workers = config['max_workers']
+    if config.get('adaptive_concurrency', False):
+        api_num = len(config['endpoint'])
+        max_concurrency = config.get('max_concurrency', 16)
+        concurrency_controller = ConcurrencyController(backends, max(1, max_workers // api_num), 1, max_concurrency)
+        max_workers = max_concurrency * api_num
+
+    # 多行条目的段落并发请求、对冲请求和对冲落选后仍未返回的请求都计入，同时进行的请求总数不超过线程数
+    global request_slots
+    if concurrency_controller is None:
+        request_slots = RequestSlots(lambda: max_workers)
+
+    global request_dispatcher
+    request_dispatcher = RequestDispatcher(
+        backends, concurrency_controller,
+        config.get('request_timeout', 120), config.get('request_budget', 600), config.get('max_retries', 3),
+        config.get('hedge_requests', False), slots=request_slots
+    )
+
+    # 按原文的token数和行数设置max_tokens，比例从本次运行已完成的译文学习
+    global generation_budget
+    if config.get('generation_budget', True):
+        generation_budget = GenerationBudget(config.get('max_tokens', 384))
+
+    # 译文校验阶段，未通过的条目换采样参数或换endpoint返工
+    validation_stage = None
+    if config.get('use_validation', False):
+        validation_stage = ValidationStage(
+            lambda source, index, api_idx, sampling: translate_text_by_paragraph(source, index, api_idx, dict(config, use_template=False), None, sampling),
+            len(config['endpoint']), config.get('validation_workers', 2), config.get('rework_workers', 1)
+        )
     
     task_list = config['task_list']
     if not task_list:
         print("未找到待翻译文件，请更新config.json。")
         return
 
+    # 所有文件一次加载，条目按文件顺序提交到同一个线程池：大文件末尾的慢条目还在执行时，空闲线程直接翻译后面的文件
+    # 各文件的检查点为按提交顺序已连续完成的条目数，乱序完成时也能从检查点继续
+    task_progress = config.get('task_progress', {})
+    policy = config.get('schedule_policy', 'file')
+    api_num = len(config['endpoint'])
+    # 旧版本只记录了一个last_processed，用于第一个文件
+    legacy_start = config.get('last_processed', 0) if not task_progress else 0
+    tasks = []
     for task_name in task_list:
         if not os.path.exists(task_name):
             print(f"文件{task_name}不存在，跳过。")
             continue
 
+        json_keys = None
         if task_name.endswith(".json"):
             with open(task_name, 'r', encoding='utf-8') as file:
                 data = json.load(file)
@@ -289,31 +403,97 @@ def main():
             continue
 
         total_keys = len(data)
-        start_index = config['last_processed']
-        api_num = len(config['endpoint'])
-        previous_translations = []
-        with ThreadPoolExecutor(max_workers=config['max_workers']) as executor:
-            future_to_index = {}
-            for i in range(start_index, total_keys):
-                key = json_keys[i] if task_name.endswith(".json") else data.loc[i, 'Original Text']
+        if args.incremental:
+            # 增量模式下已翻译的条目由差异比较得出，不使用检查点
+            indices, report = apply_incremental(task_name, data, args.incremental)
+            print(format_report(task_name, report))
+            save_progress(data, task_name)
+            done = 0
+        else:
+            indices = range(total_keys)
+            done = task_progress.get(task_name, legacy_start)
+        legacy_start = 0
+        # 按调度策略调整提交顺序，译文仍按原下标写回
+        get_text = lambda i, task_name=task_name, data=data, json_keys=json_keys: json_keys[i] if task_name.endswith(".json") else data.loc[i, 'Original Text']
+        if policy != 'file':
+            print(format_length_histogram(indices, get_text))
+            indices = schedule_indices(indices, get_text, policy)
+        progress = PrefixProgress(task_name, indices, done)
+        if progress.is_finished():
+            print(f"任务 {task_name} 已在之前完成，跳过。")
+            continue
+
+        # 写回译文，主线程和返工线程共用；空译文（请求失败）不写入，保留原文
+        def write_translation(index, translated_text, task_name=task_name, data=data, json_keys=json_keys):
+            if not translated_text or not translated_text.strip():
+                return
+            with save_lock:
+                if task_name.endswith(".json"):
+                    data[json_keys[index]] = translated_text
+                else:
+                    data.loc[index, 'Machine translation'] = translated_text
+
+        if validation_stage is not None:
+            validation_stage.register_task(task_name, write_translation)
+        tasks.append({
+            "task_name": task_name, "data": data, "get_text": get_text, "write": write_translation, "progress": progress,
+            "previous_translations": [], "unsaved": 0,
+            # 增量模式的条目顺序只对本次运行有效，不保存检查点
+            "checkpoint": not args.incremental
+        })
+        print(f"已加载任务: {task_name} (总条目: {total_keys}，剩余: {len(progress.pending())})")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_item = {}
+        for task in tasks:
+            for i in task["progress"].pending():
                 api_index = i % api_num
-                future = executor.submit(translate_text_by_paragraph, key, i, api_index, config, previous_translations)
-                future_to_index[future] = i
-            for future in tqdm(as_completed(future_to_index), total=len(future_to_index), desc="任务进度"):
-                index = future_to_index[future]
-                try:
-                    translated_text = future.result()
-                    previous_translations.append(translated_text)
-                    if len(previous_translations) > config.get('context_size', 0):
-                        previous_translations.pop(0)
-                    if task_name.endswith(".json"):
-                        data[json_keys[index]] = translated_text
-                    if task_name.endswith(".csv"):
-                        data.loc[index, 'Machine translation'] = translated_text
-                    if (index + 1) % config['save_frequency'] == 0 or index + 1 == total_keys:
-                        save_progress(data, task_name, index + 1, task_list)
-                except Exception as exc:
-                    print(f'{index + 1}行翻译发生异常: {exc}')
+                future = executor.submit(translate_text_by_paragraph, task["get_text"](i), i, api_index, config, task["previous_translations"])
+                future_to_item[future] = (task, i)
+        for future in tqdm(as_completed(future_to_item), total=len(future_to_item), desc="任务进度"):
+            task, index = future_to_item[future]
+            task_name, previous_translations = task["task_name"], task["previous_translations"]
+            try:
+                translated_text = future.result()
+                previous_translations.append(translated_text)
+                if len(previous_translations) > config.get('context_size', 0):
+                    previous_translations.pop(0)
+                task["write"](index, translated_text)
+                if validation_stage is not None:
+                    validation_stage.submit(task_name, index, task["get_text"](index), translated_text)
+            except Exception as exc:
+                print(f'{task_name} {index + 1}行翻译发生异常: {exc}')
+            # 翻译失败的条目保留原文，同样计入检查点
+            finished = task["progress"].complete(index)
+            task["unsaved"] += 1
+            if finished or task["unsaved"] >= config['save_frequency']:
+                save_progress(task["data"], task_name, task["progress"].done if task["checkpoint"] else None)
+                task["unsaved"] = 0
+            if finished:
+                print(format_file_done(task_name, len(task["progress"].order), task["progress"].started))
+
+    if validation_stage is not None:
+        # 等待返工完成后再保存一次
+        validation_stage.join()
+        for task in tasks:
+            save_progress(task["data"], task["task_name"])
+        print(format_validation_stats(validation_stage.stats))
+    print(f"全部任务翻译完成，共 {len(tasks)} 个文件")
+    if config.get('use_template', False):
+        print(format_template_stats(template_cache.stats()))
+    if concurrency_controller is not None:
+        print(format_concurrency_stats(concurrency_controller.stats()))
+    print(format_request_stats(request_dispatcher.stats))
+    if generation_budget is not None:
+        print(format_budget_stats(generation_budget.stats()))
+    if translation_memory is not None:
+        memory_stats = translation_memory.stats()
+        print(f"翻译记忆: 共 {memory_stats['entries']} 条，查询 {memory_stats['lookups']} 次，命中 {memory_stats['hits']} 次")
+    if validation_stage is not None:
+        validation_stage.close()
+    LocalBackend.close_all()
+    if capture_log is not None:
+        capture_log.close()
 
 if __name__ == "__main__":
     main()
@@ -1,3 +1,4 @@
+import argparse
 import json
 import requests
 import re
@@ -10,12 +11,40 @@ import sys
 import shutil
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine import (
+    RPGMAKER_CODES, BackendError, CaptureLog, CapturingBackend, GenerationBudget, LocalBackend,
+    clean_output, create_backend, format_budget_stats, get_translation_model, make_request_json,
+)
+from engine.tmpack import TranslationMemory
+from template import TemplateCache, format_template_stats
+from validation import ValidationStage, format_validation_stats
+from concurrency import ConcurrencyController, RequestSlots, format_concurrency_stats
+from control import ControlServer, JobControl
+from hedging import RequestDispatcher, format_request_stats
 import time
+from distributed import SegmentQueue, CoordinatorServer, CoordinatorClient
+from incremental import apply_incremental, format_report
+from planning import JobPlanner, load_profiles, profile_paths
+from scheduling import format_length_histogram, interleave, schedule_indices
+from workqueue import TaskQueue, format_file_done
 
 # 全局变量，用于控制进度条显示
 progress_bars = {}
 progress_lock = threading.Lock()
 debug_output = []  # 用于存储调试输出
+validation_stage = None  # 译文校验阶段，未开启时为None
+concurrency_controller = None  # 自适应并发控制器，未开启时为None
+request_dispatcher = None  # 带截止时间、重试和对冲的请求发送器
+request_slots = None  # 未开启自适应并发时限制同时进行的请求总数
+translation_memory = None  # 只读翻译记忆包，未配置时为None
+generation_budget = None  # 按原文长度设置max_tokens的生成预算，关闭时为None
+job_control = None  # 暂停和线程数，可通过控制接口在运行中修改
+task_queue = None  # 跨文件的全局范围队列，也供控制接口查询各文件进度
+save_lock = threading.Lock()  # 多个线程不能同时写同一个翻译文件
+
+# 模板译文缓存，跨文件共享
+template_cache = TemplateCache()
 
 # 读取全局配置信息
 def load_config():
@@ -32,7 +61,19 @@ def load_config():
             "save_frequency": 100,
             "shutdown": 0,
             "max_workers": 1,
-            "context_size": 0
+            "context_size": 0,
+            "use_template": False,
+            "use_validation": False,
+            "adaptive_concurrency": False,
+            "request_timeout": 120,
+            "request_budget": 600,
+            "hedge_requests": False,
+            "local_processes": 1,
+            "local_devices": ["0"],
+            "capture_file": "",
+            "memory_pack": "",
+            "schedule_policy": "file",
+            "control_port": 0
         }
         with open("config.json", 'w') as file:
             json.dump(config_data, file, indent=4)
@@ -73,34 +114,6 @@ def get_dict_string_list(kv_pairs):
             dict_list.append(f"{src}->{dst}")
     return dict_list
 
-# 模型版本管理
-def get_translation_model(model_name, model_version):
-    if model_name.lower() == "sakura":
-        if model_version == "0.8":
-            return "SakuraV0_8"
-        elif model_version == "0.9":
-            return "SakuraV0_9"
-        elif model_version == "0.10":
-            return "SakuraV0_10"
-        elif model_version == "1.0":
-            return "SakuraV1_0"
-        else:
-            return "SakuraV1_0"
-    elif model_name.lower() == "sakura32b":
-        if model_version == "0.10":
-            return "Sakura32bV0_10"
-        else:
-            return "Sakura32bV0_10"
-    elif model_name.lower() == "galtransl":
-        if model_version == "2.6":
-            return "GalTranslV2_6"
-        elif model_version == "3.0":
-            return "GalTranslV3"
-        else:
-            return "GalTranslV2_6"
-    else:
-        return "SakuraV1_0"
-
 # 检查文本是否包含日文字符
 def contains_japanese(text):
     text = unicodedata.normalize('NFKC', text)
@@ -170,57 +183,104 @@ def refresh_all_progress_bars():
             bar.refresh()
 
 # 翻译文本，按段落翻译
-def translate_text_by_paragraph(text, index, api_idx=0, config=None, previous_translations=None):
+# 多行文本的各段落作为一组并发请求，按位置拼回原文中的换行符
+# slot_key标识上下文链（如main_dev.py的下标范围），llamacpp后端按它固定slot，各段落使用各自的key以免挤在同一个slot中排队
+def translate_text_by_paragraph(text, index, api_idx=0, config=None, previous_translations=None, sampling=None, slot_key=None):
     # 如果是文件路径或者文件，直接跳过
     if is_file_path(text):
         return text
+    # 翻译记忆包中有整条原文时直接使用
+    if translation_memory is not None:
+        remembered = translation_memory.get(text)
+        if remembered is not None:
+            return remembered
     
     contains_jp, updated_text = contains_japanese(text)
-    if contains_jp:
-        segments = split_text_with_newlines(updated_text)
-        translated_segments = []
-        for segment in segments:
-            if segment in ['\r\n', '\r', '\n']:
-                translated_segments.append(segment)
-            else:
-                if segment:
-                    translated_segments.append(translate_text(segment, index, api_idx=api_idx, config=config, previous_translations=previous_translations))
-                else:
-                    translated_segments.append(segment)
-        translated_text = ''.join(translated_segments)
-        return translated_text
-    else:
+    if not contains_jp:
         return text
+    segments = split_text_with_newlines(updated_text)
+    positions = [i for i, segment in enumerate(segments) if segment and segment not in ['\r\n', '\r', '\n']]
+    translate = lambda segment, key: translate_segment(segment, index, api_idx, config, previous_translations, sampling, key)
+    if len(positions) > 1:
+        keys = [None if slot_key is None else f"{slot_key}/{n}" for n in range(len(positions))]
+        with ThreadPoolExecutor(max_workers=min(len(positions), config.get('segment_concurrency', 8))) as executor:
+            results = list(executor.map(translate, [segments[i] for i in positions], keys))
+    else:
+        results = [translate(segments[i], slot_key) for i in positions]
+    for position, result in zip(positions, results):
+        segments[position] = result
+    return ''.join(segments)
+
+# 计划模式使用：返回条目中需要请求模型的段落，文件路径或不含日文的条目返回None，与translate_text_by_paragraph的过滤规则一致
+def plan_segments(text):
+    if is_file_path(text):
+        return None
+    contains_jp, updated_text = contains_japanese(text)
+    if not contains_jp:
+        return None
+    return [segment for segment in split_text_with_newlines(updated_text) if segment and segment not in ['\r\n', '\r', '\n']]
+
+# 翻译单个段落，请求失败（返回空译文）或控制符不一致时只重试该段落，并换用下一个endpoint
+def translate_segment(segment, index, api_idx, config, previous_translations, sampling, slot_key=None):
+    if translation_memory is not None:
+        remembered = translation_memory.get(segment)
+        if remembered is not None:
+            return remembered
+    translated = ""
+    fallback = ""
+    for attempt in range(config.get('segment_retries', 1) + 1):
+        idx = (api_idx + attempt) % len(config['endpoint'])
+        if config.get('use_template', False):
+            # 模板复用：数字、控制符和术语名称不同的文本只翻译一次
+            translated = template_cache.translate(
+                segment,
+                lambda text: translate_text(text, index, api_idx=idx, config=config, previous_translations=previous_translations, sampling=sampling, slot_key=slot_key),
+                config['dict'] if config['use_dict'] else None
+            )
+        else:
+            translated = translate_text(segment, index, api_idx=idx, config=config, previous_translations=previous_translations, sampling=sampling, slot_key=slot_key)
+        if translated and RPGMAKER_CODES.verify(segment, translated):
+            return translated
+        # 控制符丢失或重复时同样换用下一个endpoint重试，全部未通过时使用最后一次非空的译文
+        fallback = translated or fallback
+    if fallback:
+        console_print(f"警告：行号 {index} 的译文控制符与原文不一致：'{fallback}'")
+    return fallback
 
 # 调用API进行翻译
-def translate_text(text, index, api_idx=0, attempt=1, config=None, previous_translations=None):
+# sampling用于返工时覆盖默认采样参数
+def translate_text(text, index, api_idx=0, attempt=1, config=None, previous_translations=None, sampling=None, slot_key=None):
     try:
-        endpoint = config['endpoint'][api_idx]
         model_type = get_translation_model(config['model_type'], config['model_version'])
         context_size = config.get('context_size', 0)
         context = previous_translations[-context_size:] if previous_translations else []
-        data = make_request_json(text, model_type, config['use_dict'], config['dict_mode'], config['dict'], context)
-        response = requests.post(endpoint, json=data)
-        response.raise_for_status()
-
-        response_data = response.json()
-        completion_tokens = response_data.get("usage", {}).get("completion_tokens", 0)
-        max_tokens = data["max_tokens"]
+        # 控制符替换为占位符后再请求，避免模型改写或丢失，收到译文后换回
+        request_text, code_mapping = RPGMAKER_CODES.protect(text)
+        data = make_request_json(request_text, model_type, config['use_dict'], config['dict_mode'], config['dict'], context, config.get('max_tokens', 512), 'main_dev')
+        if generation_budget is not None:
+            generation_budget.apply(data, request_text)
+        if sampling:
+            data.update(sampling)
+        if slot_key is not None:
+            data["slot_key"] = slot_key
+        response_data = send_request(config, api_idx, data)
 
-        # 检查是否发生退化，重试时调整 frequency_penalty
-        if completion_tokens == max_tokens:
+        # 检查是否发生退化（生成数达到max_tokens），重试时调整 frequency_penalty，并且只在重试时放宽生成预算
+        if record_budget(request_text, data, response_data):
             console_print("模型可能发生退化，调整 frequency_penalty 并重试...")
             data["frequency_penalty"] = 0.8
-            response = requests.post(endpoint, json=data)
-            response.raise_for_status()
-            response_data = response.json()
+            if generation_budget is not None:
+                generation_budget.apply(data, request_text, attempt=1)
+            response_data = send_request(config, api_idx, data)
+            record_budget(request_text, data, response_data, 1)
 
-    except requests.RequestException as e:
+    except BackendError as e:
         console_print(f'请求翻译API错误: {e}')
         return ""
     
     translated_text = response_data.get("choices")[0].get("message", {}).get("content", "")
-    translated_text = translated_text.replace("将下面的日文文本翻译成中文：", "").replace("<|im_end|>", "")
+    translated_text = clean_output(translated_text)
+    translated_text = RPGMAKER_CODES.restore(translated_text, code_mapping)
     translated_text = fix_translation_end(text, translated_text)
     translated_text = unescape_translation(text, translated_text)
     
@@ -234,64 +294,16 @@ def translate_text(text, index, api_idx=0, attempt=1, config=None, previous_tran
     console_print(f"原文: {text}\n翻译: {translated_text}\n")  # 调试信息，输出翻译前后的文本
     return translated_text
 
-# 处理翻译请求的JSON构造
-def make_request_json(text, model_type, use_dict, dict_mode, dict_data, context):    
-    messages = []
-    
-    if model_type == "SakuraV0_8":
-        messages.append({"role": "system", "content": "你是一个简单的日文翻译模型，将日文翻译成简体中文。"})
-        messages.append({"role": "user", "content": f"将下面的日文文本翻译成中文：{text}"})
-    else:
-        if model_type == "SakuraV0_9":
-            messages.append({"role": "system", "content": "你是一个轻小说翻译模型，可以流畅地将日文翻译成简体中文，并正确使用人称代词。"})
-        elif model_type == "SakuraV0_10":
-            messages.append({"role": "system", "content": "你是一个轻小说翻译模型，可以流畅通顺地以日本轻小说的风格将日文翻译成简体中文，并联系上下文正确使用人称代词，不擅自添加原文中没有的代词。"})
-        elif model_type == "SakuraV1_0":
-            messages.append({"role": "system", "content": "你是一个轻小说翻译模型，可以流畅通顺地以日本轻小说的风格将日文翻译成简体中文，并联系上下文正确使用人称代词，不擅自添加原文中没有的代词。"})
-        elif model_type == "GalTranslV2_6":
-            messages.append({"role": "system", "content": "你是一个视觉小说翻译模型，可以通顺地使用给定的术语表以指定的风格将日文翻译成简体中文，并联系上下文正确使用人称代词。"})
-        elif model_type == "GalTranslV3":
-            messages.append({"role": "system", "content": "你是一个视觉小说翻译模型，可以通顺地使用给定的术语表以指定的风格将日文翻译成简体中文，并联系上下文正确使用人称代词。"})
-        else:
-            messages.append({"role": "system", "content": "你是一个轻小说翻译模型，可以流畅通顺地将日文翻译成简体中文。"})
-        
-        if context:
-            history_text = "历史翻译：" + "\n".join(context)
-        else:
-            history_text = ""
-        
-        if model_type == "GalTranslV3":
-            if use_dict:
-                dict_str = '\n'.join([f"{k}->{v[0]}" for k, v in dict_data.items()])
-                user_content = f"{history_text}\n参考以下术语表\n{dict_str}\n根据以上术语表的对应关系和备注，结合历史剧情和上下文，将下面的文本从日文翻译成简体中文：\n{text}"
-            else:
-                user_content = f"{history_text}\n结合历史剧情和上下文，将下面的文本从日文翻译成简体中文：\n{text}"
-            messages.append({"role": "user", "content": user_content})
-        else:
-            if context:
-                for c in context:
-                    messages.append({"role": "assistant", "content": c})
-            
-            if use_dict:
-                dict_str = '\n'.join([f"{k}->{v[0]}" for k, v in dict_data.items()])
-                messages.append({"role": "user", "content": f"参考以下术语表：\n{dict_str}\n根据以上术语表的对应关系和备注，结合历史剧情和上下文，将下面的文本从日文翻译成简体中文：{text}"})
-            else:
-                messages.append({"role": "user", "content": f"结合历史剧情和上下文，将下面的文本从日文翻译成简体中文：{text}"})
-    
-    temperature = 0.6 if model_type == "GalTranslV3" else 0.2
-    
-    data = {
-        "model": "sukinishiro",
-        "messages": messages,
-        "temperature": temperature,
-        "top_p": 0.3,
-        "max_tokens": 512,
-        "frequency_penalty": 0.2,
-        "do_sample": True,
-        "num_beams": 1,
-        "repetition_penalty": 1.0
-    }
-    return data
+# 记录响应的生成token数供生成预算学习，返回是否达到了max_tokens
+def record_budget(request_text, data, response_data, attempt=0):
+    completion_tokens = response_data.get("usage", {}).get("completion_tokens", 0)
+    if generation_budget is not None:
+        return generation_budget.record(request_text, completion_tokens, data["max_tokens"], attempt)
+    return completion_tokens >= data["max_tokens"]
+
+# 发送翻译请求并返回响应JSON，超时、重试和对冲由request_dispatcher处理，同时进行的请求数由request_slots或并发控制器限制
+def send_request(config, api_idx, data):
+    return request_dispatcher.post(api_idx, data)
 
 # 进度管理类
 class TranslationProgress:
@@ -304,10 +316,14 @@ class TranslationProgress:
         self.initialize()
     
     def initialize(self):
+        self.progress_data = None
         if os.path.exists(self.progress_file):
             with open(self.progress_file, 'r', encoding='utf-8') as file:
                 self.progress_data = json.load(file)
-        else:
+            # 条目数变化（如增量模式下待翻译条目重新计算）时旧进度已失效
+            if self.progress_data.get("total_items") != self.total_items:
+                self.progress_data = None
+        if self.progress_data is None:
             # 创建新的进度文件
             chunk_size = self.total_items // self.num_threads
             remainder = self.total_items % self.num_threads
@@ -335,14 +351,97 @@ class TranslationProgress:
                 "task_name": self.task_name,
                 "total_items": self.total_items,
                 "num_threads": self.num_threads,
+                "lane_sizes": [info["end_index"] - info["start_index"] + 1 for info in threads_info],
                 "threads": threads_info
             }
             self.save()
+        # 正在被工作线程处理的范围，只在运行时有效
+        self.claimed = set()
+        # 上次保存检查点后完成的条目数
+        self.unsaved = 0
+
+    # 调度策略交错排列条目时使用的初始范围大小，范围被拆分后保持不变，保证重启后条目顺序一致
+    def lane_sizes(self):
+        if "lane_sizes" in self.progress_data:
+            return self.progress_data["lane_sizes"]
+        return [info["end_index"] - info["start_index"] + 1 for info in self.progress_data["threads"]]
+
+    # 为工作线程分配一个范围，返回范围编号，没有可分配的条目时返回None
+    # 优先分配未被占用且未完成的范围（保留其历史上文），都被占用时把剩余条目最多的范围的后半部分拆为新范围（split为False时不拆分），
+    # 因此进度文件中的范围与线程数无关，运行中增减线程或重启时修改max_workers都不会丢失进度
+    def claim(self, split=True):
+        with self.lock:
+            threads = self.progress_data["threads"]
+            for info in threads:
+                if info["thread_id"] not in self.claimed and info["current_index"] <= info["end_index"]:
+                    self.claimed.add(info["thread_id"])
+                    return info["thread_id"]
+            if not split:
+                return None
+            # 被占用范围的current_index正在翻译，拆分点至少在其后一条
+            busiest = max(threads, key=lambda info: info["end_index"] - info["current_index"], default=None)
+            remaining = busiest["end_index"] - busiest["current_index"] if busiest is not None else 0
+            if remaining < 1:
+                return None
+            split = busiest["current_index"] + 1 + remaining // 2
+            threads.append({
+                "thread_id": len(threads),
+                "start_index": split,
+                "end_index": busiest["end_index"],
+                "current_index": split,
+                "previous_translations": []
+            })
+            busiest["end_index"] = split - 1
+            self.claimed.add(len(threads) - 1)
+            return len(threads) - 1
+
+    # 被占用范围中可以拆走的最多条目数
+    def largest_remaining(self):
+        with self.lock:
+            return max((info["end_index"] - info["current_index"] for info in self.progress_data["threads"]), default=0)
+
+    # 线程退出或完成范围后释放，未完成的部分可以再分配给其它线程
+    def release(self, thread_id):
+        with self.lock:
+            self.claimed.discard(thread_id)
+
+    # 范围中下一个待翻译的位置，范围已完成（或剩余部分已被拆走）时返回None
+    def next_position(self, thread_id):
+        with self.lock:
+            thread_info = self.progress_data["threads"][thread_id]
+            if thread_info["current_index"] > thread_info["end_index"]:
+                return None
+            return thread_info["current_index"]
+
+    # 是否还有可分配给新线程的条目
+    def has_work(self):
+        with self.lock:
+            for info in self.progress_data["threads"]:
+                if info["thread_id"] in self.claimed:
+                    if info["end_index"] - info["current_index"] >= 1:
+                        return True
+                elif info["current_index"] <= info["end_index"]:
+                    return True
+            return False
+
+    def stats(self):
+        with self.lock:
+            threads = self.progress_data["threads"]
+            done = sum(min(info["current_index"], info["end_index"] + 1) - info["start_index"] for info in threads)
+            return {
+                "total": self.total_items,
+                "done": done,
+                "ranges": len(threads),
+                "active_ranges": len(self.claimed),
+                "finished": all(info["current_index"] > info["end_index"] for info in threads)
+            }
     
+    # 只更新内存中的进度，由checkpoint在译文落盘后写入进度文件
     def update_progress(self, thread_id, current_index, translation=None, context_size=0):
         with self.lock:
             thread_info = self.progress_data["threads"][thread_id]
             thread_info["current_index"] = current_index
+            self.unsaved += 1
             
             # 更新历史翻译记录
             if translation and context_size > 0:
@@ -351,99 +450,356 @@ class TranslationProgress:
                 # 仅保留最近的N条翻译
                 if len(thread_info["previous_translations"]) > context_size:
                     thread_info["previous_translations"] = thread_info["previous_translations"][-context_size:]
-            
-            self.save()
     
     def get_thread_info(self, thread_id):
         return self.progress_data["threads"][thread_id]
     
     def get_previous_translations(self, thread_id):
-        thread_info = self.progress_data["threads"][thread_id]
-        return thread_info.get("previous_translations", [])
+        with self.lock:
+            thread_info = self.progress_data["threads"][thread_id]
+            return list(thread_info.get("previous_translations", []))
     
     def is_completed(self):
-        for thread_info in self.progress_data["threads"]:
-            if thread_info["current_index"] <= thread_info["end_index"]:
-                return False
-        return True
+        with self.lock:
+            for thread_info in self.progress_data["threads"]:
+                if thread_info["current_index"] <= thread_info["end_index"]:
+                    return False
+            return True
     
     def save(self):
         with open(self.progress_file, 'w', encoding='utf-8') as file:
             json.dump(self.progress_data, file, ensure_ascii=False, indent=4)
 
+    # 保存检查点：先记下当前进度，再保存译文，最后写入记下的进度
+    # 进度文件中标记完成的条目因此一定已经写入译文文件，中断后最多重新翻译上次检查点之后的条目
+    def checkpoint(self, data):
+        with save_lock:
+            with self.lock:
+                snapshot = json.dumps(self.progress_data, ensure_ascii=False, indent=4)
+                self.unsaved = 0
+            _write_translation_data(data, self.task_name)
+            with open(self.progress_file, 'w', encoding='utf-8') as file:
+                file.write(snapshot)
+
 # 翻译工作线程函数
-def translate_worker(thread_id, task_name, data, json_keys, progress_manager, config):
-    thread_info = progress_manager.get_thread_info(thread_id)
-    start_index = thread_info["current_index"]
-    end_index = thread_info["end_index"]
-    api_num = len(config['endpoint'])
-    
-    # 获取该线程的历史翻译记录
-    previous_translations = progress_manager.get_previous_translations(thread_id)
-    
+# 线程从全局队列领取任意文件中的范围，完成后继续领取，直到没有可分配的条目；线程数被调低时完成手头的条目后释放范围并退出
+# task中的indices为需要翻译的条目下标列表（增量模式或调度策略），此时进度中的下标为该列表中的位置
+def translate_worker(worker_id, task_queue, config):
     # 使用tqdm创建带有更多信息的进度条
     with progress_lock:
         pbar = tqdm(
-            total=end_index - thread_info["start_index"] + 1,
-            desc=f"线程 {thread_id}",
-            position=thread_id,
+            total=0,
+            desc=f"线程 {worker_id}",
+            position=worker_id,
             leave=True,
             ncols=100,  # 增加宽度以容纳更多信息
             bar_format='{l_bar}{bar:20}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}, {rate_fmt}]'
         )
-        progress_bars[thread_id] = pbar
-    
-    # 计算已完成的工作量并更新进度条
-    completed = start_index - thread_info["start_index"]
-    if completed > 0:
-        pbar.update(completed)
-    
-    for i in range(start_index, end_index + 1):
-        api_index = thread_id % api_num  # 使用线程ID来分配API端点
-        
-        if task_name.endswith(".json"):
-            key = json_keys[i]
-            original_text = key
-        else:  # CSV文件
-            original_text = data.loc[i, 'Original Text']
-        
-        translated_text = translate_text_by_paragraph(
-            original_text, i, api_index, config, previous_translations
-        )
-        
-        # 更新数据
-        if task_name.endswith(".json"):
-            data[json_keys[i]] = translated_text
-        else:  # CSV文件
-            data.loc[i, 'Machine translation'] = translated_text
-        
-        # 更新进度和历史翻译
-        progress_manager.update_progress(
-            thread_id, i + 1, translated_text, config.get('context_size', 0)
-        )
-        
-        # 更新进度条
+        progress_bars[worker_id] = pbar
+
+    task, thread_id = task_queue.claim()
+    while task is not None:
+        task_name, data, json_keys, indices = task["task_name"], task["data"], task["json_keys"], task["indices"]
+        progress_manager = task["progress"]
+        thread_info = progress_manager.get_thread_info(thread_id)
+        console_print(f"线程 {worker_id} 领取 {task_name} 范围 {thread_info['start_index']} - {thread_info['end_index']}, 当前进度: {thread_info['current_index']}")
+        # 计算已完成的工作量并更新进度条
         with progress_lock:
-            pbar.update(1)
-        
-        # 定期保存整个翻译文件
-        if (i + 1) % config['save_frequency'] == 0 or i + 1 > end_index:
-            save_translation_data(data, task_name)
-            console_print(f"线程 {thread_id}: 已保存进度 {i + 1}/{end_index + 1}")
-    
+            pbar.reset(total=thread_info["end_index"] - thread_info["start_index"] + 1)
+            pbar.update(thread_info["current_index"] - thread_info["start_index"])
+
+        while True:
+            if not job_control.checkpoint(worker_id):
+                progress_manager.release(thread_id)
+                console_print(f"线程 {worker_id} 已退出，{task_name} 范围 {thread_id} 的剩余条目交给其它线程")
+                with progress_lock:
+                    pbar.close()
+                    progress_bars[worker_id] = None
+                return
+            position = progress_manager.next_position(thread_id)
+            if position is None:
+                break
+            i = indices[position] if indices is not None else position
+            # 每个条目重新分配，运行中增减endpoint后立即生效
+            api_index = worker_id % len(config['endpoint'])
+
+            if task_name.endswith(".json"):
+                key = json_keys[i]
+                original_text = key
+            else:  # CSV文件
+                original_text = data.loc[i, 'Original Text']
+
+            # 同一范围的连续条目共用上下文链，llamacpp后端把它们固定到同一个slot
+            translated_text = translate_text_by_paragraph(
+                original_text, i, api_index, config, progress_manager.get_previous_translations(thread_id),
+                slot_key=f"{task_name}:{thread_id}"
+            )
+
+            # 更新数据
+            set_translation(task_name, data, json_keys, i, translated_text)
+            if validation_stage is not None:
+                validation_stage.submit(task_name, i, original_text, translated_text)
+
+            # 更新进度和历史翻译
+            progress_manager.update_progress(
+                thread_id, position + 1, translated_text, config.get('context_size', 0)
+            )
+
+            # 更新进度条，范围被拆分后总数随之减少
+            end_index = thread_info["end_index"]
+            with progress_lock:
+                pbar.total = end_index - thread_info["start_index"] + 1
+                pbar.update(1)
+
+            # 定期保存检查点
+            if progress_manager.unsaved >= config['save_frequency']:
+                progress_manager.checkpoint(data)
+                console_print(f"线程 {worker_id}: 已保存 {task_name} 进度 {progress_manager.stats()['done']}/{progress_manager.total_items}")
+
+        progress_manager.release(thread_id)
+        # 文件的最后一个范围完成时保存并输出该文件的统计，其它线程已经在翻译后面的文件
+        if task_queue.finish(task):
+            progress_manager.checkpoint(data)
+            console_print(format_file_done(task_name, progress_manager.total_items, task["started"]))
+        task, thread_id = task_queue.claim()
+
     # 完成后关闭进度条并从字典中移除
     with progress_lock:
         pbar.close()
-        progress_bars[thread_id] = None
+        progress_bars[worker_id] = None
 
 # 保存翻译数据
 def save_translation_data(data, filename):
+    with save_lock:
+        _write_translation_data(data, filename)
+
+def _write_translation_data(data, filename):
     if filename.endswith(".json"):
         with open(filename, 'w', encoding='utf-8') as file:
             json.dump(data, file, ensure_ascii=False, indent=4)
     elif filename.endswith(".csv"):
         data.to_csv(filename, index=False, quoting=csv.QUOTE_ALL)
 
+# 加载待翻译文件，返回数据、JSON键列表和条目数，不支持的文件返回None
+def load_task_data(task_name):
+    if task_name.endswith(".json"):
+        with open(task_name, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+        json_keys = list(data.keys())
+        return data, json_keys, len(json_keys)
+    elif task_name.endswith(".csv"):
+        data = pd.read_csv(task_name, encoding='utf-8')
+        data['Original Text'] = data['Original Text'].astype(str)
+        data['Machine translation'] = data['Machine translation'].astype(str)
+        return data, None, len(data)
+    return None
+
+# 获取指定条目的原文
+def get_original_text(task_name, data, json_keys, index):
+    if task_name.endswith(".json"):
+        return json_keys[index]
+    return data.loc[index, 'Original Text']
+
+# 写入指定条目的译文，与保存文件互斥；空译文（请求失败）不写入，保留原文
+def set_translation(task_name, data, json_keys, index, translated_text):
+    if not translated_text or not translated_text.strip():
+        return
+    with save_lock:
+        if task_name.endswith(".json"):
+            data[json_keys[index]] = translated_text
+        else:
+            data.loc[index, 'Machine translation'] = translated_text
+
+# 分布式协调者：持有任务文件，通过HTTP向工作者分发分段租约
+def run_coordinator(config, host, port):
+    progress_file = "distributed.progress.json"
+    saved_progress = {}
+    if os.path.exists(progress_file):
+        with open(progress_file, 'r', encoding='utf-8') as file:
+            saved_progress = json.load(file)
+    # 分段大小以进度文件为准，保证重启后分段边界不变
+    segment_size = saved_progress.get("segment_size", config.get('segment_size', 50))
+    queue = SegmentQueue(config.get('lease_timeout', 300), config.get('context_size', 0))
+    tasks = {}
+    for task_name in config['task_list']:
+        if not os.path.exists(task_name):
+            console_print(f"文件{task_name}不存在，跳过。")
+            continue
+        loaded = load_task_data(task_name)
+        if loaded is None:
+            console_print(f"不支持的文件类型: {task_name}")
+            continue
+        data, json_keys, total_items = loaded
+        tasks[task_name] = {"data": data, "json_keys": json_keys, "unsaved": 0}
+        queue.add_task(task_name, total_items, segment_size, saved_progress.get("tasks", {}).get(task_name, []))
+        console_print(f"已加载任务: {task_name} (总条目: {total_items})")
+
+    def save_progress():
+        progress = {
+            "segment_size": segment_size,
+            "tasks": {task_name: queue.done_starts(task_name) for task_name in tasks}
+        }
+        with open(progress_file, 'w', encoding='utf-8') as file:
+            json.dump(progress, file, ensure_ascii=False, indent=4)
+
+    def get_texts(task_name, start, end):
+        task = tasks[task_name]
+        return [str(get_original_text(task_name, task["data"], task["json_keys"], i)) for i in range(start, end + 1)]
+
+    def on_complete(segment, translations):
+        task_name = segment["task_name"]
+        task = tasks[task_name]
+        for offset, translated_text in enumerate(translations):
+            set_translation(task_name, task["data"], task["json_keys"], segment["start"] + offset, translated_text)
+        task["unsaved"] += len(translations)
+        # 先保存译文再保存进度，保证进度文件中的分段一定已落盘
+        if task["unsaved"] >= config['save_frequency'] or queue.is_finished(task_name):
+            save_translation_data(task["data"], task_name)
+            save_progress()
+            task["unsaved"] = 0
+        console_print(f"分段完成: {task_name} {segment['start']}-{segment['end']} (工作者 {segment['worker']})")
+
+    server = CoordinatorServer((host, port), queue, get_texts, on_complete)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    console_print(f"协调者已启动: http://{host}:{port}，分段大小 {segment_size}，租约超时 {queue.lease_timeout} 秒")
+    try:
+        while not queue.is_finished():
+            time.sleep(5)
+        # 所有工作者都收到完成通知（或超过finish_grace秒）后再关闭服务，避免工作者反复重连已关闭的协调者
+        deadline = time.time() + config.get('finish_grace', 60)
+        while not queue.notify_finished() and time.time() < deadline:
+            time.sleep(0.5)
+    finally:
+        with server.complete_lock:
+            for task_name, task in tasks.items():
+                if task["unsaved"] > 0:
+                    save_translation_data(task["data"], task_name)
+            save_progress()
+        server.shutdown()
+    console_print("所有任务翻译完成")
+
+# 分布式工作者线程：租用分段，使用本地endpoint翻译后提交结果
+# 与协调者联系成功过之后，连续max_connect_failures次连接失败视为协调者已结束，线程退出
+def distributed_worker(thread_id, client, config):
+    api_num = len(config['endpoint'])
+    api_index = thread_id % api_num
+    context_size = config.get('context_size', 0)
+    max_failures = config.get('max_connect_failures', 5)
+    contacted = False
+    failures = 0
+    while True:
+        try:
+            reply = client.lease(thread_id)
+        except requests.RequestException as e:
+            failures += 1
+            if contacted and failures >= max_failures:
+                console_print(f"线程 {thread_id}: 连续 {failures} 次无法连接协调者，退出")
+                return
+            console_print(f"线程 {thread_id}: 连接协调者失败: {e}")
+            time.sleep(5)
+            continue
+        contacted = True
+        failures = 0
+        segment = reply["segment"]
+        if segment is None:
+            if reply["finished"]:
+                return
+            # 剩余分段都已被租用，等待过期租约重新排队
+            time.sleep(5)
+            continue
+
+        lease_id = segment["lease_id"]
+        previous_translations = segment["previous_translations"]
+        translations = []
+        last_renew = time.time()
+        for offset, original_text in enumerate(segment["texts"]):
+            translated_text = translate_text_by_paragraph(
+                original_text, segment["start"] + offset, api_index, config, previous_translations,
+                slot_key=f"{segment['task_name']}:{segment['segment_id']}"
+            )
+            translations.append(translated_text)
+            if translated_text and context_size > 0:
+                previous_translations.append(translated_text)
+                del previous_translations[:-context_size]
+            if time.time() - last_renew > segment["lease_timeout"] / 3:
+                try:
+                    renewed = client.renew(lease_id)
+                except requests.RequestException:
+                    renewed = False
+                if not renewed:
+                    break
+                last_renew = time.time()
+
+        if len(translations) != len(segment["texts"]):
+            console_print(f"线程 {thread_id}: 分段 {segment['task_name']} {segment['start']} 租约已失效，放弃结果")
+            continue
+        try:
+            accepted = client.complete(lease_id, translations)
+        except requests.RequestException as e:
+            console_print(f"线程 {thread_id}: 提交结果失败: {e}")
+            continue
+        if accepted:
+            console_print(f"线程 {thread_id}: 已提交分段 {segment['task_name']} {segment['start']}-{segment['end']}")
+        else:
+            console_print(f"线程 {thread_id}: 分段 {segment['task_name']} {segment['start']} 租约已过期，结果被丢弃")
+
+# 分布式工作者：启动max_workers个线程，直到协调者的全部分段完成
+def run_worker(config, url, max_workers):
+    client = CoordinatorClient(url)
+    console_print(f"工作者 {client.worker} 已连接协调者 {url}")
+    threads = []
+    for thread_id in range(max_workers):
+        thread = threading.Thread(target=distributed_worker, args=(thread_id, client, config))
+        threads.append(thread)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    console_print("协调者已无剩余分段，工作者退出")
+
+# 控制接口：运行中添加endpoint，与启动时一样创建后端并按需录制，返回当前的endpoint列表
+# endpoint_indices记录每个endpoint在request_dispatcher中的后端下标
+def add_endpoint(config, endpoint_indices, capture_log, endpoint):
+    if endpoint in config['endpoint']:
+        raise ValueError(f"endpoint {endpoint} 已在使用")
+    try:
+        backend = create_backend(endpoint, config)
+    except Exception as e:
+        raise ValueError(f"无法创建endpoint {endpoint}: {e}")
+    if capture_log is not None:
+        backend = CapturingBackend(backend, capture_log)
+    endpoint_indices[endpoint] = request_dispatcher.add_backend(backend)
+    config['endpoint'].append(endpoint)
+    # 自适应并发时线程数随endpoint的并发上限增加
+    if concurrency_controller is not None:
+        job_control.set_workers(job_control.target_workers + config.get('max_concurrency', 16))
+    console_print(f"已添加endpoint: {endpoint}")
+    return list(config['endpoint'])
+
+# 控制接口：移除endpoint，已发出的请求继续完成，之后的请求和重试改用其它endpoint
+def remove_endpoint(config, endpoint_indices, endpoint):
+    if endpoint not in config['endpoint']:
+        raise ValueError(f"endpoint {endpoint} 不在使用中")
+    if not request_dispatcher.remove_backend(endpoint_indices[endpoint]):
+        raise ValueError("不能移除最后一个endpoint")
+    config['endpoint'].remove(endpoint)
+    if concurrency_controller is not None:
+        job_control.set_workers(max(1, job_control.target_workers - config.get('max_concurrency', 16)))
+    console_print(f"已移除endpoint: {endpoint}")
+    return list(config['endpoint'])
+
+# 控制接口：任务状态，包括暂停状态、线程、endpoint、请求统计和各文件进度
+def control_status(config):
+    status = job_control.status()
+    status["endpoint"] = list(config['endpoint'])
+    status["requests"] = dict(request_dispatcher.stats, abandoned_inflight=request_dispatcher.abandoned)
+    if concurrency_controller is not None:
+        status["concurrency"] = concurrency_controller.stats()
+    if generation_budget is not None:
+        status["budget"] = generation_budget.stats()
+    status["tasks"] = task_queue.stats() if task_queue is not None else {}
+    return status
+
 # 初始化终端显示
 def setup_terminal():
     # 清屏
@@ -451,12 +807,53 @@ def setup_terminal():
     # 将光标移到顶部
     print("\033[H", end="")
 
+# 解析命令行参数
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mtool翻译脚本")
+    parser.add_argument("--coordinator", action="store_true", help="以协调者模式运行，向工作者分发分段")
+    parser.add_argument("--host", default="127.0.0.1", help="协调者监听地址")
+    parser.add_argument("--port", type=int, default=8600, help="协调者监听端口")
+    parser.add_argument("--worker", metavar="URL", help="以工作者模式运行，从指定协调者租用分段")
+    parser.add_argument("--incremental", metavar="DIR", help="增量翻译：沿用DIR中同名旧译文文件里内容未变的条目，只翻译新增或变更的条目")
+    parser.add_argument("--plan", action="store_true", help="计划模式：不请求模型，估算task_list的请求数、token数和耗时")
+    parser.add_argument("--profile", action="append", default=[], metavar="FILE", help="计划模式使用的录制日志，可指定多次，默认使用config中的capture_file")
+    parser.add_argument("--control-port", type=int, metavar="PORT", help="在本机启动控制接口，运行中暂停、调整线程数和endpoint，默认使用config中的control_port")
+    return parser.parse_args()
+
+# 计划模式：按与翻译时相同的过滤规则统计每个文件需要请求的段落，不创建后端也不修改任何文件
+def run_plan(config, args):
+    api_num = len(config['endpoint'])
+    # 线程按编号轮流使用各endpoint
+    threads = [len(range(api_idx, config['max_workers'], api_num)) for api_idx in range(api_num)]
+    planner = JobPlanner(config, load_profiles(profile_paths(config, args.profile)), threads, plan_segments, translation_memory)
+    for task_name in config['task_list']:
+        if not os.path.exists(task_name):
+            print(f"文件{task_name}不存在，跳过。")
+            continue
+        loaded = load_task_data(task_name)
+        if loaded is None:
+            print(f"不支持的文件类型: {task_name}")
+            continue
+        data, json_keys, total_items = loaded
+        indices = range(total_items)
+        if args.incremental:
+            indices, report = apply_incremental(task_name, data, args.incremental)
+            print(format_report(task_name, report))
+        planner.add_file(task_name, [get_original_text(task_name, data, json_keys, i) for i in indices])
+    print(planner.report())
+
 # 主函数
 def main():
+    args = parse_args()
+
     # 初始化终端显示
     setup_terminal()
     
     config = load_config()
+    if args.coordinator:
+        run_coordinator(config, args.host, args.port)
+        return
+
     if not config['endpoint']:
         console_print("请配置API endpoint后再运行程序。")
         return
@@ -464,61 +861,171 @@ def main():
     # 初始化字典
     dict_data, full_dict_str = initialize_dict(json.dumps(config.get('dict', {})))
     config['dict'] = dict_data
+
+    # 只读翻译记忆包，以mmap方式打开，多个进程共享页缓存，命中的原文不再请求模型
+    global translation_memory
+    if config.get('memory_pack'):
+        translation_memory = TranslationMemory(config['memory_pack'])
+
+    if args.plan:
+        run_plan(config, args)
+        return
+
+    # endpoint为HTTP地址或"local:<模型路径>"，后者直接使用本机的LLM进程池
+    backends = [create_backend(endpoint, config) for endpoint in config['endpoint']]
+    # 录制每次模型请求和响应，可用engine.replay离线回放
+    capture_log = None
+    if config.get('capture_file'):
+        capture_log = CaptureLog(config['capture_file'])
+        backends = [CapturingBackend(backend, capture_log) for backend in backends]
+
+    # 按endpoint自适应调整并发，max_workers为初始并发之和，线程数按所有endpoint的并发上限之和分配，
+    # 多出的线程在控制器中等待名额，控制器调高并发后即可使用
+    global concurrency_controller
+    max_workers = config['max_workers']
+    if config.get('adaptive_concurrency', False):
+        api_num = len(config['endpoint'])
+        max_concurrency = config.get('max_concurrency', 16)
+        concurrency_controller = ConcurrencyController(
+            backends, max(1, max_workers // api_num), 1, max_concurrency, log=console_print
+        )
+        max_workers = max_concurrency * api_num
+
+    # 多行条目的段落并发请求、对冲请求和对冲落选后仍未返回的请求都计入，同时进行的请求总数不超过线程数，控制接口调整线程数后随之变化
+    global request_slots
+    if concurrency_controller is None:
+        request_slots = RequestSlots(lambda: job_control.target_workers if job_control is not None else config['max_workers'])
+
+    # 每个请求有超时和总预算，避免挂起的连接阻塞整个线程的下标范围
+    global request_dispatcher
+    request_dispatcher = RequestDispatcher(
+        backends, concurrency_controller,
+        config.get('request_timeout', 120), config.get('request_budget', 600), config.get('max_retries', 3),
+        config.get('hedge_requests', False), slots=request_slots, log=console_print
+    )
+
+    # 按原文的token数和行数设置max_tokens，比例从本次运行已完成的译文学习
+    global generation_budget
+    if config.get('generation_budget', True):
+        generation_budget = GenerationBudget(config.get('max_tokens', 512))
+
+    if args.worker:
+        run_worker(config, args.worker, max_workers)
+        if capture_log is not None:
+            capture_log.close()
+        return
+
+    # 译文校验阶段，未通过的条目换采样参数或换endpoint返工
+    global validation_stage
+    if config.get('use_validation', False):
+        validation_stage = ValidationStage(
+            lambda source, index, api_idx, sampling: translate_text_by_paragraph(source, index, api_idx, dict(config, use_template=False), None, sampling),
+            len(config['endpoint']), config.get('validation_workers', 2), config.get('rework_workers', 1), console_print
+        )
     
     task_list = config['task_list']
     if not task_list:
         console_print("未找到待翻译文件，请更新config.json。")
         return
 
+    # 控制接口只监听本机，运行中可以暂停、恢复、调整线程数和增减endpoint
+    global job_control
+    job_control = JobControl(max_workers)
+    control_server = None
+    control_port = args.control_port if args.control_port is not None else config.get('control_port', 0)
+    if control_port:
+        endpoint_indices = {endpoint: index for index, endpoint in enumerate(config['endpoint'])}
+        control_server = ControlServer(
+            (config.get('control_host', '127.0.0.1'), control_port), job_control,
+            lambda: control_status(config),
+            lambda endpoint: add_endpoint(config, endpoint_indices, capture_log, endpoint),
+            lambda endpoint: remove_endpoint(config, endpoint_indices, endpoint)
+        )
+        threading.Thread(target=control_server.serve_forever, daemon=True).start()
+        console_print(f"控制接口已启动: http://{control_server.server_address[0]}:{control_server.server_address[1]}")
+
+    # 所有文件一次加载到全局队列，线程翻译完一个文件的范围后直接领取后面文件的范围
+    global task_queue
+    task_queue = TaskQueue()
+    policy = config.get('schedule_policy', 'file')
     for task_name in task_list:
         if not os.path.exists(task_name):
             console_print(f"文件{task_name}不存在，跳过。")
             continue
 
         # 加载数据
-        if task_name.endswith(".json"):
-            with open(task_name, 'r', encoding='utf-8') as file:
-                data = json.load(file)
-            json_keys = list(data.keys())
-            total_items = len(json_keys)
-        elif task_name.endswith(".csv"):
-            data = pd.read_csv(task_name, encoding='utf-8')
-            data['Original Text'] = data['Original Text'].astype(str)
-            data['Machine translation'] = data['Machine translation'].astype(str)
-            total_items = len(data)
-            json_keys = None
-        else:
+        loaded = load_task_data(task_name)
+        if loaded is None:
             console_print(f"不支持的文件类型: {task_name}")
             continue
+        data, json_keys, total_items = loaded
 
-        # 创建或加载进度管理器
-        num_threads = config['max_workers']
-        progress_manager = TranslationProgress(task_name, total_items, num_threads)
-        
-        console_print(f"开始处理任务: {task_name} (总条目: {total_items})")
-        console_print("调试信息将显示在顶部，进度条显示在底部")
-        time.sleep(1)  # 给用户时间阅读信息
-        
-        # 创建并启动工作线程
-        threads = []
-        for thread_id in range(num_threads):
-            thread = threading.Thread(
-                target=translate_worker,
-                args=(thread_id, task_name, data, json_keys, progress_manager, config)
+        indices = None
+        if args.incremental:
+            indices, report = apply_incremental(task_name, data, args.incremental)
+            save_translation_data(data, task_name)
+            console_print(format_report(task_name, report))
+            total_items = len(indices)
+            if total_items == 0:
+                continue
+
+        # 创建或加载进度管理器，新建时按当前线程数划分初始范围
+        progress_manager = TranslationProgress(task_name, total_items, job_control.target_workers)
+        if progress_manager.is_completed():
+            console_print(f"任务 {task_name} 已在之前完成，跳过。")
+            continue
+
+        if validation_stage is not None:
+            validation_stage.register_task(
+                task_name,
+                lambda index, translated_text, task_name=task_name, data=data, json_keys=json_keys: set_translation(task_name, data, json_keys, index, translated_text)
             )
-            threads.append(thread)
-            thread.start()
-            thread_info = progress_manager.get_thread_info(thread_id)
-            console_print(f"线程 {thread_id} 已启动，处理范围: {thread_info['start_index']} - {thread_info['end_index']}, 当前进度: {thread_info['current_index']}")
-        
-        # 等待所有线程完成
-        for thread in threads:
-            thread.join()
-        
-        console_print(f"任务 {task_name} 翻译完成")
-        
-        # 任务完成后，可以删除进度文件或保留作为记录
-        # os.remove(f"{task_name}.progress.json")
+
+        # 按调度策略把预估长度相近的条目分到各线程的相同位置，使同时提交的请求长度相近
+        if policy != 'file':
+            pending = indices if indices is not None else range(total_items)
+            get_text = lambda i, task_name=task_name, data=data, json_keys=json_keys: get_original_text(task_name, data, json_keys, i)
+            console_print(format_length_histogram(pending, get_text))
+            indices = interleave(schedule_indices(pending, get_text, policy), progress_manager.lane_sizes())
+
+        task_queue.add_task({"task_name": task_name, "data": data, "json_keys": json_keys, "indices": indices, "progress": progress_manager})
+        console_print(f"已加载任务: {task_name} (总条目: {total_items}，剩余: {total_items - progress_manager.stats()['done']})")
+
+    console_print("调试信息将显示在顶部，进度条显示在底部")
+    time.sleep(1)  # 给用户时间阅读信息
+
+    # 按目标线程数启动工作线程并等待所有文件完成，线程数被调高时补充新线程
+    def start_worker(worker_id):
+        thread = threading.Thread(target=translate_worker, args=(worker_id, task_queue, config))
+        thread.start()
+        return thread
+    job_control.run_workers(task_queue.has_work, start_worker)
+
+    if validation_stage is not None:
+        # 等待返工完成后再保存一次
+        validation_stage.join()
+        for task in task_queue.tasks:
+            task["progress"].checkpoint(task["data"])
+        console_print(format_validation_stats(validation_stage.stats))
+    console_print(f"全部任务翻译完成，共 {len(task_queue.tasks)} 个文件")
+    if config.get('use_template', False):
+        console_print(format_template_stats(template_cache.stats()))
+    if concurrency_controller is not None:
+        console_print(format_concurrency_stats(concurrency_controller.stats()))
+    console_print(format_request_stats(request_dispatcher.stats))
+    if generation_budget is not None:
+        console_print(format_budget_stats(generation_budget.stats()))
+    if translation_memory is not None:
+        memory_stats = translation_memory.stats()
+        console_print(f"翻译记忆: 共 {memory_stats['entries']} 条，查询 {memory_stats['lookups']} 次，命中 {memory_stats['hits']} 次")
+
+    if control_server is not None:
+        control_server.shutdown()
+    if validation_stage is not None:
+        validation_stage.close()
+    LocalBackend.close_all()
+    if capture_log is not None:
+        capture_log.close()
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,183 @@
+import math
+import os
+
+from engine import RPGMAKER_CODES, estimate_tokens, get_translation_model, make_request_json
+from engine.capture import group_runs, read_capture
+from template import PLACEHOLDER, make_template
+
+# 计划模式：不发送任何模型请求，估算task_list的请求数、token数和耗时
+
+# 没有录制数据的endpoint使用的默认画像：固定开销（秒）、每个生成token的耗时（秒）、并发
+DEFAULT_PROFILE = {"requests": 0, "base": 0.3, "per_token": 0.03, "concurrency": 1.0, "ratio": None}
+# 每条消息的格式开销（token）
+MESSAGE_OVERHEAD = 4
+
+# 由engine.capture的录制日志统计各endpoint的吞吐画像
+# 按最小二乘拟合 延迟 = 固定开销 + 每token耗时 × 生成token数，并发为请求耗时之和除以有请求进行的总时长
+def load_profiles(paths):
+    records = {}
+    for path in paths:
+        for record in read_capture(path):
+            if record.get("error") is None and record.get("response"):
+                records.setdefault(record["source"], []).append(record)
+    profiles = {}
+    for source, items in records.items():
+        tokens = [item["response"].get("usage", {}).get("completion_tokens", 0) for item in items]
+        latencies = [item["latency"] for item in items]
+        count = len(items)
+        mean_tokens = sum(tokens) / count
+        mean_latency = sum(latencies) / count
+        variance = sum((t - mean_tokens) ** 2 for t in tokens)
+        if variance > 0:
+            per_token = max(0.0, sum((t - mean_tokens) * (l - mean_latency) for t, l in zip(tokens, latencies)) / variance)
+            base = max(0.0, mean_latency - per_token * mean_tokens)
+        else:
+            per_token = mean_latency / max(mean_tokens, 1)
+            base = 0.0
+        # 合并重叠的请求区间，得到有请求进行的总时长；start只在同一次运行内可比，按运行分别合并
+        busy = 0.0
+        for run_items in group_runs(items).values():
+            end = None
+            for start, latency in sorted((item["start"], item["latency"]) for item in run_items):
+                if end is None or start > end:
+                    busy += latency
+                    end = start + latency
+                elif start + latency > end:
+                    busy += start + latency - end
+                    end = start + latency
+        # 录制日志中没有单独的原文，按最后一条消息（原文加指令）计算比例，估算时使用相同的基准
+        source_tokens = sum(estimate_tokens(item["request"].get("messages", [{}])[-1].get("content", "")) for item in items)
+        profiles[source] = {
+            "requests": count,
+            "base": base,
+            "per_token": per_token,
+            "concurrency": sum(latencies) / busy if busy > 0 else 1.0,
+            "ratio": sum(tokens) / source_tokens if source_tokens else None,
+        }
+    return profiles
+
+# 计划模式使用的录制日志：命令行指定的文件，否则为config中存在的capture_file
+def profile_paths(config, paths):
+    if paths:
+        return paths
+    capture_file = config.get('capture_file')
+    return [capture_file] if capture_file and os.path.exists(capture_file) else []
+
+def format_duration(seconds):
+    seconds = int(math.ceil(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}小时{minutes}分"
+    if minutes:
+        return f"{minutes}分{seconds}秒"
+    return f"{seconds}秒"
+
+# 估算整个任务的请求、token数和耗时
+# threads_per_endpoint[i]为分配给第i个endpoint的线程数，segments_of(text)返回条目中需要请求模型的段落，
+# 文件路径或不含日文的条目返回None，过滤规则与各脚本的translate_text_by_paragraph一致
+class JobPlanner:
+    def __init__(self, config, profiles, threads_per_endpoint, segments_of, translation_memory=None):
+        self.config = config
+        self.segments_of = segments_of
+        self.translation_memory = translation_memory
+        self.model_type = get_translation_model(config['model_type'], config['model_version'])
+        self.profiles = []
+        for endpoint, threads in zip(config['endpoint'], threads_per_endpoint):
+            profile = profiles.get(endpoint) or profiles.get(endpoint.rstrip('/'))
+            measured = profile is not None
+            profile = dict(profile or DEFAULT_PROFILE)
+            # 录制时的并发以内延迟可信，线程数更少时按线程数计算
+            profile["concurrency"] = max(1.0, min(profile["concurrency"], threads)) if measured else 1.0
+            profile["measured"] = measured
+            profile["endpoint"] = endpoint
+            self.profiles.append(profile)
+        # 生成token数与最后一条消息token数的比例，没有录制数据时按生成token数等于原文token数估算
+        measured = [profile for profile in self.profiles if profile["ratio"] is not None]
+        self.ratio = sum(profile["ratio"] * profile["requests"] for profile in measured) / sum(profile["requests"] for profile in measured) if measured else None
+        # 模板和去重按整个任务统计，与跨文件共享的模板缓存一致
+        self.templates = set()
+        self.seen = set()
+        self.files = []
+
+    # 估算一个请求的提示词和生成token数，历史上文用前几段原文近似
+    def estimate_request(self, segment, context):
+        data = make_request_json(RPGMAKER_CODES.protect(segment)[0], self.model_type, self.config['use_dict'], self.config['dict_mode'], self.config['dict'], context)
+        prompt = sum(estimate_tokens(message["content"]) + MESSAGE_OVERHEAD for message in data["messages"])
+        if self.ratio is None:
+            return prompt, estimate_tokens(segment)
+        return prompt, max(1, round(estimate_tokens(data["messages"][-1]["content"]) * self.ratio))
+
+    def add_file(self, task_name, texts):
+        stats = {"task": task_name, "entries": 0, "skipped": 0, "memory": 0, "segments": 0, "templated": 0,
+                 "requests": 0, "unique": 0, "prompt_tokens": 0, "completion_tokens": 0, "work": [0.0] * len(self.profiles)}
+        context_size = self.config.get('context_size', 0)
+        context = []
+        for text in texts:
+            stats["entries"] += 1
+            if self.translation_memory is not None and self.translation_memory.get(text) is not None:
+                stats["memory"] += 1
+                continue
+            segments = self.segments_of(text)
+            if segments is None:
+                stats["skipped"] += 1
+                continue
+            for segment in segments:
+                stats["segments"] += 1
+                if self.translation_memory is not None and self.translation_memory.get(segment) is not None:
+                    stats["memory"] += 1
+                    continue
+                request_text = segment
+                if self.config.get('use_template', False) and PLACEHOLDER not in segment:
+                    template, slots = make_template(segment, self.config['dict'] if self.config['use_dict'] else None)
+                    if slots:
+                        if template in self.templates:
+                            stats["templated"] += 1
+                            continue
+                        self.templates.add(template)
+                        request_text = template
+                stats["requests"] += 1
+                if request_text not in self.seen:
+                    self.seen.add(request_text)
+                    stats["unique"] += 1
+                prompt, completion = self.estimate_request(request_text, context[-context_size:] if context_size else [])
+                stats["prompt_tokens"] += prompt
+                stats["completion_tokens"] += completion
+                for i, profile in enumerate(self.profiles):
+                    stats["work"][i] += profile["base"] + profile["per_token"] * completion
+                context.append(segment)
+                if len(context) > context_size:
+                    context.pop(0)
+        self.files.append(stats)
+        return stats
+
+    # 条目按下标或线程轮流分配给各endpoint，每个endpoint承担1/N的请求，耗时取最慢的endpoint
+    def estimate_seconds(self, work):
+        count = len(self.profiles)
+        return max(w / count / profile["concurrency"] for w, profile in zip(work, self.profiles))
+
+    def report(self):
+        lines = ["吞吐画像:"]
+        for profile in self.profiles:
+            speed = profile["concurrency"] / (profile["base"] / 50 + profile["per_token"]) if profile["per_token"] > 0 else 0
+            source = f"录制 {profile['requests']} 次请求" if profile["measured"] else "未录制，使用默认值"
+            lines.append(f"  {profile['endpoint']}: {source}，固定开销 {profile['base']:.2f}s，每token {profile['per_token'] * 1000:.1f}ms，"
+                         f"并发 {profile['concurrency']:.1f}，约 {speed:.0f} token/s（按50 token的译文计）")
+        if self.ratio is not None:
+            lines.append(f"生成token与用户消息token的比例: {self.ratio:.2f}")
+        for stats in self.files:
+            seconds = self.estimate_seconds(stats["work"])
+            lines.append(
+                f"{stats['task']}: 条目 {stats['entries']}，跳过 {stats['skipped']}，记忆包命中 {stats['memory']}，"
+                f"段落 {stats['segments']}，模板复用 {stats['templated']}，请求 {stats['requests']} 次（其中首次出现的原文 {stats['unique']} 条），"
+                f"提示词 {stats['prompt_tokens']} token，生成 {stats['completion_tokens']} token，单独翻译约 {format_duration(seconds)}"
+            )
+        requests = sum(stats["requests"] for stats in self.files)
+        # 所有文件的条目进入同一个全局队列，由同一组线程处理，总耗时按合并后的工作量计算
+        work = [sum(stats["work"][i] for stats in self.files) for i in range(len(self.profiles))]
+        total_seconds = self.estimate_seconds(work)
+        lines.append(
+            f"合计: 请求 {requests} 次（去重后 {len(self.seen)} 次），提示词 {sum(stats['prompt_tokens'] for stats in self.files)} token，"
+            f"生成 {sum(stats['completion_tokens'] for stats in self.files)} token，预计 {format_duration(total_seconds)}（所有文件共用同一队列和线程）"
+        )
+        return "\n".join(lines)
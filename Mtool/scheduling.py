@@ -0,0 +1,45 @@
+import math
+
+from engine import estimate_tokens
+
+# 调度策略
+# file: 按文件顺序（默认）
+# bucket: 按预估长度分桶，长度相近的条目一起提交，桶内保持文件顺序
+# sjf: 最短优先，预估长度最短的条目最先提交
+POLICIES = ("file", "bucket", "sjf")
+
+# 长度桶编号，每个桶覆盖两倍的长度范围
+def length_bucket(tokens):
+    return int(math.log2(max(tokens, 1)))
+
+# 按调度策略排列待翻译条目，get_text(index)返回条目原文，返回新的条目顺序
+def schedule_indices(indices, get_text, policy="file"):
+    indices = list(indices)
+    if policy == "file":
+        return indices
+    if policy not in POLICIES:
+        raise ValueError(f"未知的调度策略: {policy}，可选 {', '.join(POLICIES)}")
+    tokens = {index: estimate_tokens(get_text(index)) for index in indices}
+    if policy == "bucket":
+        return sorted(indices, key=lambda index: (length_bucket(tokens[index]), index))
+    return sorted(indices, key=lambda index: (tokens[index], index))
+
+# 把排好序的条目轮流分给各线程的连续范围，sizes为各线程范围的长度
+# 各线程同一时刻处理的条目长度相近，返回按线程范围拼接后的顺序
+def interleave(ordered, sizes):
+    chunks = [[] for _ in sizes]
+    thread = 0
+    for index in ordered:
+        while len(chunks[thread]) >= sizes[thread]:
+            thread = (thread + 1) % len(sizes)
+        chunks[thread].append(index)
+        thread = (thread + 1) % len(sizes)
+    return [index for chunk in chunks for index in chunk]
+
+# 统计各长度桶的条目数，用于输出预扫描结果
+def format_length_histogram(indices, get_text):
+    counts = {}
+    for index in indices:
+        bucket = length_bucket(estimate_tokens(get_text(index)))
+        counts[bucket] = counts.get(bucket, 0) + 1
+    return "预估长度分布: " + "，".join(f"{2 ** bucket}-{2 ** (bucket + 1) - 1} token {count} 条" for bucket, count in sorted(counts.items()))
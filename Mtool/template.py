@@ -0,0 +1,100 @@
+import re
+import threading
+
+# 控制符和占位符与Translator++后端共用
+from engine.controlcodes import (
+    PLACEHOLDER, RPGMAKER_CODE_PATTERN, find_placeholders, format_placeholder, placeholder_width, replace_placeholders,
+)
+
+NUMBER_PATTERN = r'\d+(?:\.\d+)?'
+
+# 将文本中的数字、控制符和术语表中的名称提取为占位符，编号位数规则与控制符占位符相同
+# 返回模板文本和槽位列表，每个槽位为 (原文, 回填文本)
+def make_template(text, dict_data=None):
+    names = sorted(dict_data.keys(), key=len, reverse=True) if dict_data else []
+    parts = [f'(?P<code>{RPGMAKER_CODE_PATTERN})']
+    if names:
+        parts.append('(?P<name>' + '|'.join(re.escape(name) for name in names) + ')')
+    parts.append(f'(?P<number>{NUMBER_PATTERN})')
+    pattern = re.compile('|'.join(parts))
+    width = placeholder_width(sum(1 for _ in pattern.finditer(text)))
+    slots = []
+
+    def replace(match):
+        value = match.group(0)
+        if match.lastgroup == "name":
+            slots.append((value, dict_data[value][0]))
+        else:
+            slots.append((value, value))
+        return format_placeholder(len(slots), width)
+
+    return pattern.sub(replace, text), slots
+
+# 检查模板译文中每个占位符恰好出现一次
+def check_template_translation(translation, slot_count):
+    if not translation:
+        return False
+    found = sorted(find_placeholders(translation, placeholder_width(slot_count)))
+    return found == list(range(1, slot_count + 1))
+
+# 将槽位回填到模板译文中
+def fill_template(translation, slots):
+    return replace_placeholders(translation, placeholder_width(len(slots)), lambda number: slots[number - 1][1] if 1 <= number <= len(slots) else None)
+
+# 模板译文缓存：每个不同的模板只翻译一次，其余实例回填槽位
+class TemplateCache:
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    # translate_func(text) 为实际调用模型的翻译函数
+    def translate(self, text, translate_func, dict_data=None):
+        if PLACEHOLDER in text:
+            return translate_func(text)
+        template, slots = make_template(text, dict_data)
+        if not slots:
+            return translate_func(text)
+
+        with self.lock:
+            entry = self.entries.get(template)
+            owner = entry is None
+            if owner:
+                entry = {"event": threading.Event(), "translation": None, "ok": False, "uses": 0}
+                self.entries[template] = entry
+        if owner:
+            try:
+                translation = translate_func(template)
+                entry["translation"] = translation
+                entry["ok"] = check_template_translation(translation, len(slots))
+            finally:
+                entry["event"].set()
+            with self.lock:
+                self.misses += 1
+                if not entry["translation"]:
+                    # 请求失败不代表模板不可靠，移除后由下一个实例重试
+                    self.entries.pop(template, None)
+                elif not entry["ok"]:
+                    self.rejected += 1
+        else:
+            entry["event"].wait()
+
+        # 模板译文没有通过占位符检查时，该模板的所有实例都单独翻译
+        if not entry["ok"]:
+            return translate_func(text)
+        with self.lock:
+            entry["uses"] += 1
+            if not owner:
+                self.hits += 1
+        return fill_template(entry["translation"], slots)
+
+    def stats(self):
+        with self.lock:
+            return {"templates": len(self.entries), "hits": self.hits, "misses": self.misses, "rejected": self.rejected}
+
+# 格式化模板复用统计
+def format_template_stats(stats):
+    return (f"模板复用: 共 {stats['templates']} 个模板，复用 {stats['hits']} 次，"
+            f"{stats['rejected']} 个模板未通过占位符检查")
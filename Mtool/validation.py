@@ -0,0 +1,133 @@
+import queue
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from engine.controlcodes import RPGMAKER_CODES
+
+KANA_PATTERN = re.compile(r'[\u3040-\u309f\u30a0-\u30fa\u30fd-\u30ff]')
+JAPANESE_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4DBF\u4E00-\u9FFF]')
+CHINESE_PATTERN = re.compile(r'[\u4e00-\u9fff]')
+
+# 重试时依次使用的采样参数
+REWORK_SAMPLING = [
+    {"temperature": 0.4, "top_p": 0.6, "frequency_penalty": 0.5},
+    {"temperature": 0.7, "top_p": 0.9, "frequency_penalty": 0.8},
+]
+
+# 检查单条译文，返回问题列表，空列表表示通过
+def validate_translation(source, translation):
+    issues = []
+    if not translation or not translation.strip():
+        return ["empty"]
+    if not JAPANESE_PATTERN.search(source):
+        return issues
+    # 译文中残留较多假名说明没有翻译完整
+    kana = len(KANA_PATTERN.findall(translation))
+    if kana > max(1, len(translation) // 5):
+        issues.append("kana")
+    if not CHINESE_PATTERN.search(translation):
+        issues.append("no_chinese")
+    if len(source) >= 8:
+        ratio = len(translation) / len(source)
+        if ratio < 0.3 or ratio > 3.0:
+            issues.append("length_ratio")
+    if not RPGMAKER_CODES.verify(source, translation):
+        issues.append("control_codes")
+    if source.count("\n") != translation.count("\n"):
+        issues.append("newlines")
+    return issues
+
+# 校验阶段：在进程池中检查每条译文，未通过的条目进入返工队列，由独立线程换采样参数或换endpoint重试
+class ValidationStage:
+    # rework_func(source, index, api_idx, sampling) 返回新的译文
+    def __init__(self, rework_func, api_num, workers=2, rework_workers=1, log=print):
+        self.rework_func = rework_func
+        self.api_num = max(1, api_num)
+        self.log = log
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.rework_queue = queue.Queue()
+        self.writers = {}
+        self.pending = 0
+        self.cond = threading.Condition()
+        self.stats = Counter()
+        for _ in range(rework_workers):
+            threading.Thread(target=self._rework_loop, daemon=True).start()
+
+    # 注册任务文件的写回函数 writer(index, text)
+    def register_task(self, task_name, writer):
+        self.writers[task_name] = writer
+
+    # 提交一条译文进行校验，不阻塞主流程
+    def submit(self, task_name, index, source, translation):
+        with self.cond:
+            self.pending += 1
+            self.stats["checked"] += 1
+        future = self.executor.submit(validate_translation, source, translation)
+        future.add_done_callback(lambda future: self._on_validated(future, task_name, index, source, translation))
+
+    def _on_validated(self, future, task_name, index, source, translation):
+        try:
+            issues = future.result()
+        except Exception as e:
+            self.log(f"校验失败: {e}")
+            issues = []
+        if issues:
+            self.rework_queue.put((task_name, index, source, translation, issues, 1))
+        else:
+            self._finish()
+
+    def _finish(self):
+        with self.cond:
+            self.pending -= 1
+            self.cond.notify_all()
+
+    def _rework_loop(self):
+        while True:
+            task_name, index, source, translation, issues, attempt = self.rework_queue.get()
+            try:
+                self._rework(task_name, index, source, translation, issues, attempt)
+            except Exception as e:
+                self.log(f"返工异常: {e}")
+                self._finish()
+
+    def _rework(self, task_name, index, source, translation, issues, attempt):
+        best, best_issues = translation, issues
+        while attempt <= len(REWORK_SAMPLING):
+            api_idx = (index + attempt) % self.api_num
+            candidate = self.rework_func(source, index, api_idx, REWORK_SAMPLING[attempt - 1])
+            candidate_issues = validate_translation(source, candidate)
+            if len(candidate_issues) < len(best_issues) or "empty" in best_issues:
+                best, best_issues = candidate, candidate_issues
+            if not candidate_issues:
+                break
+            attempt += 1
+
+        with self.cond:
+            self.stats["reworked"] += 1
+            if best_issues:
+                self.stats["failed"] += 1
+        if not best or not best.strip():
+            # 不把空译文写入文件，保留原文
+            best = source
+        if best != translation:
+            self.writers[task_name](index, best)
+        if best_issues:
+            self.log(f"校验未通过: 行号 {index} 问题 {','.join(best_issues)}")
+            with open("validation_failures.log", "a", encoding="utf-8") as log_file:
+                log_file.write(f"文件: {task_name}, 行号: {index}, 问题: {','.join(best_issues)}, 原文: {source}, 翻译: {best}\n")
+        self._finish()
+
+    # 等待所有已提交条目校验和返工完成
+    def join(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.pending == 0)
+
+    def close(self):
+        self.join()
+        self.executor.shutdown()
+
+# 格式化校验统计
+def format_validation_stats(stats):
+    return f"译文校验: 共检查 {stats['checked']} 条，返工 {stats['reworked']} 条，仍未通过 {stats['failed']} 条"
@@ -0,0 +1,80 @@
+import threading
+import time
+
+# 跨文件的全局工作队列
+# task_list中的文件一次全部加载，条目按文件顺序进入同一个队列：大文件末尾的少量慢条目还在执行时，
+# 空闲的线程直接开始翻译后面的文件。各文件分别记录进度、保存检查点，并在全部条目完成时单独收尾
+
+# main.py使用的单文件进度：按提交顺序记录完成情况，检查点为已连续完成的前缀长度，乱序完成时也能安全续传
+# order为条目下标的提交顺序，done为上次运行保存的检查点
+class PrefixProgress:
+    def __init__(self, task_name, order, done=0):
+        self.task_name = task_name
+        self.order = list(order)
+        self.position = {index: position for position, index in enumerate(self.order)}
+        self.done = min(done, len(self.order))
+        self.completed = set()
+        self.count = self.done
+        self.started = time.time()
+
+    # 本次运行需要提交的条目
+    def pending(self):
+        return self.order[self.done:]
+
+    # 记录条目完成，返回文件是否已全部完成
+    def complete(self, index):
+        self.completed.add(self.position[index])
+        self.count += 1
+        while self.done in self.completed:
+            self.completed.remove(self.done)
+            self.done += 1
+        return self.is_finished()
+
+    def is_finished(self):
+        return self.done == len(self.order)
+
+    def stats(self):
+        return {"total": len(self.order), "done": self.count, "checkpoint": self.done, "finished": self.is_finished()}
+
+# main_dev.py使用的多文件范围队列，task为包含task_name和progress（TranslationProgress）的字典
+# 线程优先领取任意文件中未被占用的范围（保留上文），都被占用时才拆分剩余条目最多的范围
+class TaskQueue:
+    def __init__(self):
+        self.tasks = []
+        self.lock = threading.Lock()
+
+    def add_task(self, task):
+        task.setdefault("finished", False)
+        task.setdefault("started", time.time())
+        self.tasks.append(task)
+
+    # 领取一个范围，返回(task, 范围编号)，没有可分配的条目时返回(None, None)
+    def claim(self):
+        for task in self.tasks:
+            thread_id = task["progress"].claim(split=False)
+            if thread_id is not None:
+                return task, thread_id
+        for task in sorted(self.tasks, key=lambda task: task["progress"].largest_remaining(), reverse=True):
+            thread_id = task["progress"].claim()
+            if thread_id is not None:
+                return task, thread_id
+        return None, None
+
+    def has_work(self):
+        return any(task["progress"].has_work() for task in self.tasks)
+
+    # 文件的全部条目完成时返回True，每个文件只返回一次，由调用方保存并收尾
+    def finish(self, task):
+        with self.lock:
+            if task["finished"] or not task["progress"].is_completed():
+                return False
+            task["finished"] = True
+            return True
+
+    def stats(self):
+        return {task["task_name"]: task["progress"].stats() for task in self.tasks}
+
+# 格式化单个文件完成时的统计
+def format_file_done(task_name, total, started):
+    elapsed = time.time() - started
+    return f"任务 {task_name} 翻译完成: {total} 条，用时 {elapsed:.1f} 秒"
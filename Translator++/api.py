@@ -1,23 +1,114 @@
-from collections import Counter, deque
-from concurrent.futures import ThreadPoolExecutor
-from fastapi import FastAPI, Request
-from functools import lru_cache
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from llm import LLM
+from scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, Job, Scheduler
+import asyncio
+import itertools
 import logging
+import os
+import sys
+import threading
+import time
 import uvicorn
 import json
 import re
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from engine.capture import CaptureLog
+from engine.controlcodes import TRANSLATOR_PP_CODES
+from engine.tmpack import TranslationMemory
+
 port = 1500
 logging.basicConfig(filename="log.log")
-history_deque = deque(maxlen=3)
-llm = LLM("galtransl", "Sakura-GalTransl-7B-v3-Q5_K_S.gguf", 8, ["0", "1", "2", "3", "0", "1", "2", "3"])
+# 每个会话保留的上文条数
+history_size = 3
+# 最多保留的会话数，超出后淘汰最久未使用的会话
+session_limit = 256
+sessions = OrderedDict()
+session_lock = threading.Lock()
+# 纯CPU部署：按物理核心为各工作进程分配线程并绑定核心（多路服务器上不跨NUMA节点），
+# cpu_threads为每个进程的线程数，为None时平均分配，可用python cpu_layout.py sweep选择进程数和线程数
+cpu_mode = False
+cpu_threads = None
+# 工作进程数，同时也是调度器提交给进程池的最大任务数
+num_process = 8
+# 模型在后台并行加载，第一个工作进程就绪后即开始处理请求
+llm = LLM("galtransl", "Sakura-GalTransl-7B-v3-Q5_K_S.gguf", num_process, ["0", "1", "2", "3", "0", "1", "2", "3"], block=False,
+          cpu=cpu_mode, threads_per_process=cpu_threads)
+# 进程池前的调度器，同时执行的任务数等于工作进程数
+scheduler = Scheduler(llm, num_process)
+# 检查客户端是否断开的间隔（秒）
+disconnect_poll_interval = 1.0
+cache_size = 1024
+# 单个SG标签翻译失败时的重试次数
+unit_retries = 2
+# 缓存持久化文件，重启后预热期间缓存命中的文本可以立即返回
+cache_file = "cache.jsonl"
+translation_cache = OrderedDict()
+cache_lock = threading.Lock()
+# cache_file当前的行数，追加到cache_size的2倍时压缩为只保留缓存中的条目
+cache_file_lines = 0
+# 录制每次翻译请求、响应和耗时的文件（.jsonl.gz），为None时不录制，可用engine.replay离线回放
+capture_file = None
+capture_log = CaptureLog(capture_file) if capture_file else None
+# 只读翻译记忆包（由python -m engine.tmpack build构建），为None时不使用，命中的文本不再请求模型
+memory_pack = None
+translation_memory = TranslationMemory(memory_pack) if memory_pack else None
 app = FastAPI()
 # 全局字典，只会将相关项传入模型
 global_dicts = [
     {"src": "原文", "dst": "译文", "info": "说明（可选）"}
 ]
 
+def load_cache():
+    """从cache_file恢复翻译缓存，并压缩文件只保留最近的cache_size条"""
+    if not os.path.exists(cache_file):
+        return
+    with cache_lock:
+        with open(cache_file, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    text, history, dicts, result = json.loads(line)
+                except ValueError:
+                    continue
+                key = (text, tuple(history), tuple(tuple(item) for item in dicts))
+                translation_cache[key] = result
+                translation_cache.move_to_end(key)
+                if len(translation_cache) > cache_size:
+                    translation_cache.popitem(last=False)
+        compact_cache()
+
+def compact_cache():
+    """将cache_file重写为只包含当前缓存中的条目，调用方需持有cache_lock
+
+    Note:
+        先写入临时文件再替换，压缩过程中进程退出不会丢失原有的缓存文件
+    """
+    global cache_file_lines
+    temp_file = cache_file + ".tmp"
+    with open(temp_file, "w", encoding="utf-8") as file:
+        for key, result in translation_cache.items():
+            file.write(json.dumps([*key, result], ensure_ascii=False) + "\n")
+    os.replace(temp_file, cache_file)
+    cache_file_lines = len(translation_cache)
+
+def save_cache_entry(key: tuple, result: str):
+    """追加一条翻译缓存到cache_file，文件行数达到cache_size的2倍时压缩，调用方需持有cache_lock"""
+    global cache_file_lines
+    with open(cache_file, "a", encoding="utf-8") as file:
+        file.write(json.dumps([*key, result], ensure_ascii=False) + "\n")
+    cache_file_lines += 1
+    if cache_file_lines >= 2 * cache_size:
+        compact_cache()
+
+@app.on_event("startup")
+def startup():
+    """服务启动时加载翻译缓存，导入模块时不读写文件"""
+    load_cache()
+
 def contains_japanese(text):
     """检查文本是否包含日文片假名
     
@@ -32,14 +123,27 @@ def contains_japanese(text):
             return True
     return False
 
-@lru_cache(maxsize=1024)
-def api_translate(text: str, history: tuple[str], dicts: tuple[str]) -> str:
+def lookup_memory(text: str) -> str:
+    """在只读翻译记忆包中查找原文
+    
+    Args:
+        text (str): 原文（控制符替换前）
+        
+    Returns:
+        str | None: 记录的译文，未配置记忆包或没有该原文时返回None
+    """
+    if translation_memory is None:
+        return None
+    return translation_memory.get(text)
+
+def api_translate(text: str, history: tuple[str], dicts: tuple[dict], job: Job) -> str:
     """带缓存的单条文本翻译核心函数
     
     Args:
         text (str): 待翻译文本（自动替换全角空格为半角空格）
         history (tuple[str]): 历史翻译上下文（需传入可哈希的tuple）
-        dicts (tuple[str]): 局部字典（需传入可哈希的tuple）
+        dicts (tuple[dict]): 局部字典
+        job (Job): 任务所属的请求，决定调度优先级并支持取消
         
     Returns:
         str: 翻译后的中文文本
@@ -47,66 +151,66 @@ def api_translate(text: str, history: tuple[str], dicts: tuple[str]) -> str:
     Note:
         1. 使用LRU缓存（最多1024条）加速重复文本翻译
         2. 非日文文本会直接返回原内容
-        3. 实际调用llm.translate()执行翻译
+        3. 通过scheduler排队后调用llm.translate()执行翻译
+        4. 请求被取消时抛出CancelledError
     """
     text = text.replace("\u3000", "  ")
     if not contains_japanese(text):
         return text
+    key = (text, history, tuple((item["src"], item["dst"]) for item in dicts))
+    with cache_lock:
+        if key in translation_cache:
+            translation_cache.move_to_end(key)
+            return translation_cache[key]
     gpt_dicts = list(dicts)
     for item in global_dicts:
         if item["src"] in text:
             gpt_dicts.append(item)
-    result = llm.translate(text, history, gpt_dicts).get()
+    result = scheduler.submit(job, text, history, gpt_dicts).result()
+    with cache_lock:
+        translation_cache[key] = result
+        save_cache_entry(key, result)
+        if len(translation_cache) > cache_size:
+            translation_cache.popitem(last=False)
     return result
 
-def text_translate(text: str, history: tuple[str]) -> str:
+def text_translate(text: str, history: tuple[str], job: Job) -> str:
     """预处理文本并执行翻译
     
     Args:
         text (str): 可能包含`${dat[数字]}`格式控制符的文本
         history (tuple[str]): 历史翻译上下文（需传入可哈希的tuple）
+        job (Job): 任务所属的请求
         
     Returns:
         str: 翻译后的文本
         
     Note:
-        1. 自动转换 ${dat[1]} ↔ 控制符1 的格式
-        2. 校验翻译前后控制符数量和行数是否一致，最多重试10次
-        3. 超过最多重试次数时会记录警告日志
+        1. 翻译记忆包中有该原文时直接返回记录的译文
+        2. 自动转换 ${dat[1]} ↔ 控制符1 的格式
+        3. 校验翻译前后控制符数量和行数是否一致，最多重试10次
+        4. 超过最多重试次数时会记录警告日志
     """
-    pattern1 = r"\$\{dat\[(\d+)\]\}"
-    pattern2 = r"控制符(\d+)"
-
+    remembered = lookup_memory(text)
+    if remembered is not None:
+        return remembered
     # 重试时控制符会继续向后标号，以提供不同的原文来提高成功率
     counter = 0
-    def replace_to_chinese(match):
-        nonlocal counter
-        counter += 1
-        placeholder = "控制符" + str(counter)
-        dat_mapping[placeholder] = match.group(0)
-        return placeholder
-    
-    def replace_back_to_dat(match):
-        placeholder = match.group(0)
-        return dat_mapping.get(placeholder, placeholder)
-
     retry = True
     retry_counter = 0
     while retry and retry_counter < 10:
-        dat_mapping = {}
         retry = False
         retry_counter += 1
 
-        before = Counter(re.findall(pattern1, text))
         line_num = len(text.splitlines())
-        result = re.sub(pattern1, replace_to_chinese, text)
-        dat_dicts = ({"src": key, "dst": key} for key in dat_mapping.keys())
-        result = api_translate(result, history, dat_dicts)
-        result = re.sub(pattern2, replace_back_to_dat, result)
-        after = Counter(re.findall(pattern1, result))
-
-        if before != after:
-            # logging.warning(f"{before} != {after}\n{text}\n{result}")
+        result, dat_mapping = TRANSLATOR_PP_CODES.protect(text, counter + 1)
+        counter += len(dat_mapping)
+        dat_dicts = tuple({"src": key, "dst": key} for key in dat_mapping.keys())
+        result = api_translate(result, history, dat_dicts, job)
+        result = TRANSLATOR_PP_CODES.restore(result, dat_mapping)
+
+        if not TRANSLATOR_PP_CODES.verify(text, result):
+            # logging.warning(f"control codes mismatch\n{text}\n{result}")
             retry = True
         elif line_num != len(result.splitlines()):
             # logging.warning(f"line_num mismatch\n{text}\n{result}")
@@ -118,34 +222,232 @@ def text_translate(text: str, history: tuple[str]) -> str:
 
     return result
 
-def data_translate(data: str, history: tuple[str]) -> str:
+def unit_translate(text: str, history: tuple[str], job: Job) -> str:
+    """翻译一个子单元，执行失败时只重试该单元
+    
+    Args:
+        text (str): 待翻译文本
+        history (tuple[str]): 历史翻译上下文（需传入可哈希的tuple）
+        job (Job): 任务所属的请求
+        
+    Returns:
+        str: 翻译后的文本
+        
+    Note:
+        请求被取消时不重试，直接抛出CancelledError
+    """
+    for attempt in range(unit_retries + 1):
+        try:
+            return text_translate(text, history, job)
+        except CancelledError:
+            raise
+        except Exception as e:
+            if attempt == unit_retries:
+                raise
+            logging.warning(f"unit retry {attempt + 1}: {e}\n{text}")
+
+def data_translate(data: str, history: tuple[str], job: Job) -> str:
     """处理包含<SG标签>的复合数据翻译
     
     Args:
         data (str): 可能包含<SG...>标签的文本
         history (tuple[str]): 历史翻译上下文（需传入可哈希的tuple）
+        job (Job): 任务所属的请求
         
     Returns:
         str: 翻译后的完整文本
         
     Note:
-        1. 优先提取<SG...:内容>结构进行分段翻译
+        1. 优先提取<SG...:内容>结构，各标签内容作为一组子单元并发翻译
         2. 无标签时直接调用text_translate
-        3. 保持原标签结构不变只翻译内容部分
+        3. 按原文中的位置拼回译文，保持原标签结构不变只翻译内容部分
     """
     pattern = r"<SG.*?>"
-    finds = re.findall(pattern, data, re.DOTALL)
-    if len(finds) > 0:
-        for raw in finds:
-            index = raw.find(":")
-            if index == -1:
-                continue
-            text = raw[index + 1 : -1]
-            text = text_translate(text, history)
-            data = data.replace(raw, f"{raw[:index]}:{text}>")
-    else:
-        data = text_translate(data, history)
-    return data
+    spans = []
+    for match in re.finditer(pattern, data, re.DOTALL):
+        index = match.group(0).find(":")
+        if index != -1:
+            spans.append((match.start() + index + 1, match.end() - 1))
+    if not spans:
+        if re.search(pattern, data, re.DOTALL):
+            return data
+        return unit_translate(data, history, job)
+    units = [data[start:end] for start, end in spans]
+    with ThreadPoolExecutor(len(units)) as executor:
+        results = list(executor.map(unit_translate, units, itertools.repeat(history), itertools.repeat(job)))
+    pieces = []
+    last = 0
+    for (start, end), result in zip(spans, results):
+        pieces.append(data[last:start])
+        pieces.append(result)
+        last = end
+    pieces.append(data[last:])
+    return "".join(pieces)
+
+def batch_translate(data: list[str], history: list[tuple[str]], job: Job) -> list[str]:
+    """并发翻译一批文本
+    
+    Args:
+        data (list[str]): 待翻译文本列表
+        history (list[tuple[str]]): 每条文本对应的历史翻译上下文
+        job (Job): 任务所属的请求
+        
+    Returns:
+        list[str]: 翻译结果，顺序与输入一致
+    """
+    with ThreadPoolExecutor(max(1, len(data))) as executor:
+        return list(executor.map(data_translate, data, history, itertools.repeat(job)))
+
+def get_client_id(request: Request) -> str:
+    """获取用于公平排队的客户端标识，优先使用请求头X-Client-Id，否则使用客户端地址"""
+    client_id = request.headers.get("x-client-id")
+    if client_id:
+        return client_id
+    return request.client.host if request.client else "unknown"
+
+def get_session_id(request: Request, body: dict) -> str:
+    """获取上文所属的会话，优先使用请求头X-Session-Id，其次是请求体中的session_id或context（Translator++的上下文路径），否则使用客户端标识"""
+    session_id = request.headers.get("x-session-id") or body.get("session_id") or body.get("context")
+    if session_id:
+        return str(session_id)
+    return get_client_id(request)
+
+def build_history(session_id: str, data: list[str]) -> list[tuple[str]]:
+    """按会话生成每条文本的上文，并把本批文本追加到会话历史中
+    
+    Args:
+        session_id (str): 会话标识
+        data (list[str]): 本批待翻译文本，顺序与文件中一致
+        
+    Returns:
+        list[tuple[str]]: 每条文本对应的上文，只取决于同一会话此前的文本
+        
+    Note:
+        会话按LRU保留最多session_limit个，每个会话保留最近history_size条文本
+    """
+    with session_lock:
+        if session_id in sessions:
+            sessions.move_to_end(session_id)
+        else:
+            sessions[session_id] = deque(maxlen=history_size)
+            if len(sessions) > session_limit:
+                sessions.popitem(last=False)
+        history_deque = sessions[session_id]
+        history = []
+        for d in data:
+            history.append(tuple(history_deque))
+            history_deque.append(d)
+    return history
+
+def record_capture(request: Request, path: str, body: dict, response, start: float, error: Exception = None):
+    """开启录制时记录一次请求，失败的请求记录异常"""
+    if capture_log is None:
+        return
+    error = None if error is None else f"{type(error).__name__}: {error}"
+    capture_log.record(get_client_id(request), path, body, response, start, time.time() - start, error)
+
+async def run_job(request: Request, job: Job, func, *args):
+    """在线程池中执行翻译，并在客户端断开连接时取消排队中的任务
+    
+    Args:
+        request (Request): FastAPI请求对象
+        job (Job): 任务所属的请求
+        func (callable): 实际执行翻译的同步函数
+        *args: 传给func的参数
+        
+    Returns:
+        func的返回值
+        
+    Note:
+        客户端断开（包括客户端超时）后排队中的任务全部取消，已在执行的任务会继续完成并写入缓存
+    """
+    task = asyncio.ensure_future(run_in_threadpool(func, *args))
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=disconnect_poll_interval)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            cancelled = scheduler.cancel(job)
+            logging.warning(f"client {job.client_id} disconnected, cancelled {cancelled} queued tasks")
+            # 等待线程结束，避免遗留未取回的异常
+            await asyncio.wait({task})
+            raise HTTPException(status_code=499, detail="client disconnected")
+
+def get_stream_format(request: Request) -> str:
+    """获取批量接口的流式返回格式，URL参数stream优先，其次按Accept请求头判断
+    
+    Returns:
+        str: "ndjson"、"sse"，不使用流式返回时为None
+    """
+    stream = request.query_params.get("stream")
+    if stream in ("ndjson", "sse"):
+        return stream
+    accept = request.headers.get("accept", "")
+    if "application/x-ndjson" in accept:
+        return "ndjson"
+    if "text/event-stream" in accept:
+        return "sse"
+    return None
+
+async def stream_job(request: Request, job: Job, body: dict, data: list[str], history: list[tuple[str]], stream_format: str, start: float):
+    """并发翻译一批文本，每条完成后立即按流式格式输出
+    
+    Args:
+        request (Request): FastAPI请求对象
+        job (Job): 任务所属的请求
+        body (dict): 请求体，用于录制
+        data (list[str]): 待翻译文本列表
+        history (list[tuple[str]]): 每条文本对应的历史翻译上下文
+        stream_format (str): "ndjson"或"sse"
+        start (float): 请求开始时间
+        
+    Yields:
+        str: 每条完成的文本输出一行{"index": 位置, "text": 译文}，失败的文本为{"index": 位置, "error": 异常}，
+        全部完成后输出{"done": true, "count": 条数, "errors": 失败条数}
+        
+    Note:
+        1. 按完成顺序输出，客户端按index放回原位置，可以随时保存已完成的部分
+        2. 单条失败不影响其它文本
+        3. 客户端断开后排队中的任务全部取消，已在执行的任务会继续完成并写入缓存
+    """
+    def encode(item: dict) -> str:
+        line = json.dumps(item, ensure_ascii=False)
+        return f"data: {line}\n\n" if stream_format == "sse" else line + "\n"
+
+    executor = ThreadPoolExecutor(max(1, len(data)))
+    tasks = {asyncio.wrap_future(executor.submit(data_translate, d, h, job)): index for index, (d, h) in enumerate(zip(data, history))}
+    pending = set(tasks)
+    results = [None] * len(data)
+    errors = 0
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=disconnect_poll_interval, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                index = tasks[task]
+                try:
+                    results[index] = task.result()
+                    yield encode({"index": index, "text": results[index]})
+                except Exception as e:
+                    errors += 1
+                    yield encode({"index": index, "error": f"{type(e).__name__}: {e}"})
+            if not done and await request.is_disconnected():
+                break
+    finally:
+        # 客户端断开时StreamingResponse会取消该生成器，同样在此取消排队中的任务
+        if pending:
+            cancelled = scheduler.cancel(job)
+            logging.warning(f"client {job.client_id} disconnected, cancelled {cancelled} queued tasks")
+            # 不再等待剩余结果，已在执行的任务会继续完成并写入缓存
+            for task in pending:
+                task.cancel()
+            record_capture(request, "/v1/chat/completions", body, None, start, ConnectionError("client disconnected"))
+        executor.shutdown(wait=False)
+    if pending:
+        return
+    yield encode({"done": True, "count": len(data), "errors": errors})
+    if stream_format == "sse":
+        yield "data: [DONE]\n\n"
+    record_capture(request, "/v1/chat/completions", body, {"choices": [{"message": {"content": json.dumps(results)}}]}, start)
 
 @app.post("/v1/chat/completions")
 async def read_item(request: Request):
@@ -169,34 +471,115 @@ async def read_item(request: Request):
                 }
             }]
         }
+        URL参数stream=ndjson或sse（或Accept请求头为application/x-ndjson、text/event-stream）时改为流式返回，
+        每条文本完成后立即输出，格式见stream_job
         
     Note:
         1. 使用ThreadPoolExecutor实现多文本并发翻译
-        2. 维护全局history_deque保存最近3条历史记录
-        3. 每个文本会附带其之前3条文本作为上文
+        2. 按会话（X-Session-Id请求头、请求体中的session_id或context，默认为客户端）分别保存最近3条历史记录
+        3. 每个文本会附带同一会话中其之前3条文本作为上文，与其它会话的请求到达顺序无关
+        4. 以批量优先级排队，同一优先级内各客户端公平轮询
+        5. 客户端断开后排队中的任务会被取消
+    """
+    start = time.time()
+    body = await request.json()
+    data = json.loads(body["messages"][0]["content"])
+    history = build_history(get_session_id(request, body), data)
+    job = Job(get_client_id(request), PRIORITY_BATCH)
+    stream_format = get_stream_format(request)
+    if stream_format is not None:
+        media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+        return StreamingResponse(stream_job(request, job, body, data, history, stream_format, start), media_type=media_type)
+    try:
+        data = await run_job(request, job, batch_translate, data, history, job)
+    except Exception as e:
+        record_capture(request, "/v1/chat/completions", body, None, start, e)
+        raise
+    response = {"choices": [{"message": {"content": json.dumps(data)}}]}
+    record_capture(request, "/v1/chat/completions", body, response, start)
+    return response
+
+@app.get("/health")
+def health():
+    """健康检查与就绪状态API端点（GET方法）
+    
+    Returns:
+        JSONResponse: 至少一个工作进程就绪时返回200，否则返回503，内容包括：
+        {
+            "ready": true,
+            "ready_workers": 3,
+            "total_workers": 8,
+            "cache_entries": 1024,
+            "sessions": 12,
+            "memory": {...},  # 翻译记忆包的条目数和命中情况，未配置时为null
+            "workers": [...],  # 各工作进程状态
+            "budget": {...},  # 生成预算的长度比例和达到上限的次数
+            "scheduler": {...}  # 调度器排队情况
+        }
+    """
+    stats = llm.stats()
+    with cache_lock:
+        cache_entries = len(translation_cache)
+    with session_lock:
+        session_count = len(sessions)
+    content = {
+        "ready": stats["ready_workers"] > 0,
+        "ready_workers": stats["ready_workers"],
+        "total_workers": len(stats["workers"]),
+        "queue_depth": stats["queue_depth"],
+        "cache_entries": cache_entries,
+        "sessions": session_count,
+        "memory": translation_memory.stats() if translation_memory is not None else None,
+        "workers": stats["workers"],
+        "budget": stats["budget"],
+        "scheduler": scheduler.stats(),
+    }
+    return JSONResponse(content, status_code=200 if content["ready"] else 503)
+
+@app.post("/reload")
+async def reload_model(request: Request):
+    """切换模型文件API端点（POST方法）
+    
+    Args:
+        request (Request): FastAPI请求对象，需包含：
+        {
+            "model_path": "Sakura-GalTransl-7B-v3-Q6_K.gguf"
+        }
+        
+    Returns:
+        dict: 各工作进程的状态
+        
+    Note:
+        工作进程逐个重载，排队中的请求不会被丢弃
     """
     data = await request.json()
-    data = data["messages"][0]["content"]
-    data = json.loads(data)
-    history = []
-    for d in data:
-        history.append(tuple(history_deque))
-        history_deque.append(d)
-    with ThreadPoolExecutor(len(data)) as executor:
-        data = executor.map(data_translate, data, history)
-    return {"choices": [{"message": {"content": json.dumps(list(data))}}]}
+    llm.reload(data["model_path"])
+    return llm.stats()
 
 @app.get("/")
-def read_item(text: str):
+async def read_item(request: Request, text: str):
     """单条文本翻译API端点（GET方法）
     
     Args:
+        request (Request): FastAPI请求对象
         text (str): 通过URL参数传递的待翻译文本
         
     Returns:
         str: 直接返回翻译结果字符串
+        
+    Note:
+        翻译记忆包中有该原文时直接返回，否则以交互优先级排队，总是先于批量任务执行
     """
-    result = api_translate(text, [])
+    start = time.time()
+    job = Job(get_client_id(request), PRIORITY_INTERACTIVE)
+    try:
+        result = lookup_memory(text)
+        if result is None:
+            result = await run_job(request, job, api_translate, text, (), (), job)
+    except Exception as e:
+        record_capture(request, "/", {"text": text}, None, start, e)
+        raise
+    record_capture(request, "/", {"text": text}, result, start)
     return result
 
 if __name__ == '__main__':
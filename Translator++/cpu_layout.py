@@ -0,0 +1,270 @@
+"""
+CPU推理的线程与核心分配
+
+按物理核心把CPU平均分给各工作进程，并把每个进程绑定到分到的核心上，避免多个llama.cpp进程
+都使用默认线程数时超额订阅CPU。多路服务器上每个进程只使用同一NUMA节点的核心。
+
+    # 查看按当前机器拓扑为4个进程分配的核心
+    python cpu_layout.py show 4
+
+    # 对不同的进程数×线程数组合做基准测试，选出吞吐最高的组合
+    python cpu_layout.py sweep Sakura-GalTransl-7B-v3-Q5_K_S.gguf
+"""
+
+import argparse
+import json
+import os
+import time
+
+def _read_int(path: str):
+    try:
+        with open(path, "r") as file:
+            return int(file.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def _parse_cpu_list(text: str) -> list[int]:
+    """
+    解析"0-3,8-11"格式的CPU列表
+    """
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+def read_topology() -> list[dict]:
+    """
+    读取当前进程可用的物理核心
+
+    Returns:
+        list[dict]: 按NUMA节点和CPU编号排序的物理核心，每个包含:
+            - node: NUMA节点编号
+            - cpus: 该核心的逻辑CPU（超线程）编号
+
+    Note:
+        只在Linux上读取/sys，其它系统把每个逻辑CPU视为一个核心且都属于节点0
+    """
+    if hasattr(os, "sched_getaffinity"):
+        allowed = sorted(os.sched_getaffinity(0))
+    else:
+        allowed = list(range(os.cpu_count() or 1))
+    node_of = {}
+    node_dir = "/sys/devices/system/node"
+    if os.path.isdir(node_dir):
+        for name in os.listdir(node_dir):
+            if name.startswith("node") and name[4:].isdigit():
+                try:
+                    with open(os.path.join(node_dir, name, "cpulist"), "r") as file:
+                        for cpu in _parse_cpu_list(file.read()):
+                            node_of[cpu] = int(name[4:])
+                except OSError:
+                    continue
+    cores = {}
+    for cpu in allowed:
+        topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+        package = _read_int(topology + "/physical_package_id")
+        core = _read_int(topology + "/core_id")
+        key = (package, core) if package is not None and core is not None else ("cpu", cpu)
+        cores.setdefault(key, {"node": node_of.get(cpu, 0), "cpus": []})["cpus"].append(cpu)
+    return sorted(cores.values(), key=lambda core: (core["node"], core["cpus"][0]))
+
+def plan_cpu_layout(num_process: int, threads_per_process: int = None, topology: list[dict] = None) -> list[dict]:
+    """
+    为各工作进程分配物理核心
+
+    Args:
+        num_process (int): 工作进程数
+        threads_per_process (int, optional): 每个进程使用的物理核心数，默认平均分配所有核心
+        topology (list[dict], optional): read_topology的结果，默认读取当前机器
+
+    Returns:
+        list[dict]: 每个进程的分配，包含:
+            - node: NUMA节点编号
+            - cores: 分到的物理核心数
+            - cpus: 绑定的逻辑CPU编号（包含超线程）
+            - n_threads: llama.cpp的线程数，等于物理核心数
+            - numa: 是否为多节点机器
+
+    Note:
+        - 进程按各节点的核心数比例分到节点上，一个进程的核心不跨节点
+        - 进程数多于某节点的核心数时，该节点上的进程轮流共用核心
+        - 指定threads_per_process时超出节点核心数的部分按节点核心数截断
+    """
+    topology = topology if topology is not None else read_topology()
+    nodes = {}
+    for core in topology:
+        nodes.setdefault(core["node"], []).append(core)
+    node_ids = sorted(nodes)
+    total = len(topology)
+    # 按核心数比例分配进程数，余数给小数部分最大的节点
+    shares = [num_process * len(nodes[node]) / total for node in node_ids]
+    counts = [int(share) for share in shares]
+    for index in sorted(range(len(node_ids)), key=lambda i: shares[i] - counts[i], reverse=True)[:num_process - sum(counts)]:
+        counts[index] += 1
+    layouts = []
+    for node, count in zip(node_ids, counts):
+        cores = nodes[node]
+        for i in range(count):
+            if threads_per_process:
+                size = min(threads_per_process, len(cores))
+                start = i * size
+            else:
+                size = max(1, len(cores) // count)
+                # 不能整除时前几个进程各多分一个核心
+                extra = len(cores) % count if count <= len(cores) else 0
+                start = i * size + min(i, extra)
+                size += 1 if i < extra else 0
+            chosen = [cores[(start + offset) % len(cores)] for offset in range(size)]
+            layouts.append({
+                "node": node,
+                "cores": len(chosen),
+                "cpus": sorted(cpu for core in chosen for cpu in core["cpus"]),
+                "n_threads": len(chosen),
+                "numa": len(node_ids) > 1,
+            })
+    return layouts
+
+def apply_cpu_layout(layout: dict):
+    """
+    在工作进程中绑定核心并限制线程数，需在加载模型前调用
+
+    Args:
+        layout (dict): plan_cpu_layout返回的一项
+    """
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, layout["cpus"])
+    # 使用OpenMP编译的llama.cpp按该变量创建线程
+    os.environ["OMP_NUM_THREADS"] = str(layout["n_threads"])
+
+def llama_cpu_kwargs(layout: dict) -> dict:
+    """
+    生成CPU推理时传给llama_cpp.Llama的参数
+
+    Args:
+        layout (dict): plan_cpu_layout返回的一项
+
+    Returns:
+        dict: n_gpu_layers、n_threads、n_threads_batch，多节点机器上另加numa
+    """
+    kwargs = {"n_gpu_layers": 0, "n_threads": layout["n_threads"], "n_threads_batch": layout["n_threads"]}
+    if layout["numa"]:
+        # 2为GGML_NUMA_STRATEGY_ISOLATE，线程只运行在进程启动时所在的节点上
+        kwargs["numa"] = 2
+    return kwargs
+
+SAMPLE_TEXTS = [
+    "はい",
+    "ポーション",
+    "HPを100回復する。",
+    "この先は危険だ。準備ができたら声をかけてくれ。",
+    "村の外れにある古い塔には、昔から魔物が住み着いていると言われている。",
+    "「お前がここに来ることは分かっていた。さあ、剣を抜け！」",
+    "敵全体に炎属性の大ダメージを与え、一定確率で火傷状態にする。",
+    "今日はもう遅いから、宿屋で休んでいきなさい。明日になったら村長の家を訪ねるといいよ。",
+]
+
+def default_sweep(topology: list[dict]) -> list[tuple[int, int]]:
+    """
+    生成默认的进程数×线程数组合：进程数取1、2、4……直到核心数，每组合用满所有核心
+
+    Note:
+        进程的核心不跨NUMA节点，多节点机器上只保留各进程都能在节点内分到全部线程的组合，
+        例如2个节点各8核时不测试1×16
+    """
+    cores = len(topology)
+    nodes = len({core["node"] for core in topology})
+    counts = sorted({1, nodes} | {2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores})
+    combinations = []
+    for count in counts:
+        threads = max(1, cores // count)
+        if all(layout["n_threads"] == threads for layout in plan_cpu_layout(count, threads, topology)):
+            combinations.append((count, threads))
+    return combinations
+
+def sweep(model_path: str, combinations: list[tuple[int, int]], texts: list[str], rounds: int) -> list[dict]:
+    """
+    依次以各组合启动进程池，并发提交样本文本，统计吞吐
+
+    Args:
+        model_path (str): 模型文件路径
+        combinations (list[tuple[int, int]]): (进程数, 每进程线程数)
+        texts (list[str]): 样本文本
+        rounds (int): 每个组合提交的轮数，每轮提交全部样本
+
+    Returns:
+        list[dict]: 每个组合的进程数、线程数、加载耗时、请求数、耗时、每秒请求数和每秒生成token数，
+            线程数为各进程实际使用的线程数（指定的线程数超过节点核心数时会被截断），各进程不同时为列表
+    """
+    from llm import LLM
+    from engine.prompt import make_request
+
+    results = []
+    for num_process, threads in combinations:
+        started = time.time()
+        llm = LLM("sakura", model_path, num_process, None, block=True, cpu=True, threads_per_process=threads)
+        load_seconds = time.time() - started
+        applied = sorted({worker["n_threads"] for worker in llm.stats()["workers"]})
+        try:
+            # 预热，每个进程执行一次
+            for future in [llm.chat_completion(make_request(texts[0], "SakuraV1_0")) for _ in range(num_process)]:
+                future.get()
+            requests = [make_request(text, "SakuraV1_0") for _ in range(rounds) for text in texts]
+            started = time.time()
+            responses = [future.get() for future in [llm.chat_completion(request) for request in requests]]
+            elapsed = time.time() - started
+        finally:
+            llm.close()
+        tokens = sum(response.get("usage", {}).get("completion_tokens", 0) for response in responses)
+        results.append({
+            "processes": num_process,
+            "threads": applied[0] if len(applied) == 1 else applied,
+            "load_seconds": round(load_seconds, 2),
+            "requests": len(requests),
+            "seconds": round(elapsed, 2),
+            "requests_per_second": round(len(requests) / elapsed, 2),
+            "tokens_per_second": round(tokens / elapsed, 1),
+        })
+        print(json.dumps(results[-1], ensure_ascii=False))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU推理的核心分配和基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    show_parser = subparsers.add_parser("show", help="输出当前机器上的核心分配")
+    show_parser.add_argument("processes", type=int, help="工作进程数")
+    show_parser.add_argument("--threads", type=int, help="每个进程的线程数，默认平均分配")
+    sweep_parser = subparsers.add_parser("sweep", help="对不同的进程数×线程数组合做基准测试")
+    sweep_parser.add_argument("model", help="模型文件路径")
+    sweep_parser.add_argument("--layouts", help="逗号分隔的 进程数x线程数，如1x16,2x8,4x4，默认用满所有核心的各种组合")
+    sweep_parser.add_argument("--texts", help="样本文本，Mtool的JSON文件或每行一条的文本文件，默认使用内置样本")
+    sweep_parser.add_argument("--rounds", type=int, default=2, help="每个组合提交全部样本的轮数")
+    args = parser.parse_args()
+
+    topology = read_topology()
+    nodes = len({core["node"] for core in topology})
+    print(f"可用物理核心 {len(topology)} 个，逻辑CPU {sum(len(core['cpus']) for core in topology)} 个，NUMA节点 {nodes} 个")
+    if args.command == "show":
+        for worker_id, layout in enumerate(plan_cpu_layout(args.processes, args.threads, topology)):
+            print(f"进程 {worker_id}: 节点 {layout['node']}，线程 {layout['n_threads']}，CPU {layout['cpus']}")
+        return
+
+    if args.layouts:
+        combinations = [tuple(int(value) for value in item.split("x")) for item in args.layouts.split(",")]
+    else:
+        combinations = default_sweep(topology)
+    texts = SAMPLE_TEXTS
+    if args.texts:
+        with open(args.texts, "r", encoding="utf-8") as file:
+            texts = list(json.load(file)) if args.texts.endswith(".json") else [line.strip() for line in file if line.strip()]
+    results = sweep(args.model, combinations, texts, args.rounds)
+    best = max(results, key=lambda result: result["tokens_per_second"])
+    print(f"吞吐最高: {best['processes']} 个进程 × {best['threads']} 线程，{best['tokens_per_second']} token/s，{best['requests_per_second']} 请求/s")
+
+if __name__ == "__main__":
+    main()
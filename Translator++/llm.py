@@ -1,94 +1,167 @@
+from concurrent.futures import Future, as_completed
 from llama_cpp import Llama
-from multiprocessing import Pool
+from multiprocessing import Process, Queue
+import itertools
 import os
+import pickle
+import sys
+import threading
+import time
 
-def _init_worker(model_path: str, cuda_device: str):
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cpu_layout import apply_cpu_layout, llama_cpu_kwargs, plan_cpu_layout
+from engine.budget import GenerationBudget
+from engine.prompt import llama_chat_kwargs, make_request
+
+def _init_worker(model_path: str, cuda_device: str, cpu_layout: dict = None):
     """
     初始化工作进程的LLM模型
 
     Args:
         model_path (str): 模型文件路径
         cuda_device (str): 指定使用的CUDA设备ID
+        cpu_layout (dict, optional): CPU推理时分到的核心，见cpu_layout.plan_cpu_layout，为None时使用GPU
     """
     global worker_model
-    print(f"PID: {os.getpid()} CUDA: {cuda_device}")
-    os.environ["CUDA_VISIBLE_DEVICES"] = cuda_device
-    worker_model = Llama(model_path, n_gpu_layers=-1, n_ctx=2048, verbose=False)
+    if cpu_layout is None:
+        print(f"PID: {os.getpid()} CUDA: {cuda_device}")
+        os.environ["CUDA_VISIBLE_DEVICES"] = cuda_device
+        kwargs = {"n_gpu_layers": -1}
+    else:
+        print(f"PID: {os.getpid()} CPU: {cpu_layout['cpus']} threads: {cpu_layout['n_threads']}")
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+        apply_cpu_layout(cpu_layout)
+        kwargs = llama_cpu_kwargs(cpu_layout)
+    # use_mmap让同一机器上的多个进程共享页缓存中的模型权重
+    worker_model = Llama(model_path, n_ctx=2048, use_mmap=True, verbose=False, **kwargs)
 
-def _get_glossary(gpt_dicts: list[dict]) -> str:
+def _prefetch_model(model_path: str):
     """
-    将术语字典列表格式化为字符串
+    预读模型文件到页缓存，使并行启动的工作进程不必各自从磁盘读取权重
 
     Args:
-        gpt_dicts (list[dict]): 术语字典列表，每个字典应包含:
-            - src: 源语言术语
-            - dst: 目标语言翻译
-            - info(可选): 附加信息
+        model_path (str): 模型文件路径
+    """
+    try:
+        with open(model_path, "rb") as file:
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            while file.read(16 * 1024 * 1024):
+                pass
+    except OSError as e:
+        print(f"prefetch {model_path} failed: {e}")
 
-    Returns:
-        str: 格式化后的术语表字符串，每行格式为"src->dst #info"或"src->dst"
+def _worker_main(worker_id: int, model_path: str, cuda_device: str, cpu_layout: dict, task_queue: Queue, result_queue: Queue):
+    """
+    工作进程主循环：加载模型后逐个执行任务队列中的任务
+
+    Args:
+        worker_id (int): 工作进程编号
+        model_path (str): 模型文件路径
+        cuda_device (str): 指定使用的CUDA设备ID
+        cpu_layout (dict): CPU推理时分到的核心，使用GPU时为None
+        task_queue (Queue): 该进程专属的任务队列
+        result_queue (Queue): 所有进程共享的结果队列
+
+    Note:
+        任务队列消息格式:
+            - ("task", task_id, func, args): 执行func(*args)
+            - ("reload", model_path): 释放当前模型并加载新模型
+            - None: 退出
+    """
+    global worker_model
+    _init_worker(model_path, cuda_device, cpu_layout)
+    result_queue.put(("ready", worker_id, os.getpid(), model_path))
+    while True:
+        message = task_queue.get()
+        if message is None:
+            return
+        if message[0] == "reload":
+            # 先释放旧模型，避免显存中同时存在两份权重
+            worker_model = None
+            _init_worker(message[1], cuda_device, cpu_layout)
+            result_queue.put(("ready", worker_id, os.getpid(), message[1]))
+            continue
+        _, task_id, func, args = message
+        try:
+            result_queue.put(("done", worker_id, task_id, func(*args)))
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError(f"{type(e).__name__}: {e}")
+            result_queue.put(("error", worker_id, task_id, e))
 
-    Example:
-        >>> _get_glossary([{"src": "猫", "dst": "cat", "info": "动物"}])
-        >>> '猫->cat #动物\\n'
+# 模型名称到engine.prompt中模型类型的映射
+MODEL_TYPES = {"sakura": "SakuraV1_0", "galtransl": "GalTranslV3"}
+
+def _process_translate(request: dict, retry_max_tokens: int) -> tuple[str, list[tuple[int, int]]]:
+    """
+    执行单条文本的翻译，生成数达到max_tokens（可能发生退化）时调高frequency_penalty并放宽预算重试一次
+
+    Args:
+        request (dict): 请求体，见engine.prompt.make_request，max_tokens和stop已由主进程的生成预算设置
+        retry_max_tokens (int): 重试时的max_tokens
+
+    Returns:
+        tuple[str, list[tuple[int, int]]]: (翻译后的中文文本, 每次请求的(生成token数, max_tokens))
     """
-    glossary = ""
-    for gpt in gpt_dicts:
-        if "info" in gpt.keys():
-            glossary += "{}->{} #{}\n".format(gpt["src"], gpt["dst"], gpt["info"])
-        else:
-            glossary += "{}->{}\n".format(gpt["src"], gpt["dst"])
-    return glossary
-
-def _process_translate(model_name: str, text: str, history: list[dict] = [], gpt_dicts: list[dict] = []) -> str:
+    attempts = []
+    while True:
+        response = _process_chat(request)
+        attempts.append((response.get("usage", {}).get("completion_tokens", 0), request["max_tokens"]))
+        if len(attempts) > 1 or attempts[-1][0] < request["max_tokens"]:
+            return response["choices"][0]["message"]["content"], attempts
+        request = dict(request, max_tokens=retry_max_tokens, frequency_penalty=0.8)
+
+def _process_chat(request: dict) -> dict:
     """
-    执行单条文本的翻译
+    执行一次OpenAI格式的chat completions请求
 
     Args:
-        model_name (str): 模型名称，支持"sakura"或"galtransl"
-        text (str): 待翻译的日文文本
-        history (list[dict], optional): 对话历史记录
-        gpt_dicts (list[dict], optional): 术语字典列表
+        request (dict): 请求体，见engine.prompt.make_request
 
     Returns:
-        str: 翻译后的中文文本
+        dict: OpenAI格式的响应，包含choices和usage
     """
-    messages = []
-    if model_name == "sakura":
-        messages.append({"role": "system", "content": "你是一个轻小说翻译模型，可以流畅通顺地以日本轻小说的风格将日文翻译成简体中文，并联系上下文正确使用人称代词，不擅自添加原文中没有的代词。"})
-        for item in history:
-            messages.append({"role": "assistant", "content": item})
-        if len(gpt_dicts) == 0:
-            user_prompt = "将下面的日文文本翻译成中文：" + text
-        else:
-            user_prompt = "根据以下术语表（可以为空）：\n"
-            user_prompt += _get_glossary(gpt_dicts)
-            user_prompt += "将下面的日文文本根据对应关系和备注翻译成中文：" + text
-    
-    elif model_name == "galtransl":
-        messages.append({"role": "system", "content": "你是一个视觉小说翻译模型，可以通顺地使用给定的术语表以指定的风格将日文翻译成简体中文，并联系上下文正确使用人称代词，注意"})
-        user_prompt = "历史翻译：\n" + "\n".join(history) + "\n"
-        if len(gpt_dicts) != 0:
-            user_prompt += "参考以下术语表（可为空，格式为src->dst #备注）：\n"
-            user_prompt += _get_glossary(gpt_dicts)
-        user_prompt += "根据以上术语表的对应关系和备注，结合历史剧情和上下文，将下面的文本从日文翻译成简体中文：\n" + text
-    
-    messages.append({"role": "user", "content": user_prompt})
-    if model_name == "sakura":
-        res = worker_model.create_chat_completion(messages=messages, temperature=0.1, top_p=0.3, repeat_penalty=1, max_tokens=512, frequency_penalty=0.2)
-    elif model_name == "galtransl":
-        res = worker_model.create_chat_completion(messages=messages, temperature=0.6, top_p=0.8, repeat_penalty=1, max_tokens=512, frequency_penalty=0.1)
-    return res["choices"][0]["message"]["content"]
+    return worker_model.create_chat_completion(**llama_chat_kwargs(request))
+
+class AsyncResult(Future):
+    """
+    异步结果对象，兼容multiprocessing.pool.AsyncResult的get()接口
+    """
+    def get(self, timeout: float = None):
+        """
+        等待并返回结果
+
+        Args:
+            timeout (float, optional): 最长等待秒数
+
+        Returns:
+            任务返回值，任务失败时抛出对应异常
+        """
+        return self.result(timeout)
 
 class LLM:
     """
     多进程LLM翻译器主类
 
+    由监督线程管理工作进程：每个进程一次只执行一个任务，进程意外退出（OOM、llama.cpp崩溃）时
+    会重新启动并加载模型，其正在执行的任务重新排队。
+
     Attributes:
         model_name (str): 模型名称
-        pool (multiprocessing.Pool): 工作进程池
+        model_path (str): 当前使用的模型文件路径
+        workers (list[dict]): 各工作进程的状态
+        pending (list): 等待分配的任务队列
     """
-    def __init__(self, model_name: str, model_path: str, num_process: int, cuda_device: list[str]):
+    # 进程退出后两次重启之间的最短间隔（秒），避免模型无法加载时反复重启
+    restart_interval = 5
+    # 任务因进程退出而失败的最大重试次数
+    max_task_retries = 1
+
+    def __init__(self, model_name: str, model_path: str, num_process: int, cuda_device: list[str], block: bool = True,
+                 cpu: bool = False, threads_per_process: int = None, max_tokens: int = 512):
         """
         初始化LLM翻译器
 
@@ -96,17 +169,270 @@ class LLM:
             model_name (str): 模型名称 ("sakura" | "galtransl")
             model_path (str): 模型文件路径
             num_process (int): 工作进程数
-            cuda_device (list[str]): 每个进程使用的CUDA设备ID列表
+            cuda_device (list[str]): 每个进程使用的CUDA设备ID列表，cpu为True时忽略
+            block (bool, optional): 是否等待所有工作进程加载完模型后才返回
+            cpu (bool, optional): 纯CPU推理，按物理核心为各进程分配线程并绑定核心
+            threads_per_process (int, optional): CPU推理时每个进程的线程数，默认平均分配所有物理核心
+            max_tokens (int, optional): 翻译请求的生成预算上限，实际的max_tokens按原文长度和已完成译文的长度比例设置
 
         Note:
             - cuda_device列表长度应与num_process匹配
+            - 各工作进程在后台并行加载模型，同时预读模型文件到页缓存
+            - block为False时立即返回，提交的任务在第一个进程就绪后即开始执行
+            - CPU推理时多路服务器上每个进程只使用同一NUMA节点的核心，分配方式见cpu_layout.plan_cpu_layout
         """
         self.model_name = model_name
-        self.pool = Pool(num_process)
-        init_args = [(model_path, cuda_device[i]) for i in range(num_process)]
-        self.pool.starmap(_init_worker, init_args)
-    
-    def translate(self, text: str, history: list[dict] = [], gpt_dicts: list[dict] = []):
+        self.model_path = model_path
+        self.budget = GenerationBudget(max_tokens)
+        self.lock = threading.Condition()
+        self.result_queue = Queue()
+        self.task_ids = itertools.count()
+        self.pending = []
+        self.tasks = {}
+        self.workers = []
+        cpu_layouts = plan_cpu_layout(num_process, threads_per_process) if cpu else [None] * num_process
+        for worker_id in range(num_process):
+            self.workers.append({
+                "worker_id": worker_id,
+                "cuda_device": "" if cpu else cuda_device[worker_id],
+                "cpu_layout": cpu_layouts[worker_id],
+                "process": None,
+                "pid": None,
+                "state": "stopped",
+                "task_id": None,
+                "busy_since": None,
+                "model_path": None,
+                "reload": False,
+                "restarts": 0,
+                "completed": 0,
+                "started_at": 0,
+                "load_started": 0,
+                "load_seconds": None,
+            })
+        self.closed = False
+        threading.Thread(target=_prefetch_model, args=(model_path,), daemon=True).start()
+        with self.lock:
+            for worker in self.workers:
+                self._start_worker(worker)
+        threading.Thread(target=self._result_loop, daemon=True).start()
+        threading.Thread(target=self._monitor_loop, daemon=True).start()
+        if block:
+            self.wait_ready(num_process)
+
+    def _start_worker(self, worker: dict):
+        """启动工作进程并加载当前模型，调用方需持有锁"""
+        worker["task_queue"] = Queue()
+        worker["process"] = Process(
+            target=_worker_main,
+            args=(worker["worker_id"], self.model_path, worker["cuda_device"], worker["cpu_layout"], worker["task_queue"], self.result_queue),
+            daemon=True,
+        )
+        worker["state"] = "loading"
+        worker["reload"] = False
+        worker["started_at"] = time.time()
+        worker["load_started"] = worker["started_at"]
+        worker["process"].start()
+        worker["pid"] = worker["process"].pid
+
+    def _submit(self, func, args: tuple, transform=None) -> AsyncResult:
+        """提交任意任务到工作进程，transform不为None时在主进程中以其返回值作为结果"""
+        future = AsyncResult()
+        with self.lock:
+            task_id = next(self.task_ids)
+            self.tasks[task_id] = {"future": future, "func": func, "args": args, "retries": 0, "transform": transform}
+            self.pending.append(task_id)
+            self._dispatch()
+        return future
+
+    def _dispatch(self):
+        """将排队任务分配给空闲进程，并按需滚动重载模型，调用方需持有锁"""
+        reloading = any(worker["state"] == "loading" and worker["model_path"] is not None for worker in self.workers)
+        for worker in self.workers:
+            if worker["state"] != "ready":
+                continue
+            if worker["reload"] and not reloading:
+                # 一次只重载一个进程，其余进程继续处理排队任务
+                worker["reload"] = False
+                worker["state"] = "loading"
+                worker["load_started"] = time.time()
+                worker["task_queue"].put(("reload", self.model_path))
+                reloading = True
+                continue
+            if worker["reload"] or not self.pending:
+                continue
+            task_id = self.pending.pop(0)
+            task = self.tasks.get(task_id)
+            if task is None:
+                continue
+            worker["state"] = "busy"
+            worker["task_id"] = task_id
+            worker["busy_since"] = time.time()
+            worker["task_queue"].put(("task", task_id, task["func"], task["args"]))
+
+    def _result_loop(self):
+        """接收工作进程消息的线程"""
+        while True:
+            message = self.result_queue.get()
+            kind, worker_id = message[0], message[1]
+            finished = None
+            with self.lock:
+                worker = self.workers[worker_id]
+                if kind == "ready":
+                    _, _, pid, model_path = message
+                    if pid != worker["pid"]:
+                        continue
+                    worker["state"] = "ready"
+                    worker["model_path"] = model_path
+                    worker["load_seconds"] = time.time() - worker["load_started"]
+                    # 加载期间模型又被切换时，需要再次重载
+                    worker["reload"] = worker["reload"] or model_path != self.model_path
+                else:
+                    _, _, task_id, value = message
+                    task = self.tasks.pop(task_id, None)
+                    if worker["task_id"] == task_id:
+                        worker["state"] = "ready"
+                        worker["task_id"] = None
+                        worker["busy_since"] = None
+                        worker["completed"] += 1
+                    if task is not None:
+                        finished = (task, kind, value)
+                self._dispatch()
+                self.lock.notify_all()
+            if finished is not None:
+                task, kind, value = finished
+                if kind == "done" and task["transform"] is not None:
+                    try:
+                        value = task["transform"](value)
+                    except Exception as e:
+                        kind, value = "error", e
+                if kind == "done":
+                    task["future"].set_result(value)
+                else:
+                    task["future"].set_exception(value)
+
+    def _monitor_loop(self):
+        """检测工作进程存活状态，重启退出的进程"""
+        while not self.closed:
+            time.sleep(1)
+            failed = []
+            with self.lock:
+                for worker in self.workers:
+                    process = worker["process"]
+                    if worker["state"] == "dead":
+                        if time.time() - worker["started_at"] >= self.restart_interval:
+                            worker["restarts"] += 1
+                            self._start_worker(worker)
+                        continue
+                    if process is None or process.is_alive() or self.closed:
+                        continue
+                    print(f"PID: {worker['pid']} exited with code {process.exitcode}, restarting")
+                    worker["state"] = "dead"
+                    worker["model_path"] = None
+                    task_id = worker["task_id"]
+                    worker["task_id"] = None
+                    worker["busy_since"] = None
+                    task = self.tasks.get(task_id) if task_id is not None else None
+                    if task is not None:
+                        if task["retries"] < self.max_task_retries:
+                            task["retries"] += 1
+                            self.pending.insert(0, task_id)
+                        else:
+                            del self.tasks[task_id]
+                            failed.append(task["future"])
+                    if time.time() - worker["started_at"] >= self.restart_interval:
+                        worker["restarts"] += 1
+                        self._start_worker(worker)
+                self._dispatch()
+            for future in failed:
+                future.set_exception(RuntimeError("worker process exited while translating"))
+
+    def wait_ready(self, count: int = 1, timeout: float = None) -> bool:
+        """
+        等待指定数量的工作进程加载完模型
+
+        Args:
+            count (int, optional): 需要就绪的进程数
+            timeout (float, optional): 最长等待秒数
+
+        Returns:
+            bool: 是否在超时前达到要求
+        """
+        with self.lock:
+            return self.lock.wait_for(lambda: self.ready_count() >= count, timeout)
+
+    def ready_count(self) -> int:
+        """
+        获取已加载模型的工作进程数
+
+        Returns:
+            int: 处于空闲或忙碌状态的进程数
+        """
+        return sum(1 for worker in self.workers if worker["state"] in ("ready", "busy"))
+
+    def reload(self, model_path: str):
+        """
+        切换模型文件（例如更换量化版本），不会丢弃排队中的请求
+
+        Args:
+            model_path (str): 新的模型文件路径
+
+        Note:
+            - 各工作进程在空闲时逐个重载，同一时间只有一个进程停止服务
+            - 重载期间的请求继续由其它进程处理或排队等待
+        """
+        with self.lock:
+            self.model_path = model_path
+            for worker in self.workers:
+                worker["reload"] = worker["state"] != "loading"
+            self._dispatch()
+
+    def stats(self) -> dict:
+        """
+        获取各工作进程的健康状态和队列深度
+
+        Returns:
+            dict: 包含以下字段:
+                - model_path: 当前模型文件
+                - queue_depth: 等待分配的任务数
+                - ready_workers: 已加载模型的进程数
+                - workers: 每个进程的编号、PID、设备、状态、已加载模型、重启次数、完成任务数、忙碌时长和模型加载耗时，
+                  CPU推理时另有绑定的CPU和线程数
+                - budget: 生成预算的长度比例、样本数和达到上限的次数，见engine.budget.GenerationBudget.stats
+        """
+        now = time.time()
+        with self.lock:
+            workers = []
+            for worker in self.workers:
+                workers.append({
+                    "worker_id": worker["worker_id"],
+                    "pid": worker["pid"],
+                    "cuda_device": worker["cuda_device"],
+                    "cpus": worker["cpu_layout"]["cpus"] if worker["cpu_layout"] else None,
+                    "n_threads": worker["cpu_layout"]["n_threads"] if worker["cpu_layout"] else None,
+                    "state": worker["state"],
+                    "model_path": worker["model_path"],
+                    "restarts": worker["restarts"],
+                    "completed": worker["completed"],
+                    "busy_seconds": now - worker["busy_since"] if worker["busy_since"] else 0,
+                    "load_seconds": worker["load_seconds"],
+                })
+            return {"model_path": self.model_path, "queue_depth": len(self.pending), "ready_workers": self.ready_count(), "workers": workers,
+                    "budget": self.budget.stats()}
+
+    def close(self):
+        """
+        停止所有工作进程
+        """
+        with self.lock:
+            self.closed = True
+            for worker in self.workers:
+                if worker["process"] is not None and worker["process"].is_alive():
+                    worker["task_queue"].put(None)
+        for worker in self.workers:
+            if worker["process"] is not None:
+                worker["process"].join(timeout=10)
+
+    def translate(self, text: str, history: list[dict] = [], gpt_dicts: list[dict] = [], callback=None, error_callback=None):
         """
         提交单个翻译任务到进程池
 
@@ -114,32 +440,98 @@ class LLM:
             text (str): 待翻译文本
             history (list[dict], optional): 历史对话
             gpt_dicts (list[dict], optional): 术语表
+            callback (callable, optional): 翻译成功时以结果调用
+            error_callback (callable, optional): 翻译失败时以异常调用
+
+        Returns:
+            AsyncResult: 异步结果对象
+        """
+        request = self.budget.apply(make_request(text, MODEL_TYPES[self.model_name], history, gpt_dicts), text)
+        future = self._submit(_process_translate, (request, self.budget.limit(text, 1)), lambda result: self._finish_translate(text, result))
+        return self._with_callbacks(future, callback, error_callback)
+
+    def _finish_translate(self, text: str, result: tuple) -> str:
+        """记录各次请求的生成token数供生成预算学习，返回译文"""
+        content, attempts = result
+        for attempt, (completion_tokens, max_tokens) in enumerate(attempts):
+            self.budget.record(text, completion_tokens, max_tokens, attempt)
+        return content
+
+    def chat_completion(self, request: dict, callback=None, error_callback=None):
+        """
+        提交一次OpenAI格式的chat completions请求，供engine的本地后端使用
+
+        Args:
+            request (dict): 请求体，见engine.prompt.make_request
+            callback (callable, optional): 成功时以响应调用
+            error_callback (callable, optional): 失败时以异常调用
+
+        Returns:
+            AsyncResult: 异步结果对象，结果为OpenAI格式的响应
+        """
+        return self._with_callbacks(self._submit(_process_chat, (request,)), callback, error_callback)
+
+    def _with_callbacks(self, future: AsyncResult, callback, error_callback) -> AsyncResult:
+        """
+        为异步结果绑定成功和失败回调
+
+        Args:
+            future (AsyncResult): 异步结果对象
+            callback (callable): 成功时以结果调用
+            error_callback (callable): 失败时以异常调用
 
         Returns:
-            multiprocessing.pool.AsyncResult: 异步结果对象
+            AsyncResult: 传入的异步结果对象
         """
-        return self.pool.apply_async(_process_translate, (self.model_name, text, history, gpt_dicts))
+        if callback is not None or error_callback is not None:
+            def on_done(future):
+                error = future.exception()
+                if error is None:
+                    if callback is not None:
+                        callback(future.result())
+                elif error_callback is not None:
+                    error_callback(error)
+            future.add_done_callback(on_done)
+        return future
     
-    def batch_translate(self, datas: list[dict]) -> list[str]:
+    def iter_batch_translate(self, datas: list[dict], timeout: float = None):
         """
-        批量翻译文本
+        一次提交全部文本，按完成顺序逐条返回结果
 
         Args:
             datas (list[dict]): 待翻译数据列表，每个元素应包含:
                 - text: 待翻译文本
                 - history: 历史对话
                 - gpt_dicts: 术语表
+            timeout (float, optional): 从开始迭代起等待全部结果的最长秒数
 
-        Returns:
-            list[str]: 翻译结果列表，顺序与输入一致
+        Yields:
+            tuple[int, str]: (在datas中的位置, 翻译结果)
 
         Note:
             - 每个 key 都必须有值，即使是空列表
+            - 某条翻译失败时抛出对应异常，其余已提交的任务会继续执行
+        """
+        futures = {self.translate(data["text"], data["history"], data["gpt_dicts"]): index for index, data in enumerate(datas)}
+        for future in as_completed(futures, timeout):
+            yield futures[future], future.result()
+
+    def batch_translate(self, datas: list[dict], timeout: float = None) -> list[str]:
+        """
+        批量翻译文本
+
+        Args:
+            datas (list[dict]): 待翻译数据列表，格式同iter_batch_translate
+            timeout (float, optional): 等待全部结果的最长秒数
+
+        Returns:
+            list[str]: 翻译结果列表，顺序与输入一致
 
         Example:
             >>> translator.batch_translate([{"text": "こんにちは", "history": [], "gpt_dicts": []}])
             >>> ['你好']
         """
-        tasks = [self.__translate(data["text"], data["history"], data["gpt_dicts"]) for data in datas]
-        results = [task.get() for task in tasks]
+        results = [None] * len(datas)
+        for index, result in self.iter_batch_translate(datas, timeout):
+            results[index] = result
         return results
@@ -0,0 +1,158 @@
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import threading
+
+# 优先级数值越小越先调度
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+class Job:
+    """
+    一次HTTP请求对应的一组翻译任务
+
+    Attributes:
+        client_id (str): 客户端标识，用于公平排队
+        priority (int): 优先级类别
+        futures (set[Future]): 该请求已提交的全部任务
+        cancelled (bool): 请求是否已被取消
+    """
+    def __init__(self, client_id: str, priority: int = PRIORITY_BATCH):
+        self.client_id = client_id
+        self.priority = priority
+        self.futures = set()
+        self.cancelled = False
+
+class Scheduler:
+    """
+    位于进程池前的翻译任务调度器
+
+    任务先按优先级分类，同一优先级内按客户端轮询出队，保证大批量请求不会饿死其它客户端。
+    进程池中同时执行的任务数被限制为 max_inflight，其余任务留在调度器中，因此可以随时取消。
+
+    Attributes:
+        llm (LLM): 实际执行翻译的进程池
+        max_inflight (int): 同时提交给进程池的最大任务数
+    """
+    def __init__(self, llm, max_inflight: int):
+        """
+        初始化调度器并启动分发线程
+
+        Args:
+            llm (LLM): 翻译器实例
+            max_inflight (int): 同时提交给进程池的最大任务数，一般等于工作进程数
+        """
+        self.llm = llm
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self.queues = {PRIORITY_INTERACTIVE: OrderedDict(), PRIORITY_BATCH: OrderedDict()}
+        self.cond = threading.Condition()
+        threading.Thread(target=self._dispatch_loop, daemon=True).start()
+
+    def submit(self, job: Job, text: str, history: list[dict] = [], gpt_dicts: list[dict] = []) -> Future:
+        """
+        提交单个翻译任务
+
+        Args:
+            job (Job): 任务所属的请求
+            text (str): 待翻译文本
+            history (list[dict], optional): 历史对话
+            gpt_dicts (list[dict], optional): 术语表
+
+        Returns:
+            concurrent.futures.Future: 翻译结果，请求被取消时 result() 抛出 CancelledError
+        """
+        future = Future()
+        with self.cond:
+            if job.cancelled:
+                future.cancel()
+                return future
+            job.futures.add(future)
+            clients = self.queues[job.priority]
+            clients.setdefault(job.client_id, deque()).append((future, job, (text, history, gpt_dicts)))
+            self.cond.notify()
+        return future
+
+    def cancel(self, job: Job) -> int:
+        """
+        取消请求中尚未开始执行的任务，已进入进程池的任务会继续执行完
+
+        Args:
+            job (Job): 要取消的请求
+
+        Returns:
+            int: 被取消的任务数
+        """
+        with self.cond:
+            job.cancelled = True
+            cancelled = sum(1 for future in job.futures if future.cancel())
+            # 从队列中移除已取消的任务，避免占用内存
+            clients = self.queues[job.priority]
+            items = clients.get(job.client_id)
+            if items is not None:
+                items = deque(item for item in items if item[1] is not job)
+                if items:
+                    clients[job.client_id] = items
+                else:
+                    del clients[job.client_id]
+        return cancelled
+
+    def stats(self) -> dict:
+        """
+        获取调度器状态
+
+        Returns:
+            dict: 执行中的任务数以及各优先级、各客户端的排队任务数
+        """
+        with self.cond:
+            queued = {}
+            for priority, clients in self.queues.items():
+                queued[priority] = {client_id: len(items) for client_id, items in clients.items()}
+            return {"inflight": self.inflight, "max_inflight": self.max_inflight, "queued": queued}
+
+    def _next_item(self):
+        """按优先级和客户端轮询取出下一个任务，调用方需持有锁"""
+        for priority in sorted(self.queues):
+            clients = self.queues[priority]
+            while clients:
+                client_id, items = next(iter(clients.items()))
+                item = items.popleft()
+                if items:
+                    clients.move_to_end(client_id)
+                else:
+                    del clients[client_id]
+                future, job, args = item
+                job.futures.discard(future)
+                if future.set_running_or_notify_cancel():
+                    return future, args
+        return None
+
+    def _dispatch_loop(self):
+        """分发线程，在进程池有空闲时提交任务"""
+        while True:
+            with self.cond:
+                item = None
+                while item is None:
+                    if self.inflight < self.max_inflight:
+                        item = self._next_item()
+                    if item is None:
+                        self.cond.wait()
+                self.inflight += 1
+            future, (text, history, gpt_dicts) = item
+            try:
+                self.llm.translate(
+                    text, history, gpt_dicts,
+                    callback=lambda result, future=future: self._finish(future, result, None),
+                    error_callback=lambda error, future=future: self._finish(future, None, error),
+                )
+            except Exception as error:
+                self._finish(future, None, error)
+
+    def _finish(self, future: Future, result, error):
+        """任务完成回调，释放并发名额"""
+        with self.cond:
+            self.inflight -= 1
+            self.cond.notify()
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
@@ -0,0 +1,22 @@
+"""
+Mtool脚本和Translator++后端共用的翻译引擎：提示词构造、可替换的模型后端、控制符保护、生成预算和请求录制
+"""
+
+from .backends import BackendError, BackendTimeout, HTTPBackend, LlamaSlotBackend, LocalBackend, create_backend
+from .budget import GenerationBudget, count_lines, estimate_tokens, format_budget_stats
+from .capture import CaptureLog, CapturingBackend, group_runs, read_capture, sequential_timeline
+from .controlcodes import PLACEHOLDER, RPGMAKER_CODES, TRANSLATOR_PP_CODES, ControlCodeTokenizer
+from .prompt import (
+    build_messages,
+    build_mtool_messages,
+    clean_output,
+    dict_to_glossary,
+    format_chatml,
+    format_glossary,
+    get_mtool_sampling,
+    get_sampling,
+    get_translation_model,
+    llama_chat_kwargs,
+    make_request,
+    make_request_json,
+)
@@ -0,0 +1,296 @@
+"""
+翻译后端
+
+HTTPBackend请求OpenAI兼容的HTTP服务，LlamaSlotBackend使用llama.cpp server原生的补全接口并按请求体中的slot_key固定slot，
+LocalBackend直接把请求提交给本机的llm.LLM进程池，
+它们的complete接口都接收engine.prompt.make_request构造的请求体并返回OpenAI格式的响应。
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import requests
+
+from .prompt import format_chatml
+
+LOCAL_PREFIX = "local:"
+LLAMACPP_PREFIX = "llamacpp:"
+# 只在客户端内部使用的请求体字段，不发送给OpenAI兼容的服务，也不写入录制日志
+PRIVATE_KEYS = ("slot_key",)
+
+def public_request(data: dict) -> dict:
+    """
+    去掉请求体中只在客户端内部使用的字段
+
+    Args:
+        data (dict): 请求体
+
+    Returns:
+        dict: 不含PRIVATE_KEYS的请求体，没有这些字段时返回传入的对象
+    """
+    if not any(key in data for key in PRIVATE_KEYS):
+        return data
+    return {key: value for key, value in data.items() if key not in PRIVATE_KEYS}
+
+class BackendError(Exception):
+    """
+    后端请求失败
+    """
+
+class BackendTimeout(BackendError):
+    """
+    后端请求超时
+    """
+
+class HTTPBackend:
+    """
+    OpenAI兼容的HTTP后端
+    """
+    def __init__(self, endpoint: str):
+        """
+        Args:
+            endpoint (str): chat completions接口地址
+        """
+        self.endpoint = endpoint
+        self.name = endpoint
+
+    def complete(self, data: dict, timeout: float = None) -> dict:
+        """
+        发送一次chat completions请求
+
+        Args:
+            data (dict): 请求体
+            timeout (float, optional): 超时秒数
+
+        Returns:
+            dict: 响应JSON
+
+        Raises:
+            BackendTimeout: 请求超时
+            BackendError: 连接失败或服务端返回错误
+        """
+        # slot_key只供LlamaSlotBackend使用，不发送给OpenAI兼容的服务
+        data = public_request(data)
+        try:
+            response = requests.post(self.endpoint, json=data, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+        except requests.Timeout as e:
+            raise BackendTimeout(str(e)) from e
+        except (requests.RequestException, ValueError) as e:
+            raise BackendError(str(e)) from e
+
+class LlamaSlotBackend:
+    """
+    llama.cpp server后端，使用原生/completion接口并开启cache_prompt
+
+    请求体中slot_key相同的请求固定使用同一个slot（调用方按上下文链设置，如main_dev.py的每个下标范围），
+    同一上下文链连续请求中相同的系统提示词、术语表和历史译文前缀可以直接复用该slot中的KV缓存，不必每次重新prefill。
+    新的key按出现顺序轮流分配slot，只保留最近使用的max_keys个key；没有slot_key的请求轮流使用各slot。
+    """
+    def __init__(self, base_url: str, slots: int = 0, max_keys: int = 1024):
+        """
+        Args:
+            base_url (str): llama.cpp server地址，如"http://127.0.0.1:8080"
+            slots (int, optional): 服务端的slot数（llama-server的--parallel），为0时从/props读取
+            max_keys (int, optional): 最多记录的slot_key数，超出后淘汰最久未使用的key
+        """
+        self.base_url = base_url.rstrip("/")
+        self.completion_url = self.base_url + "/completion"
+        self.name = LLAMACPP_PREFIX + self.base_url
+        self.slots = slots or self._query_slots()
+        self.lock = threading.Lock()
+        self.max_keys = max_keys
+        self.key_slots = OrderedDict()
+        self.next_slot = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def _query_slots(self) -> int:
+        """
+        从服务端的/props读取slot数，读取失败时按1个slot处理
+        """
+        try:
+            response = requests.get(self.base_url + "/props", timeout=10)
+            response.raise_for_status()
+            return max(1, int(response.json().get("total_slots", 1)))
+        except (requests.RequestException, ValueError) as e:
+            print(f"读取 {self.base_url}/props 失败，按1个slot处理: {e}")
+            return 1
+
+    def slot_for_key(self, key) -> int:
+        """
+        获取slot_key固定使用的slot，新的key按出现顺序轮流分配
+
+        Args:
+            key: slot_key，为None时不固定slot
+
+        Returns:
+            int: slot编号
+        """
+        with self.lock:
+            if key is not None and key in self.key_slots:
+                self.key_slots.move_to_end(key)
+                return self.key_slots[key]
+            slot = self.next_slot
+            self.next_slot = (self.next_slot + 1) % self.slots
+            if key is not None:
+                self.key_slots[key] = slot
+                if len(self.key_slots) > self.max_keys:
+                    self.key_slots.popitem(last=False)
+            return slot
+
+    def complete(self, data: dict, timeout: float = None) -> dict:
+        """
+        把chat completions请求转换为/completion请求发送到slot_key对应的slot
+
+        Args:
+            data (dict): 请求体，可包含slot_key
+            timeout (float, optional): 超时秒数
+
+        Returns:
+            dict: 转换为OpenAI格式的响应
+
+        Raises:
+            BackendTimeout: 请求超时
+            BackendError: 连接失败或服务端返回错误
+        """
+        payload = {
+            "prompt": format_chatml(data["messages"]),
+            "n_predict": data.get("max_tokens", 512),
+            "temperature": data.get("temperature", 0.1),
+            "top_p": data.get("top_p", 0.3),
+            "frequency_penalty": data.get("frequency_penalty", 0.0),
+            "repeat_penalty": data.get("repetition_penalty", 1.0),
+            "stop": ["<|im_end|>"] + data.get("stop", []),
+            "cache_prompt": True,
+            "id_slot": self.slot_for_key(data.get("slot_key")),
+        }
+        try:
+            response = requests.post(self.completion_url, json=payload, timeout=timeout)
+            response.raise_for_status()
+            result = response.json()
+        except requests.Timeout as e:
+            raise BackendTimeout(str(e)) from e
+        except (requests.RequestException, ValueError) as e:
+            raise BackendError(str(e)) from e
+        prompt_tokens = result.get("tokens_evaluated", 0)
+        cached_tokens = result.get("tokens_cached", 0)
+        with self.lock:
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+        return {
+            "choices": [{"message": {"role": "assistant", "content": result.get("content", "")}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": result.get("tokens_predicted", 0), "cached_tokens": cached_tokens},
+        }
+
+    def stats(self) -> dict:
+        """
+        获取KV缓存复用统计
+
+        Returns:
+            dict: slot数、累计提示词token数和其中命中缓存的token数
+        """
+        with self.lock:
+            return {"slots": self.slots, "prompt_tokens": self.prompt_tokens, "cached_tokens": self.cached_tokens}
+
+class LocalBackend:
+    """
+    进程内后端，直接使用Translator++/llm.py中的LLM进程池，省去HTTP序列化和往返
+    """
+    # 同一模型文件只启动一个进程池，由所有指向它的endpoint共享
+    _pools = {}
+    _lock = threading.Lock()
+
+    def __init__(self, model_path: str, num_process: int = 1, cuda_device: list[str] = ("0",), threads_per_process: int = None):
+        """
+        Args:
+            model_path (str): GGUF模型文件路径
+            num_process (int, optional): 工作进程数
+            cuda_device (list[str], optional): 每个工作进程使用的CUDA设备ID，为["cpu"]时使用纯CPU推理
+            threads_per_process (int, optional): CPU推理时每个进程的线程数，默认平均分配所有物理核心
+        """
+        self.model_path = model_path
+        self.name = LOCAL_PREFIX + model_path
+        with LocalBackend._lock:
+            if model_path not in LocalBackend._pools:
+                LocalBackend._pools[model_path] = _create_pool(model_path, num_process, list(cuda_device), threads_per_process)
+            self.llm = LocalBackend._pools[model_path]
+
+    def complete(self, data: dict, timeout: float = None) -> dict:
+        """
+        在本地进程池中执行一次chat completions请求
+
+        Args:
+            data (dict): 请求体
+            timeout (float, optional): 等待结果的超时秒数
+
+        Returns:
+            dict: OpenAI格式的响应
+
+        Raises:
+            BackendTimeout: 等待超时，任务仍会在工作进程中执行完
+            BackendError: 工作进程执行失败
+        """
+        try:
+            return self.llm.chat_completion(data).get(timeout)
+        except FutureTimeoutError as e:
+            raise BackendTimeout(f"本地模型 {self.model_path} 超时") from e
+        except Exception as e:
+            raise BackendError(str(e)) from e
+
+    @classmethod
+    def close_all(cls):
+        """
+        关闭所有本地进程池
+        """
+        with cls._lock:
+            for llm in cls._pools.values():
+                llm.close()
+            cls._pools.clear()
+
+def _create_pool(model_path: str, num_process: int, cuda_device: list[str], threads_per_process: int = None):
+    """
+    启动LLM进程池并等待所有工作进程加载完成
+
+    Args:
+        model_path (str): GGUF模型文件路径
+        num_process (int): 工作进程数
+        cuda_device (list[str]): 每个工作进程使用的CUDA设备ID，为["cpu"]时使用纯CPU推理
+        threads_per_process (int, optional): CPU推理时每个进程的线程数
+
+    Returns:
+        LLM: 进程池
+    """
+    translator_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Translator++")
+    if translator_dir not in sys.path:
+        sys.path.insert(0, translator_dir)
+    from llm import LLM
+    cpu = cuda_device == ["cpu"]
+    cuda_device = [cuda_device[i % len(cuda_device)] for i in range(num_process)]
+    # model_name只影响LLM.translate，本地后端通过chat_completion传入完整请求
+    return LLM("sakura", model_path, num_process, cuda_device, block=True, cpu=cpu, threads_per_process=threads_per_process)
+
+def create_backend(endpoint: str, config: dict = None):
+    """
+    根据endpoint创建后端
+
+    Args:
+        endpoint (str): HTTP地址，"llamacpp:<llama.cpp server地址>"表示使用slot固定的原生补全接口，
+            或"local:<模型路径>"表示使用本地进程池
+        config (dict, optional): 配置，读取llamacpp_slots、local_processes、local_devices和local_threads
+
+    Returns:
+        HTTPBackend | LlamaSlotBackend | LocalBackend: 后端对象
+    """
+    config = config or {}
+    if endpoint.startswith(LLAMACPP_PREFIX):
+        return LlamaSlotBackend(endpoint[len(LLAMACPP_PREFIX):], config.get("llamacpp_slots", 0))
+    if endpoint.startswith(LOCAL_PREFIX):
+        devices = config.get("local_devices", ["0"])
+        num_process = config.get("local_processes", len(devices))
+        return LocalBackend(endpoint[len(LOCAL_PREFIX):], num_process, devices, config.get("local_threads"))
+    return HTTPBackend(endpoint)
@@ -0,0 +1,198 @@
+"""
+生成预算
+
+按原文的token数和行数为每个请求设置max_tokens和停止序列，译文与原文的长度比例从同一任务中已完成的译文学习。
+模型退化时不再对三个字的原文生成满512个token才被发现，长度异常的原文只在重试时放宽预算。
+"""
+
+import math
+import threading
+from collections import deque
+
+def estimate_tokens(text: str) -> int:
+    """
+    不加载分词器粗略估算文本的token数：日文和中文字符约每字一个token，ASCII字符约每4个一个token
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        int: 估算的token数，至少为1
+
+    Note:
+        Mtool的长度调度、计划模式和生成预算共用该估算，修改公式会改变bucket和sjf策略的条目顺序
+    """
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return (len(text) - ascii_chars) + ascii_chars // 4 + 1
+
+def count_lines(text: str) -> int:
+    """
+    统计文本的行数，\\r\\n、\\r和\\n都算作换行
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        int: 行数，至少为1
+    """
+    return text.replace("\r\n", "\n").replace("\r", "\n").count("\n") + 1
+
+class GenerationBudget:
+    """
+    线程安全的生成预算控制器
+
+    max_tokens = 比例 × 原文token数 × margin + 行数 × line_slack，限制在[min_tokens, max_tokens]之间。
+    比例在样本不足min_samples条时为default_ratio，之后为最近window条完成译文中“生成token数 / 原文token数”的quantile分位数。
+    达到上限被截断的响应不参与学习，重试时预算按escalation倍数放宽。
+    """
+    def __init__(self, max_tokens: int = 512, min_tokens: int = 32, default_ratio: float = 2.0, margin: float = 1.5,
+                 line_slack: int = 16, quantile: float = 0.95, escalation: float = 4.0, min_samples: int = 20, window: int = 1000):
+        """
+        Args:
+            max_tokens (int, optional): 预算上限，即原来固定的max_tokens
+            min_tokens (int, optional): 预算下限，避免很短的原文因比例波动被截断
+            default_ratio (float, optional): 样本不足时使用的比例
+            margin (float, optional): 比例之上的余量倍数
+            line_slack (int, optional): 每行额外的token数，覆盖标点、引号和换行
+            quantile (float, optional): 学习比例时取的分位数
+            escalation (float, optional): 每次重试预算放大的倍数
+            min_samples (int, optional): 开始使用学习比例所需的样本数
+            window (int, optional): 保留的最近样本数
+        """
+        self.max_tokens = max_tokens
+        self.min_tokens = min(min_tokens, max_tokens)
+        self.default_ratio = default_ratio
+        self.margin = margin
+        self.line_slack = line_slack
+        self.quantile = quantile
+        self.escalation = escalation
+        self.min_samples = min_samples
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.ratio_cache = None
+        self.requests = 0
+        self.retries = 0
+        self.truncated = 0
+        self.saved_tokens = 0
+
+    def ratio(self) -> float:
+        """
+        获取当前使用的比例
+
+        Returns:
+            float: 样本不足时为default_ratio，否则为学习到的分位数
+        """
+        with self.lock:
+            if len(self.samples) < self.min_samples:
+                return self.default_ratio
+            if self.ratio_cache is None:
+                ordered = sorted(self.samples)
+                self.ratio_cache = ordered[min(len(ordered) - 1, int(len(ordered) * self.quantile))]
+            return self.ratio_cache
+
+    def limit(self, text: str, attempt: int = 0) -> int:
+        """
+        计算原文对应的max_tokens
+
+        Args:
+            text (str): 发送给模型的原文
+            attempt (int, optional): 重试次数，0为首次请求
+
+        Returns:
+            int: max_tokens
+        """
+        budget = self.ratio() * estimate_tokens(text) * self.margin + count_lines(text) * self.line_slack
+        budget *= self.escalation ** attempt
+        return max(self.min_tokens, min(self.max_tokens, math.ceil(budget)))
+
+    def stop(self, text: str) -> list[str]:
+        """
+        获取原文对应的停止序列：原文没有空行时，译文中出现空行说明模型已经开始重复或续写
+
+        Args:
+            text (str): 发送给模型的原文
+
+        Returns:
+            list[str]: 停止序列
+        """
+        normalized = text.replace("\r\n", "\n").replace("\r", "\n")
+        return [] if "\n\n" in normalized else ["\n\n"]
+
+    def apply(self, data: dict, text: str, attempt: int = 0) -> dict:
+        """
+        按原文设置请求体的max_tokens和stop
+
+        Args:
+            data (dict): 请求体，见engine.prompt.make_request
+            text (str): 发送给模型的原文
+            attempt (int, optional): 重试次数，0为首次请求
+
+        Returns:
+            dict: 传入的请求体
+        """
+        data["max_tokens"] = self.limit(text, attempt)
+        stop = self.stop(text)
+        if stop:
+            data["stop"] = stop
+        if not attempt:
+            with self.lock:
+                self.requests += 1
+                self.saved_tokens += self.max_tokens - data["max_tokens"]
+        return data
+
+    def record(self, text: str, completion_tokens: int, max_tokens: int, attempt: int = 0) -> bool:
+        """
+        记录一次完成的请求，未被截断时用于学习比例
+
+        Args:
+            text (str): 发送给模型的原文
+            completion_tokens (int): 响应中的生成token数
+            max_tokens (int): 该请求的max_tokens
+            attempt (int, optional): 重试次数，0为首次请求
+
+        Returns:
+            bool: 响应是否达到max_tokens（可能发生了退化或预算不足）
+        """
+        if attempt:
+            with self.lock:
+                self.retries += 1
+        if completion_tokens >= max_tokens:
+            with self.lock:
+                self.truncated += 1
+            return True
+        if completion_tokens > 0:
+            with self.lock:
+                self.samples.append(completion_tokens / estimate_tokens(text))
+                self.ratio_cache = None
+        return False
+
+    def stats(self) -> dict:
+        """
+        获取预算统计
+
+        Returns:
+            dict: 当前比例、样本数、首次请求数、重试数、达到上限的响应数，以及首次请求相对固定上限少分配的token数
+        """
+        ratio = self.ratio()
+        with self.lock:
+            return {
+                "ratio": round(ratio, 3),
+                "samples": len(self.samples),
+                "requests": self.requests,
+                "retries": self.retries,
+                "truncated": self.truncated,
+                "saved_tokens": self.saved_tokens,
+            }
+
+def format_budget_stats(stats: dict) -> str:
+    """
+    格式化预算统计
+
+    Args:
+        stats (dict): GenerationBudget.stats()的返回值
+
+    Returns:
+        str: 统计信息
+    """
+    return (f"生成预算: 比例 {stats['ratio']}（{stats['samples']} 个样本），请求 {stats['requests']} 次，"
+            f"达到上限 {stats['truncated']} 次，放宽重试 {stats['retries']} 次，少分配 {stats['saved_tokens']} token")
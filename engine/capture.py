@@ -0,0 +1,185 @@
+"""
+请求录制
+
+把每次模型请求的请求体、响应和耗时按行写入gzip压缩的JSON日志，供engine.replay离线回放。
+同一文件可以追加多次运行的录制，每次运行以一条运行头开始，记录中的start只在同一次运行内可比。
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+from .backends import public_request
+
+class CaptureLog:
+    """
+    线程安全的录制日志，打开时先写入一条运行头{"type": "run", "run": 运行ID, "time": 录制开始的时间戳}，之后每行一条记录:
+        - run: 运行ID，与运行头相同
+        - start: 请求开始时间，相对于本次运行录制开始的秒数
+        - latency: 请求耗时（秒）
+        - source: 请求的目标，如endpoint地址
+        - path: 请求路径，如"/v1/chat/completions"
+        - request: 请求体
+        - response: 响应JSON，请求失败时为None
+        - error: 失败原因，成功时为None
+    """
+    def __init__(self, path: str, flush_every: int = 20):
+        """
+        Args:
+            path (str): 日志文件路径，一般以.jsonl.gz结尾，已存在时追加为新的gzip成员
+            flush_every (int, optional): 每写入多少条记录刷新一次，进程意外退出时最多丢失这么多条
+        """
+        self.path = path
+        self.flush_every = flush_every
+        self.file = gzip.open(path, "at", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.run = uuid.uuid4().hex[:12]
+        self.count = 0
+        self.file.write(json.dumps({"type": "run", "run": self.run, "time": round(self.started, 3)}) + "\n")
+
+    def record(self, source: str, path: str, request: dict, response: dict, start: float, latency: float, error: str = None):
+        """
+        写入一条记录
+
+        Args:
+            source (str): 请求的目标
+            path (str): 请求路径
+            request (dict): 请求体
+            response (dict): 响应JSON，失败时为None
+            start (float): 请求开始的时间戳（time.time()）
+            latency (float): 请求耗时（秒）
+            error (str, optional): 失败原因
+        """
+        line = json.dumps({
+            "run": self.run,
+            "start": round(start - self.started, 4),
+            "latency": round(latency, 4),
+            "source": source,
+            "path": path,
+            "request": request,
+            "response": response,
+            "error": error,
+        }, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.count += 1
+            if self.count % self.flush_every == 0:
+                self.file.flush()
+
+    def close(self):
+        """
+        关闭日志文件
+        """
+        with self.lock:
+            self.file.close()
+
+class CapturingBackend:
+    """
+    包装engine.backends中的后端，录制经过它的每次请求
+    """
+    def __init__(self, backend, log: CaptureLog):
+        """
+        Args:
+            backend: 被包装的后端，需要有name属性和complete方法
+            log (CaptureLog): 录制日志
+        """
+        self.backend = backend
+        self.log = log
+        # HTTP后端记录endpoint的路径，本地后端按chat completions接口记录，回放服务按该路径响应
+        endpoint = getattr(backend, "endpoint", "")
+        self.path = urlparse(endpoint).path or "/v1/chat/completions"
+        self.name = backend.name
+
+    def complete(self, data: dict, timeout: float = None) -> dict:
+        """
+        调用被包装的后端并录制请求和响应，参数与返回值同被包装的后端
+
+        Note:
+            录制的请求体不含slot_key等只在客户端内部使用的字段，与OpenAI兼容服务实际收到的请求体一致
+        """
+        start = time.time()
+        recorded = public_request(data)
+        try:
+            response = self.backend.complete(data, timeout)
+        except Exception as e:
+            self.log.record(self.name, self.path, recorded, None, start, time.time() - start, f"{type(e).__name__}: {e}")
+            raise
+        self.log.record(self.name, self.path, recorded, response, start, time.time() - start)
+        return response
+
+def request_key(path: str, request: dict) -> str:
+    """
+    计算请求的查找键，与字典键顺序无关
+
+    Args:
+        path (str): 请求路径
+        request (dict): 请求体
+
+    Returns:
+        str: 请求路径和请求体的SHA1
+    """
+    body = json.dumps(request, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(f"{path}\n{body}".encode("utf-8")).hexdigest()
+
+def read_capture(path: str):
+    """
+    逐条读取录制日志，文件末尾因进程退出而不完整时忽略残缺部分
+
+    Args:
+        path (str): 日志文件路径
+
+    Yields:
+        dict: 每条请求记录，格式见CaptureLog，不含运行头；没有运行头的旧日志中的记录run为None
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        try:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    return
+                if record.get("type") == "run":
+                    continue
+                record.setdefault("run", None)
+                yield record
+        except (EOFError, gzip.BadGzipFile):
+            return
+
+def group_runs(records) -> OrderedDict:
+    """
+    按运行ID分组录制记录
+
+    Args:
+        records: read_capture返回的记录
+
+    Returns:
+        OrderedDict: {运行ID: 该次运行的记录列表}，按各运行首次出现的顺序排列
+    """
+    runs = OrderedDict()
+    for record in records:
+        runs.setdefault(record["run"], []).append(record)
+    return runs
+
+def sequential_timeline(records) -> list[dict]:
+    """
+    把多次运行的记录排成一条时间线：每次运行的start加上之前各次运行的总时长，运行之间不重叠
+
+    Args:
+        records: read_capture返回的记录
+
+    Returns:
+        list[dict]: 按调整后的start排序的记录副本
+    """
+    timeline = []
+    offset = 0.0
+    for items in group_runs(records).values():
+        for record in items:
+            timeline.append(dict(record, start=record["start"] + offset))
+        offset += max(record["start"] + record["latency"] for record in items)
+    return sorted(timeline, key=lambda record: record["start"])
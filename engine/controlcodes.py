@@ -0,0 +1,158 @@
+"""
+控制符保护
+
+翻译前把控制符替换为`控制符N`占位符（模型倾向于原样保留中文占位符），翻译后换回并校验数量是否一致。
+Mtool脚本使用RPG Maker转义符，Translator++后端使用`${dat[n]}`。
+同一段文本中的占位符编号按最大编号的位数补零（如10个控制符时为`控制符01`到`控制符10`），
+占位符后紧跟数字时按固定位数切分编号，不会把`控制符1`和其后的`0`读成`控制符10`。
+"""
+
+import re
+from collections import Counter
+
+PLACEHOLDER = "控制符"
+PLACEHOLDER_PATTERN = re.compile(PLACEHOLDER + r"(\d+)")
+
+def placeholder_width(largest: int) -> int:
+    """
+    获取占位符编号的位数
+
+    Args:
+        largest (int): 同一段文本中最大的占位符编号
+
+    Returns:
+        int: 编号补零后的位数
+    """
+    return len(str(max(largest, 1)))
+
+def format_placeholder(number: int, width: int = 1) -> str:
+    """
+    构造占位符
+
+    Args:
+        number (int): 编号
+        width (int, optional): 编号补零后的位数，见placeholder_width
+
+    Returns:
+        str: 如"控制符1"、"控制符01"
+    """
+    return f"{PLACEHOLDER}{number:0{width}d}"
+
+def replace_placeholders(text: str, width: int, lookup) -> str:
+    """
+    按固定位数识别文本中的占位符并替换
+
+    Args:
+        text (str): 包含占位符的文本
+        width (int): 编号位数，占位符后多出的数字原样保留在替换结果之后
+        lookup (callable): lookup(编号)返回替换文本，返回None时保留该占位符
+
+    Returns:
+        str: 替换后的文本
+
+    Note:
+        模型去掉了补零（如把`控制符01`写成`控制符1`）时，不足width位的编号按数值识别
+    """
+    def replace(match):
+        digits = match.group(1)
+        number, rest = (int(digits[:width]), digits[width:]) if len(digits) >= width else (int(digits), "")
+        value = lookup(number)
+        return match.group(0) if value is None else value + rest
+
+    return PLACEHOLDER_PATTERN.sub(replace, text)
+
+def find_placeholders(text: str, width: int) -> list[int]:
+    """
+    按出现顺序列出文本中占位符的编号，识别规则同replace_placeholders
+
+    Args:
+        text (str): 包含占位符的文本
+        width (int): 编号位数
+
+    Returns:
+        list[int]: 编号列表
+    """
+    numbers = []
+    replace_placeholders(text, width, lambda number: numbers.append(number))
+    return numbers
+
+# RPG Maker控制符，例如 \C[1]、\N[2]、\V[10]、\I[247]、\{、\$
+RPGMAKER_CODE_PATTERN = r"\\[A-Za-z]+\[[^\]]*\]|\\[A-Za-z]+<[^>]*>|\\[A-Za-z]|\\[{}\\$.|!<>^]"
+# Translator++转换后的控制符，例如 ${dat[1]}
+TRANSLATOR_PP_CODE_PATTERN = r"\$\{dat\[\d+\]\}"
+
+class ControlCodeTokenizer:
+    """
+    按预编译的正则表达式替换、还原和校验控制符
+    """
+    def __init__(self, pattern: str, trigger: str):
+        """
+        Args:
+            pattern (str): 控制符的正则表达式
+            trigger (str): 所有控制符都包含的字符，文本中没有该字符时跳过正则匹配
+        """
+        self.pattern = re.compile(pattern)
+        self.trigger = trigger
+
+    def findall(self, text: str) -> list[str]:
+        """
+        按出现顺序列出文本中的控制符
+        """
+        if self.trigger not in text:
+            return []
+        return self.pattern.findall(text)
+
+    def protect(self, text: str, start: int = None) -> tuple[str, dict[str, str]]:
+        """
+        把控制符依次替换为占位符
+
+        Args:
+            text (str): 原文
+            start (int, optional): 第一个占位符的编号，默认接在原文中已有的占位符之后，避免与其混淆
+
+        Returns:
+            tuple[str, dict[str, str]]: 替换后的文本和按出现顺序排列的{占位符: 控制符}
+        """
+        if self.trigger not in text:
+            return text, {}
+        if start is None:
+            start = max((int(number) for number in PLACEHOLDER_PATTERN.findall(text)), default=0) + 1
+        count = len(self.pattern.findall(text))
+        if not count:
+            return text, {}
+        width = placeholder_width(start + count - 1)
+        mapping = {}
+
+        def replace(match):
+            placeholder = format_placeholder(start + len(mapping), width)
+            mapping[placeholder] = match.group(0)
+            return placeholder
+
+        return self.pattern.sub(replace, text), mapping
+
+    def restore(self, translation: str, mapping: dict[str, str]) -> str:
+        """
+        把译文中的占位符换回控制符，不属于本次替换的占位符保持不变
+
+        Args:
+            translation (str): 译文
+            mapping (dict[str, str]): protect返回的{占位符: 控制符}
+
+        Returns:
+            str: 还原后的译文
+        """
+        if not mapping:
+            return translation
+        # 同一次替换的占位符位数相同，控制符后紧跟数字时（如\C[1]1000）按该位数切分编号
+        width = len(next(iter(mapping))) - len(PLACEHOLDER)
+        codes = {int(placeholder[len(PLACEHOLDER):]): code for placeholder, code in mapping.items()}
+        return replace_placeholders(translation, width, codes.get)
+
+    def verify(self, source: str, translation: str) -> bool:
+        """
+        检查译文中的控制符与原文是否相同（不要求顺序一致）
+        """
+        return Counter(self.findall(source)) == Counter(self.findall(translation))
+
+RPGMAKER_CODES = ControlCodeTokenizer(RPGMAKER_CODE_PATTERN, "\\")
+TRANSLATOR_PP_CODES = ControlCodeTokenizer(TRANSLATOR_PP_CODE_PATTERN, "$")
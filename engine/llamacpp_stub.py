@@ -0,0 +1,169 @@
+"""
+llama.cpp server替身
+
+不需要GPU，用于测试slot固定和提示词缓存。按字符近似token，模拟每个slot的KV缓存：
+请求的提示词与该slot上次的提示词有公共前缀时，只对其余部分计算prefill耗时。
+
+    python -m engine.llamacpp_stub --port 8080 --slots 4
+
+支持的接口:
+    - POST /completion: 原生补全接口，支持prompt、n_predict、cache_prompt和id_slot
+    - POST /v1/chat/completions: OpenAI兼容接口，使用空闲的slot且不复用缓存
+    - GET /props: 返回total_slots
+    - GET /health: 返回各slot统计
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .prompt import format_chatml
+
+class Slot:
+    def __init__(self, slot_id: int):
+        self.slot_id = slot_id
+        self.lock = threading.Lock()
+        self.cached_prompt = ""
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+class StubServer(ThreadingHTTPServer):
+    """
+    llama.cpp server替身，每个slot同一时间只处理一个请求
+    """
+    daemon_threads = True
+
+    def __init__(self, address: tuple, slots: int, prefill_ms: float, decode_ms: float, batch_penalty: float = 0.0):
+        """
+        Args:
+            address (tuple): 监听地址 (host, port)
+            slots (int): slot数
+            prefill_ms (float): 每个未命中缓存的提示词token的prefill耗时（毫秒）
+            decode_ms (float): 每个生成token的耗时（毫秒）
+            batch_penalty (float, optional): 每多一个同时生成的slot，单个token耗时增加的比例，模拟多个slot共享显卡算力
+        """
+        super().__init__(address, StubHandler)
+        self.slots = [Slot(slot_id) for slot_id in range(slots)]
+        self.prefill_ms = prefill_ms
+        self.decode_ms = decode_ms
+        self.batch_penalty = batch_penalty
+        self.active = 0
+        self.next_slot = 0
+        self.lock = threading.Lock()
+
+    def pick_slot(self, id_slot: int) -> Slot:
+        """
+        id_slot有效时使用指定的slot，否则优先使用空闲的slot，都在忙时轮流分配
+        """
+        if 0 <= id_slot < len(self.slots):
+            return self.slots[id_slot]
+        with self.lock:
+            for slot in self.slots:
+                if not slot.lock.locked():
+                    return slot
+            slot = self.slots[self.next_slot % len(self.slots)]
+            self.next_slot += 1
+        return slot
+
+    def complete(self, prompt: str, n_predict: int, cache_prompt: bool, id_slot: int) -> dict:
+        """
+        模拟一次补全，译文为提示词中最后一行文本前加“译”
+
+        Returns:
+            dict: 与llama.cpp server的/completion相同字段的响应
+        """
+        slot = self.pick_slot(id_slot)
+        with slot.lock:
+            cached = len(os.path.commonprefix([slot.cached_prompt, prompt])) if cache_prompt else 0
+            user_text = prompt.rsplit("<|im_start|>user\n", 1)[-1].split("<|im_end|>", 1)[0]
+            content = "译" + user_text.split("\n")[-1].split("：")[-1]
+            predicted = min(len(content), n_predict)
+            with self.lock:
+                self.active += 1
+                contention = 1 + self.batch_penalty * (self.active - 1)
+            time.sleep(((len(prompt) - cached) * self.prefill_ms + predicted * self.decode_ms * contention) / 1000)
+            with self.lock:
+                self.active -= 1
+            slot.cached_prompt = prompt + content
+            slot.requests += 1
+            slot.prompt_tokens += len(prompt)
+            slot.cached_tokens += cached
+        return {
+            "content": content[:n_predict],
+            "id_slot": slot.slot_id,
+            "tokens_predicted": predicted,
+            "tokens_evaluated": len(prompt),
+            "tokens_cached": cached,
+            "stop": True,
+        }
+
+    def stats(self) -> list[dict]:
+        return [{
+            "id": slot.slot_id,
+            "requests": slot.requests,
+            "prompt_tokens": slot.prompt_tokens,
+            "cached_tokens": slot.cached_tokens,
+        } for slot in self.slots]
+
+class StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/props":
+            self.send_json({"total_slots": len(self.server.slots)})
+        elif self.path == "/health":
+            self.send_json({"status": "ok", "slots": self.server.stats()})
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json({"error": "invalid json"}, 400)
+            return
+        if self.path == "/completion":
+            self.send_json(self.server.complete(
+                body.get("prompt", ""), body.get("n_predict", 512), body.get("cache_prompt", False), body.get("id_slot", -1)
+            ))
+        elif self.path == "/v1/chat/completions":
+            result = self.server.complete(format_chatml(body.get("messages", [])), body.get("max_tokens", 512), False, -1)
+            self.send_json({
+                "choices": [{"message": {"role": "assistant", "content": result["content"]}}],
+                "usage": {"prompt_tokens": result["tokens_evaluated"], "completion_tokens": result["tokens_predicted"]},
+            })
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+def main():
+    parser = argparse.ArgumentParser(description="不需要GPU的llama.cpp server替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--slots", type=int, default=4)
+    parser.add_argument("--prefill-ms", type=float, default=0.5, help="每个未命中缓存的提示词token的prefill耗时（毫秒）")
+    parser.add_argument("--decode-ms", type=float, default=5.0, help="每个生成token的耗时（毫秒）")
+    parser.add_argument("--batch-penalty", type=float, default=0.0, help="每多一个同时生成的slot，单个token耗时增加的比例")
+    args = parser.parse_args()
+    server = StubServer((args.host, args.port), args.slots, args.prefill_ms, args.decode_ms, args.batch_penalty)
+    print(f"llama.cpp替身已启动: http://{args.host}:{args.port}，{args.slots} 个slot")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
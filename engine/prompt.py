@@ -0,0 +1,278 @@
+"""
+翻译请求构造
+
+Mtool脚本和Translator++后端共用的提示词模板、术语表格式和采样参数。
+"""
+
+SYSTEM_PROMPTS = {
+    "SakuraV0_8": "你是一个简单的日文翻译模型，将日文翻译成简体中文。",
+    "SakuraV0_9": "你是一个轻小说翻译模型，可以流畅地将日文翻译成简体中文，并正确使用人称代词。",
+    "SakuraV0_10": "你是一个轻小说翻译模型，可以流畅通顺地以日本轻小说的风格将日文翻译成简体中文，并联系上下文正确使用人称代词，不擅自添加原文中没有的代词。",
+    "SakuraV1_0": "你是一个轻小说翻译模型，可以流畅通顺地以日本轻小说的风格将日文翻译成简体中文，并联系上下文正确使用人称代词，不擅自添加原文中没有的代词。",
+    "GalTranslV2_6": "你是一个视觉小说翻译模型，可以通顺地使用给定的术语表以指定的风格将日文翻译成简体中文，并联系上下文正确使用人称代词。",
+    "GalTranslV3": "你是一个视觉小说翻译模型，可以通顺地使用给定的术语表以指定的风格将日文翻译成简体中文，并联系上下文正确使用人称代词。",
+}
+DEFAULT_SYSTEM_PROMPT = "你是一个轻小说翻译模型，可以流畅通顺地将日文翻译成简体中文。"
+
+def get_translation_model(model_name: str, model_version: str = "") -> str:
+    """
+    根据模型名称和版本获取模型类型
+
+    Args:
+        model_name (str): 模型名称，支持"sakura"、"sakura32b"、"galtransl"
+        model_version (str, optional): 模型版本，如"1.0"、"3.0"
+
+    Returns:
+        str: 模型类型，如"SakuraV1_0"、"GalTranslV3"
+    """
+    model_name = model_name.lower()
+    if model_name == "sakura":
+        return {"0.8": "SakuraV0_8", "0.9": "SakuraV0_9", "0.10": "SakuraV0_10"}.get(model_version, "SakuraV1_0")
+    elif model_name == "sakura32b":
+        return "Sakura32bV0_10"
+    elif model_name == "galtransl":
+        return {"2.6": "GalTranslV2_6", "3.0": "GalTranslV3"}.get(model_version, "GalTranslV2_6")
+    return "SakuraV1_0"
+
+def dict_to_glossary(dict_data: dict) -> list[dict]:
+    """
+    将Mtool格式的字典转换为术语表
+
+    Args:
+        dict_data (dict): {原文: [译文, 备注]}
+
+    Returns:
+        list[dict]: 术语表，每项包含src、dst和可选的info
+    """
+    glossary = []
+    for src, value in dict_data.items():
+        item = {"src": src, "dst": value[0]}
+        if len(value) > 1 and value[1]:
+            item["info"] = value[1]
+        glossary.append(item)
+    return glossary
+
+def format_glossary(glossary: list[dict]) -> str:
+    """
+    将术语表格式化为字符串
+
+    Args:
+        glossary (list[dict]): 术语表，每项包含src、dst和可选的info
+
+    Returns:
+        str: 每行格式为"src->dst #info"或"src->dst"
+
+    Example:
+        >>> format_glossary([{"src": "猫", "dst": "cat", "info": "动物"}])
+        >>> '猫->cat #动物\\n'
+    """
+    lines = ""
+    for item in glossary:
+        if item.get("info"):
+            lines += "{}->{} #{}\n".format(item["src"], item["dst"], item["info"])
+        else:
+            lines += "{}->{}\n".format(item["src"], item["dst"])
+    return lines
+
+def build_messages(text: str, model_type: str, context: list[str] = (), glossary: list[dict] = ()) -> list[dict]:
+    """
+    构造翻译对话
+
+    Args:
+        text (str): 待翻译的日文文本
+        model_type (str): 模型类型，见get_translation_model
+        context (list[str], optional): 历史译文
+        glossary (list[dict], optional): 术语表
+
+    Returns:
+        list[dict]: OpenAI格式的messages
+    """
+    messages = [{"role": "system", "content": SYSTEM_PROMPTS.get(model_type, DEFAULT_SYSTEM_PROMPT)}]
+    if model_type == "SakuraV0_8":
+        messages.append({"role": "user", "content": "将下面的日文文本翻译成中文：" + text})
+    elif model_type == "GalTranslV3":
+        user_prompt = ""
+        if context:
+            user_prompt += "历史翻译：\n" + "\n".join(context) + "\n"
+        if glossary:
+            user_prompt += "参考以下术语表（可为空，格式为src->dst #备注）：\n" + format_glossary(glossary)
+        user_prompt += "根据以上术语表的对应关系和备注，结合历史剧情和上下文，将下面的文本从日文翻译成简体中文：\n" + text
+        messages.append({"role": "user", "content": user_prompt})
+    else:
+        for item in context:
+            messages.append({"role": "assistant", "content": item})
+        if glossary:
+            user_prompt = "根据以下术语表（可以为空）：\n" + format_glossary(glossary)
+            user_prompt += "将下面的日文文本根据对应关系和备注翻译成中文：" + text
+        else:
+            user_prompt = "将下面的日文文本翻译成中文：" + text
+        messages.append({"role": "user", "content": user_prompt})
+    return messages
+
+def get_sampling(model_type: str) -> dict:
+    """
+    获取模型推荐的采样参数
+
+    Args:
+        model_type (str): 模型类型
+
+    Returns:
+        dict: temperature、top_p和frequency_penalty
+    """
+    if model_type == "GalTranslV3":
+        return {"temperature": 0.6, "top_p": 0.8, "frequency_penalty": 0.1}
+    return {"temperature": 0.1, "top_p": 0.3, "frequency_penalty": 0.2}
+
+def get_mtool_sampling(model_type: str) -> dict:
+    """
+    获取Mtool脚本使用的采样参数，与Translator++后端的get_sampling不同，保持Mtool脚本原有的取值
+
+    Args:
+        model_type (str): 模型类型
+
+    Returns:
+        dict: temperature、top_p和frequency_penalty
+    """
+    temperature = 0.6 if model_type == "GalTranslV3" else 0.2
+    return {"temperature": temperature, "top_p": 0.3, "frequency_penalty": 0.2}
+
+def make_request(text: str, model_type: str, context: list[str] = (), glossary: list[dict] = (), max_tokens: int = 512,
+                 sampling: dict = None) -> dict:
+    """
+    构造OpenAI兼容的chat completions请求体
+
+    Args:
+        text (str): 待翻译的日文文本
+        model_type (str): 模型类型
+        context (list[str], optional): 历史译文
+        glossary (list[dict], optional): 术语表
+        max_tokens (int, optional): 最大生成token数
+        sampling (dict, optional): 采样参数，默认为get_sampling(model_type)
+
+    Returns:
+        dict: 请求体
+    """
+    data = {
+        "model": "sukinishiro",
+        "messages": build_messages(text, model_type, context, glossary),
+        "max_tokens": max_tokens,
+        "do_sample": True,
+        "num_beams": 1,
+        "repetition_penalty": 1.0
+    }
+    data.update(get_sampling(model_type) if sampling is None else sampling)
+    return data
+
+# Mtool两个脚本原有的用户提示词，(有术语表, 无术语表)，GalTranslV3和SakuraV0_8在两个脚本中相同
+MTOOL_USER_PROMPTS = {
+    "main": ("根据上文和以下术语表：\n{dict_str}\n将下面的日文文本翻译成中文：{text}",
+             "根据上文，将下面的日文文本翻译成中文：{text}"),
+    "main_dev": ("参考以下术语表：\n{dict_str}\n根据以上术语表的对应关系和备注，结合历史剧情和上下文，将下面的文本从日文翻译成简体中文：{text}",
+                 "结合历史剧情和上下文，将下面的文本从日文翻译成简体中文：{text}"),
+}
+
+def build_mtool_messages(text: str, model_type: str, use_dict: bool, dict_data: dict, context: list[str],
+                         variant: str = "main") -> list[dict]:
+    """
+    按Mtool脚本原有的模板构造翻译对话，与Translator++后端使用的build_messages不同
+
+    Args:
+        text (str): 待翻译的日文文本
+        model_type (str): 模型类型
+        use_dict (bool): 是否使用字典
+        dict_data (dict): {原文: [译文, 备注]}，使用时传入全部词条
+        context (list[str]): 历史译文
+        variant (str, optional): 调用的脚本，"main"或"main_dev"，见MTOOL_USER_PROMPTS
+
+    Returns:
+        list[dict]: OpenAI格式的messages
+    """
+    messages = [{"role": "system", "content": SYSTEM_PROMPTS.get(model_type, DEFAULT_SYSTEM_PROMPT)}]
+    if model_type == "SakuraV0_8":
+        messages.append({"role": "user", "content": f"将下面的日文文本翻译成中文：{text}"})
+        return messages
+    dict_str = "\n".join(f"{k}->{v[0]}" for k, v in dict_data.items()) if use_dict else ""
+    if model_type == "GalTranslV3":
+        history_text = "历史翻译：" + "\n".join(context) if context else ""
+        if use_dict:
+            user_content = f"{history_text}\n参考以下术语表\n{dict_str}\n根据以上术语表的对应关系和备注，结合历史剧情和上下文，将下面的文本从日文翻译成简体中文：\n{text}"
+        else:
+            user_content = f"{history_text}\n结合历史剧情和上下文，将下面的文本从日文翻译成简体中文：\n{text}"
+        messages.append({"role": "user", "content": user_content})
+        return messages
+    for item in context:
+        messages.append({"role": "assistant", "content": item})
+    with_dict, without_dict = MTOOL_USER_PROMPTS[variant]
+    template = with_dict if use_dict else without_dict
+    messages.append({"role": "user", "content": template.format(dict_str=dict_str, text=text)})
+    return messages
+
+def make_request_json(text: str, model_type: str, use_dict: bool, dict_mode: str, dict_data: dict, context: list[str],
+                      max_tokens: int = 512, variant: str = "main") -> dict:
+    """
+    按Mtool配置构造请求体，提示词见build_mtool_messages，采样参数见get_mtool_sampling
+
+    Args:
+        text (str): 待翻译的日文文本
+        model_type (str): 模型类型
+        use_dict (bool): 是否使用字典
+        dict_mode (str): 字典模式，保留该参数以兼容配置，与原脚本相同总是传入全部词条
+        dict_data (dict): {原文: [译文, 备注]}
+        context (list[str]): 历史译文
+        max_tokens (int, optional): 最大生成token数
+        variant (str, optional): 调用的脚本，"main"或"main_dev"
+
+    Returns:
+        dict: 请求体
+    """
+    data = {
+        "model": "sukinishiro",
+        "messages": build_mtool_messages(text, model_type, use_dict, dict_data, context, variant),
+        "max_tokens": max_tokens,
+        "do_sample": True,
+        "num_beams": 1,
+        "repetition_penalty": 1.0
+    }
+    data.update(get_mtool_sampling(model_type))
+    return data
+
+def format_chatml(messages: list[dict]) -> str:
+    """
+    按ChatML模板把对话拼成补全接口使用的提示词，Sakura和GalTransl模型均使用该模板
+
+    Args:
+        messages (list[dict]): OpenAI格式的messages
+
+    Returns:
+        str: 以assistant开头结尾的提示词，等待模型续写译文
+    """
+    prompt = "".join("<|im_start|>{}\n{}<|im_end|>\n".format(item["role"], item["content"]) for item in messages)
+    return prompt + "<|im_start|>assistant\n"
+
+def clean_output(text: str) -> str:
+    """
+    去除模型输出中残留的提示词和结束符
+
+    Args:
+        text (str): 模型输出
+
+    Returns:
+        str: 清理后的译文
+    """
+    return text.replace("将下面的日文文本翻译成中文：", "").replace("<|im_end|>", "")
+
+def llama_chat_kwargs(data: dict) -> dict:
+    """
+    将OpenAI格式的请求体转换为llama_cpp.Llama.create_chat_completion的参数
+
+    Args:
+        data (dict): 请求体
+
+    Returns:
+        dict: create_chat_completion的关键字参数
+    """
+    kwargs = {"messages": data["messages"], "repeat_penalty": data.get("repetition_penalty", 1.0)}
+    for key in ("temperature", "top_p", "max_tokens", "frequency_penalty", "presence_penalty", "stop", "seed"):
+        if key in data:
+            kwargs[key] = data[key]
+    return kwargs
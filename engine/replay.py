@@ -0,0 +1,255 @@
+"""
+离线回放
+
+按engine.capture录制的日志回放模型请求，不需要GPU:
+
+    # 启动替身服务，按原始耗时返回录制的响应（--time-scale 0 立即返回，用于分析客户端开销）
+    python -m engine.replay serve capture.jsonl.gz --port 5000
+
+    # 按原始到达时间向服务端重放录制的请求，输出延迟分布，用于测试调度改动
+    python -m engine.replay drive capture.jsonl.gz http://127.0.0.1:1500
+
+同一日志中追加了多次运行时，drive按运行依次重放，--run可只使用其中一次运行（运行ID见list子命令）。
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import requests
+
+from .capture import group_runs, read_capture, request_key, sequential_timeline
+
+def text_key(path: str, request: dict) -> str:
+    """
+    计算只包含待翻译文本的查找键，上下文或采样参数与录制时不同的请求按它匹配
+
+    Args:
+        path (str): 请求路径
+        request (dict): 请求体
+
+    Returns:
+        str: 请求路径和最后一条消息的查找键，没有messages时与request_key相同
+    """
+    messages = request.get("messages")
+    if not messages:
+        return request_key(path, request)
+    return request_key(path, {"text": messages[-1].get("content")})
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    替身服务，相同请求按录制顺序轮流返回录制的响应，没有完全相同的请求时按待翻译文本匹配
+    """
+    daemon_threads = True
+
+    def __init__(self, address: tuple, records: list[dict], time_scale: float = 1.0):
+        """
+        Args:
+            address (tuple): 监听地址 (host, port)
+            records (list[dict]): 录制记录
+            time_scale (float, optional): 响应延迟相对原始耗时的倍数，0表示立即返回
+        """
+        super().__init__(address, ReplayHandler)
+        self.time_scale = time_scale
+        self.responses = defaultdict(list)
+        self.text_responses = defaultdict(list)
+        for record in records:
+            self.responses[request_key(record["path"], record["request"])].append(record)
+            self.text_responses[text_key(record["path"], record["request"])].append(record)
+        self.next_index = Counter()
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def lookup(self, path: str, request: dict):
+        """
+        查找请求对应的录制记录
+
+        Args:
+            path (str): 请求路径
+            request (dict): 请求体
+
+        Returns:
+            dict | None: 录制记录，没有录制过该请求时返回None
+        """
+        with self.lock:
+            for responses, key, stat in ((self.responses, request_key(path, request), "served"),
+                                         (self.text_responses, text_key(path, request), "served_by_text")):
+                records = responses.get(key)
+                if records:
+                    record = records[self.next_index[stat, key] % len(records)]
+                    self.next_index[stat, key] += 1
+                    self.stats[stat] += 1
+                    return record
+            self.stats["missed"] += 1
+        return None
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def replay(self, path: str, request: dict):
+        record = self.server.lookup(path, request)
+        if record is None:
+            self.send_json({"error": "request not captured"}, 404)
+            return
+        time.sleep(record["latency"] * self.server.time_scale)
+        if record["error"] is not None:
+            self.send_json({"error": record["error"]}, 500)
+        else:
+            self.send_json(record["response"])
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/replay/status":
+            with self.server.lock:
+                self.send_json(dict(self.server.stats))
+            return
+        self.replay(url.path, dict(parse_qsl(url.query)))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json({"error": "invalid json"}, 400)
+            return
+        self.replay(urlparse(self.path).path, request)
+
+def serve(records: list[dict], host: str, port: int, time_scale: float):
+    """
+    启动替身服务直到被中断
+
+    Args:
+        records (list[dict]): 录制记录
+        host (str): 监听地址
+        port (int): 监听端口
+        time_scale (float): 响应延迟相对原始耗时的倍数
+    """
+    server = ReplayServer((host, port), records, time_scale)
+    print(f"回放服务已启动: http://{host}:{port}，共 {len(records)} 条记录")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"完全匹配 {server.stats['served']} 次，按文本匹配 {server.stats['served_by_text']} 次，未录制 {server.stats['missed']} 次")
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    计算分位数
+
+    Args:
+        values (list[float]): 样本
+        q (float): 分位，0到1之间
+
+    Returns:
+        float: 分位数，没有样本时返回0
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+def drive(records: list[dict], target: str, time_scale: float, workers: int):
+    """
+    按录制时的到达时间向目标服务重放请求，并对比原始延迟
+
+    Args:
+        records (list[dict]): 录制记录
+        target (str): 目标服务地址，如"http://127.0.0.1:1500"，请求路径取自录制记录
+        time_scale (float): 到达间隔相对原始间隔的倍数，0表示全部立即发送
+        workers (int): 最多同时进行的请求数
+
+    Note:
+        start只在同一次运行内可比，多次运行的记录按运行先后依次排列，见engine.capture.sequential_timeline
+    """
+    records = sequential_timeline(records)
+    latencies = []
+    errors = Counter()
+    lock = threading.Lock()
+
+    def send(record):
+        start = time.time()
+        try:
+            if record["path"] == "/":
+                response = requests.get(target.rstrip("/") + "/", params=record["request"], timeout=600)
+            else:
+                response = requests.post(target.rstrip("/") + record["path"], json=record["request"], timeout=600)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            with lock:
+                errors[type(e).__name__] += 1
+            return
+        with lock:
+            latencies.append(time.time() - start)
+
+    began = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for record in records:
+            delay = record["start"] * time_scale - (time.time() - began)
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, record)
+    elapsed = time.time() - began
+
+    original = [record["latency"] for record in records]
+    print(f"重放 {len(records)} 条请求，耗时 {elapsed:.1f} 秒，失败 {sum(errors.values())} 条 {dict(errors)}")
+    print(f"原始延迟: p50 {percentile(original, 0.5):.2f}s p95 {percentile(original, 0.95):.2f}s")
+    print(f"重放延迟: p50 {percentile(latencies, 0.5):.2f}s p95 {percentile(latencies, 0.95):.2f}s")
+
+def list_runs(records: list[dict]):
+    """
+    输出日志中每次运行的ID、请求数和时长
+
+    Args:
+        records (list[dict]): 录制记录
+    """
+    for run, items in group_runs(records).items():
+        duration = max(record["start"] + record["latency"] for record in items)
+        print(f"{run or '（无运行头）'}: {len(items)} 条请求，{duration:.1f} 秒")
+
+def main():
+    parser = argparse.ArgumentParser(description="回放engine.capture录制的模型请求")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    list_parser = subparsers.add_parser("list", help="列出日志中的各次运行")
+    list_parser.add_argument("capture", help="录制日志路径")
+    serve_parser = subparsers.add_parser("serve", help="启动返回录制响应的替身服务")
+    serve_parser.add_argument("capture", help="录制日志路径")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=5000)
+    serve_parser.add_argument("--time-scale", type=float, default=1.0, help="响应延迟相对原始耗时的倍数，0表示立即返回")
+    serve_parser.add_argument("--run", help="只使用指定运行ID的记录")
+    drive_parser = subparsers.add_parser("drive", help="按原始到达时间向服务端重放录制的请求")
+    drive_parser.add_argument("capture", help="录制日志路径")
+    drive_parser.add_argument("target", help="目标服务地址，如http://127.0.0.1:1500")
+    drive_parser.add_argument("--time-scale", type=float, default=1.0, help="到达间隔相对原始间隔的倍数，0表示全部立即发送")
+    drive_parser.add_argument("--workers", type=int, default=64, help="最多同时进行的请求数")
+    drive_parser.add_argument("--run", help="只重放指定运行ID的记录")
+    args = parser.parse_args()
+
+    records = list(read_capture(args.capture))
+    if args.command == "list":
+        list_runs(records)
+        return
+    if args.run:
+        records = [record for record in records if record["run"] == args.run]
+    if args.command == "serve":
+        serve(records, args.host, args.port, args.time_scale)
+    else:
+        drive(records, args.target, args.time_scale, args.workers)
+
+if __name__ == "__main__":
+    main()
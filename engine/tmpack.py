@@ -0,0 +1,213 @@
+"""
+翻译记忆包
+
+只读的翻译记忆文件，构建一次后以mmap方式打开，同一台机器上的多个进程共享页缓存，不需要各自把JSON读入字典:
+
+    # 由已翻译的Mtool文件或Translator++后端的cache.jsonl构建
+    python -m engine.tmpack build common.tmpack game1/ManualTransFile.json game2/ManualTransFile.json
+
+    # 查询
+    python -m engine.tmpack lookup common.tmpack "はい"
+
+文件格式（小端序）:
+    - 文件头: 魔数b"TMPK"、版本号(uint32)、条目数(uint64)
+    - 索引: 按原文哈希排序的条目，每条为 哈希(uint64)、原文偏移(uint64)、译文偏移(uint64)、原文长度(uint32)、译文长度(uint32)
+    - 字符串区: UTF-8编码的原文和译文，偏移相对于字符串区起始位置
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+
+MAGIC = b"TMPK"
+VERSION = 1
+HEADER = struct.Struct("<4sIQ")
+ENTRY = struct.Struct("<QQQII")
+
+def text_hash(data: bytes) -> int:
+    """
+    计算原文的64位哈希
+
+    Args:
+        data (bytes): UTF-8编码的原文
+
+    Returns:
+        int: 哈希值
+    """
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+def build_pack(pairs, path: str) -> int:
+    """
+    构建翻译记忆包
+
+    Args:
+        pairs: 可迭代的(原文, 译文)，原文重复时保留最后一条
+        path (str): 输出文件路径
+
+    Returns:
+        int: 写入的条目数
+    """
+    memory = {}
+    for source, target in pairs:
+        memory[source] = target
+    entries = []
+    blob = bytearray()
+    for source, target in memory.items():
+        source_bytes = source.encode("utf-8")
+        target_bytes = target.encode("utf-8")
+        source_offset = len(blob)
+        blob += source_bytes
+        target_offset = len(blob)
+        blob += target_bytes
+        entries.append((text_hash(source_bytes), source_offset, target_offset, len(source_bytes), len(target_bytes)))
+    entries.sort()
+    # 先写临时文件再替换，正在使用旧文件的进程不受影响
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+        for entry in entries:
+            file.write(ENTRY.pack(*entry))
+        file.write(blob)
+    os.replace(temp_path, path)
+    return len(entries)
+
+class TranslationMemory:
+    """
+    以mmap方式打开的只读翻译记忆包，按原文哈希二分查找，查询复杂度O(log n)
+    """
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): 由build_pack构建的文件路径
+
+        Raises:
+            ValueError: 文件格式不正确
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise ValueError(f"{path} 不是翻译记忆包")
+        magic, version, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} 不是翻译记忆包或版本不兼容")
+        self.blob_start = HEADER.size + self.count * ENTRY.size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.lookups = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _entry(self, index: int) -> tuple:
+        return ENTRY.unpack_from(self.map, HEADER.size + index * ENTRY.size)
+
+    def get(self, text: str, default: str = None) -> str:
+        """
+        查询原文对应的译文
+
+        Args:
+            text (str): 原文
+            default (str, optional): 没有记录时的返回值
+
+        Returns:
+            str: 译文，没有记录时返回default
+        """
+        source_bytes = text.encode("utf-8")
+        target_hash = text_hash(source_bytes)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < target_hash:
+                low = middle + 1
+            else:
+                high = middle
+        result = None
+        # 哈希相同的条目相邻，逐个比较原文
+        index = low
+        while index < self.count:
+            entry_hash, source_offset, target_offset, source_length, target_length = self._entry(index)
+            if entry_hash != target_hash:
+                break
+            start = self.blob_start + source_offset
+            if self.map[start:start + source_length] == source_bytes:
+                start = self.blob_start + target_offset
+                result = self.map[start:start + target_length].decode("utf-8")
+                break
+            index += 1
+        with self.lock:
+            self.lookups += 1
+            if result is not None:
+                self.hits += 1
+        return default if result is None else result
+
+    def __contains__(self, text: str) -> bool:
+        return self.get(text) is not None
+
+    def stats(self) -> dict:
+        """
+        获取查询统计
+
+        Returns:
+            dict: 条目数、查询次数和命中次数
+        """
+        with self.lock:
+            return {"entries": self.count, "lookups": self.lookups, "hits": self.hits}
+
+    def close(self):
+        """
+        关闭文件映射
+        """
+        self.map.close()
+
+def read_pairs(path: str):
+    """
+    从已翻译的文件中读取(原文, 译文)
+
+    Args:
+        path (str): Mtool导出的JSON文件（{原文: 译文}，原文与译文相同的条目视为未翻译），
+            或Translator++后端的cache.jsonl（每行[原文, 上文, 字典, 译文]）
+
+    Yields:
+        tuple[str, str]: 原文和译文
+    """
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                yield row[0], row[-1]
+        return
+    with open(path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    for source, target in data.items():
+        if isinstance(target, str) and target and target != source:
+            yield source, target
+
+def main():
+    parser = argparse.ArgumentParser(description="构建和查询翻译记忆包")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="由已翻译的文件构建翻译记忆包，后面的文件覆盖前面文件中的相同原文")
+    build_parser.add_argument("output", help="输出文件路径")
+    build_parser.add_argument("inputs", nargs="+", help="Mtool的JSON文件或Translator++的cache.jsonl")
+    lookup_parser = subparsers.add_parser("lookup", help="查询原文")
+    lookup_parser.add_argument("pack", help="翻译记忆包路径")
+    lookup_parser.add_argument("texts", nargs="+", help="原文")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        count = build_pack((pair for path in args.inputs for pair in read_pairs(path)), args.output)
+        print(f"已写入 {count} 条到 {args.output}")
+    else:
+        memory = TranslationMemory(args.pack)
+        for text in args.texts:
+            print(f"{text} -> {memory.get(text)}")
+
+if __name__ == "__main__":
+    main()
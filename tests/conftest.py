@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 仓库没有打包配置，测试按各脚本的运行方式把根目录、Mtool和Translator++加入模块搜索路径
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "Mtool"), os.path.join(ROOT, "Translator++")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
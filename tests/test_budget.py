@@ -0,0 +1,53 @@
+from engine.budget import GenerationBudget, count_lines, estimate_tokens
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("テスト") == 4
+    assert estimate_tokens("abcdefgh") == 3
+
+
+def test_count_lines():
+    assert count_lines("a") == 1
+    assert count_lines("a\r\nb\rc\nd") == 4
+
+
+def test_limit_is_clamped():
+    budget = GenerationBudget(max_tokens=512, min_tokens=32)
+    assert budget.limit("あ") == 32
+    assert budget.limit("あ" * 1000) == 512
+
+
+def test_retry_escalates_budget():
+    budget = GenerationBudget(max_tokens=512, min_tokens=8, default_ratio=2.0, margin=1.0, line_slack=0, escalation=4.0)
+    text = "あ" * 9
+    first = budget.limit(text)
+    assert first == 2 * estimate_tokens(text)
+    assert budget.limit(text, attempt=1) == first * 4
+    assert budget.limit(text, attempt=2) == first * 16
+    assert budget.limit(text, attempt=3) == 512
+
+
+def test_ratio_is_learned_from_untruncated_samples():
+    budget = GenerationBudget(default_ratio=2.0, min_samples=3, quantile=0.95)
+    text = "あ" * 9
+    for tokens in (5, 10, 10):
+        assert not budget.record(text, tokens, 100)
+    assert budget.ratio() == 1.0
+    # 达到上限的响应只计数，不参与学习
+    assert budget.record(text, 100, 100)
+    assert budget.ratio() == 1.0
+    stats = budget.stats()
+    assert stats["samples"] == 3 and stats["truncated"] == 1
+
+
+def test_apply_sets_stop_only_without_blank_lines():
+    budget = GenerationBudget(max_tokens=512)
+    data = budget.apply({}, "一行目\n二行目")
+    assert data["stop"] == ["\n\n"]
+    assert data["max_tokens"] == budget.limit("一行目\n二行目")
+    assert "stop" not in budget.apply({}, "段落\n\n段落")
+    retry = budget.apply({}, "一行目", attempt=1)
+    assert retry["max_tokens"] > budget.limit("一行目")
+    stats = budget.stats()
+    assert stats["requests"] == 2 and stats["saved_tokens"] > 0
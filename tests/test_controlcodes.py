@@ -0,0 +1,64 @@
+from engine.controlcodes import RPGMAKER_CODES, TRANSLATOR_PP_CODES, find_placeholders, format_placeholder
+from template import check_template_translation, fill_template, make_template
+
+
+def test_rpgmaker_round_trip():
+    source = "\\C[2]勇者\\C[0]は\\V[10]ゴールドを手に入れた！\\{"
+    protected, mapping = RPGMAKER_CODES.protect(source)
+    assert "\\" not in protected
+    assert list(mapping) == ["控制符1", "控制符2", "控制符3", "控制符4"]
+    assert RPGMAKER_CODES.restore(protected, mapping) == source
+    assert RPGMAKER_CODES.verify(source, RPGMAKER_CODES.restore(protected, mapping))
+
+
+def test_translator_pp_round_trip():
+    source = "${dat[1]}は${dat[2]}を使った"
+    protected, mapping = TRANSLATOR_PP_CODES.protect(source, 5)
+    assert protected == "控制符5は控制符6を使った"
+    assert TRANSLATOR_PP_CODES.restore(protected, mapping) == source
+
+
+def test_digits_after_code_are_kept():
+    source = "\\C[1]1000G"
+    protected, mapping = RPGMAKER_CODES.protect(source)
+    assert protected == "控制符11000G"
+    assert RPGMAKER_CODES.restore(protected, mapping) == source
+
+
+def test_ten_or_more_codes_do_not_absorb_following_digit():
+    source = "".join(f"\\V[{i}]" for i in range(11)) + "0"
+    protected, mapping = RPGMAKER_CODES.protect(source)
+    assert "控制符01" in mapping and "控制符11" in mapping
+    # 第1个控制符后紧跟数字0时不会被读成第10个控制符
+    translation = "控制符010" + "".join(format_placeholder(i, 2) for i in range(2, 12))
+    assert RPGMAKER_CODES.restore(translation, mapping) == "\\V[0]0" + "".join(f"\\V[{i}]" for i in range(1, 11))
+    assert RPGMAKER_CODES.restore(protected, mapping) == source
+
+
+def test_unpadded_placeholder_is_restored():
+    source = "a\\C[1]b" + "\\C[2]" * 9
+    protected, mapping = RPGMAKER_CODES.protect(source)
+    assert RPGMAKER_CODES.restore(protected.replace("控制符01", "控制符1"), mapping) == source
+
+
+def test_foreign_placeholders_are_left_alone():
+    protected, mapping = RPGMAKER_CODES.protect("控制符1と\\N[1]")
+    assert protected == "控制符1と控制符2"
+    assert RPGMAKER_CODES.restore("控制符1和控制符2", mapping) == "控制符1和\\N[1]"
+
+
+def test_template_round_trip_with_many_slots():
+    text = "".join(f"{i}個" for i in range(12))
+    template, slots = make_template(text)
+    assert len(slots) == 12
+    assert find_placeholders(template, 2) == list(range(1, 13))
+    translation = template.replace("個", "个")
+    assert check_template_translation(translation, len(slots))
+    assert fill_template(translation, slots) == text.replace("個", "个")
+
+
+def test_template_rejects_missing_slot():
+    template, slots = make_template("HPを100回復する")
+    assert template == "HPを控制符1回復する"
+    assert not check_template_translation("恢复HP", len(slots))
+    assert fill_template("恢复控制符1点HP", slots) == "恢复100点HP"
@@ -0,0 +1,82 @@
+import pytest
+
+from distributed import DONE, LEASED, PENDING, SegmentQueue
+
+
+def make_queue(lease_timeout=300, context_size=0):
+    queue = SegmentQueue(lease_timeout, context_size)
+    queue.add_task("a.json", 5, 3)
+    return queue
+
+
+def states(queue):
+    return [segment["state"] for segment in queue.segments]
+
+
+def test_segments_use_inclusive_end():
+    queue = make_queue()
+    assert [(s["start"], s["end"]) for s in queue.segments] == [(0, 2), (3, 4)]
+
+
+def test_expired_lease_is_requeued():
+    queue = make_queue(lease_timeout=300)
+    first = queue.lease("w1")
+    assert first["segment_id"] == 0
+    assert states(queue) == [LEASED, PENDING]
+    # 租约过期后同一分段重新分配给其它工作者，旧租约提交的结果被丢弃
+    queue.segments[0]["expires"] = 0
+    second = queue.lease("w2")
+    assert second["segment_id"] == 0
+    assert second["lease_id"] != first["lease_id"]
+    assert queue.complete(first["lease_id"], ["x"] * 3) is None
+    assert queue.complete(second["lease_id"], ["x"] * 3)["segment_id"] == 0
+    assert states(queue) == [DONE, PENDING]
+
+
+def test_renew_extends_lease():
+    queue = make_queue()
+    segment = queue.lease("w1")
+    queue.segments[0]["expires"] = 0
+    assert queue.renew(segment["lease_id"])
+    assert queue.lease("w2")["segment_id"] == 1
+
+
+def test_release_requeues_immediately():
+    queue = make_queue()
+    segment = queue.lease("w1")
+    queue.release(segment["lease_id"])
+    assert not queue.renew(segment["lease_id"])
+    assert queue.lease("w2")["segment_id"] == 0
+
+
+def test_wrong_translation_count_is_rejected_and_requeued():
+    queue = make_queue()
+    segment = queue.lease("w1")
+    with pytest.raises(ValueError):
+        queue.complete(segment["lease_id"], ["x"] * 2)
+    assert states(queue) == [PENDING, PENDING]
+    assert queue.lease("w2")["segment_id"] == 0
+
+
+def test_done_starts_are_skipped_and_finish_is_reported():
+    queue = SegmentQueue()
+    queue.add_task("a.json", 5, 3, done_starts=[0])
+    segment = queue.lease("w1")
+    assert segment["start"] == 3
+    assert queue.lease("w2") is None
+    assert not queue.is_finished()
+    queue.complete(segment["lease_id"], ["x", "y"])
+    assert queue.is_finished()
+    assert queue.done_starts("a.json") == [0, 3]
+    assert not queue.notify_finished("w1")
+    assert queue.notify_finished("w2")
+
+
+def test_previous_tail_requires_finished_previous_segment():
+    queue = make_queue(context_size=1)
+    first = queue.lease("w1")
+    second = queue.lease("w2")
+    assert second["previous_translations"] == []
+    queue.complete(first["lease_id"], ["a", "b", "c"])
+    queue.release(second["lease_id"])
+    assert queue.lease("w2")["previous_translations"] == ["c"]
@@ -0,0 +1,60 @@
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+from scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, Job, Scheduler
+
+
+class GatedLLM:
+    """按提交顺序记录任务，gate打开后才返回结果的假进程池"""
+    def __init__(self):
+        self.order = []
+        self.gate = threading.Event()
+        self.started = threading.Condition()
+
+    def translate(self, text, history, gpt_dicts, callback, error_callback):
+        with self.started:
+            self.order.append(text)
+            self.started.notify_all()
+        threading.Thread(target=lambda: (self.gate.wait(), callback(text)), daemon=True).start()
+
+    def wait_started(self, count):
+        with self.started:
+            assert self.started.wait_for(lambda: len(self.order) >= count, timeout=5)
+
+
+def block_pool(scheduler, llm):
+    # 先占满唯一的执行名额，后续任务都留在调度器中排队
+    future = scheduler.submit(Job("blocker", PRIORITY_BATCH), "blocker")
+    llm.wait_started(1)
+    return future
+
+
+def test_interactive_first_and_clients_round_robin():
+    llm = GatedLLM()
+    scheduler = Scheduler(llm, 1)
+    block_pool(scheduler, llm)
+    batch_a, batch_b = Job("a", PRIORITY_BATCH), Job("b", PRIORITY_BATCH)
+    futures = [scheduler.submit(batch_a, text) for text in ("a1", "a2", "a3")]
+    futures += [scheduler.submit(batch_b, text) for text in ("b1", "b2")]
+    futures.append(scheduler.submit(Job("c", PRIORITY_INTERACTIVE), "c1"))
+    llm.gate.set()
+    assert [future.result(timeout=5) for future in futures] == ["a1", "a2", "a3", "b1", "b2", "c1"]
+    assert llm.order == ["blocker", "c1", "a1", "b1", "a2", "b2", "a3"]
+
+
+def test_cancel_removes_queued_work():
+    llm = GatedLLM()
+    scheduler = Scheduler(llm, 1)
+    blocker = block_pool(scheduler, llm)
+    job = Job("a", PRIORITY_BATCH)
+    futures = [scheduler.submit(job, text) for text in ("a1", "a2")]
+    assert scheduler.cancel(job) == 2
+    assert scheduler.stats()["queued"][PRIORITY_BATCH] == {}
+    with pytest.raises(CancelledError):
+        futures[0].result(timeout=5)
+    assert scheduler.submit(job, "a3").cancelled()
+    llm.gate.set()
+    assert blocker.result(timeout=5) == "blocker"
+    assert llm.order == ["blocker"]
@@ -0,0 +1,29 @@
+import pytest
+
+from scheduling import interleave, schedule_indices
+
+TEXTS = ["あ" * 40, "あ", "あ" * 3, "あ" * 20, "ああ"]
+
+
+def test_file_policy_keeps_order():
+    assert schedule_indices(range(5), TEXTS.__getitem__) == [0, 1, 2, 3, 4]
+
+
+def test_sjf_orders_by_estimated_length():
+    assert schedule_indices(range(5), TEXTS.__getitem__, "sjf") == [1, 4, 2, 3, 0]
+
+
+def test_bucket_keeps_file_order_within_bucket():
+    # “あ”和“ああ”的估算长度落在同一个桶（2和3个token），桶内按原下标排列
+    assert schedule_indices(range(5), TEXTS.__getitem__, "bucket") == [1, 4, 2, 3, 0]
+    assert schedule_indices([4, 1], TEXTS.__getitem__, "bucket") == [1, 4]
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        schedule_indices(range(5), TEXTS.__getitem__, "lifo")
+
+
+def test_interleave_spreads_similar_lengths_across_ranges():
+    assert interleave([0, 1, 2, 3, 4, 5], [3, 3]) == [0, 2, 4, 1, 3, 5]
+    assert interleave([0, 1, 2, 3, 4], [1, 4]) == [0, 1, 2, 3, 4]
@@ -0,0 +1,46 @@
+from template import TemplateCache
+
+
+def fake_translate(calls):
+    def translate(text):
+        calls.append(text)
+        return text.replace("を", "").replace("回復する", "恢复")
+    return translate
+
+
+def test_template_is_translated_once():
+    cache = TemplateCache()
+    calls = []
+    results = [cache.translate(f"HPを{n}回復する", fake_translate(calls)) for n in (100, 500, 100)]
+    assert results == ["HP100恢复", "HP500恢复", "HP100恢复"]
+    assert calls == ["HPを控制符1回復する"]
+    assert cache.stats()["hits"] == 2
+
+
+def test_dictionary_names_are_slots():
+    cache = TemplateCache()
+    calls = []
+    dict_data = {"アリス": ["爱丽丝", ""], "ボブ": ["鲍勃", ""]}
+    assert cache.translate("アリスを回復する", fake_translate(calls), dict_data) == "爱丽丝恢复"
+    assert cache.translate("ボブを回復する", fake_translate(calls), dict_data) == "鲍勃恢复"
+    assert calls == ["控制符1を回復する"]
+
+
+def test_rejected_template_falls_back_to_each_text():
+    cache = TemplateCache()
+    calls = []
+
+    def drop_placeholder(text):
+        calls.append(text)
+        return "恢复"
+
+    assert cache.translate("HPを100回復する", drop_placeholder) == "恢复"
+    assert cache.translate("HPを500回復する", drop_placeholder) == "恢复"
+    assert calls == ["HPを控制符1回復する", "HPを100回復する", "HPを500回復する"]
+    assert cache.stats()["rejected"] == 1
+
+
+def test_text_with_literal_placeholder_is_not_templated():
+    calls = []
+    TemplateCache().translate("控制符1を100回", fake_translate(calls))
+    assert calls == ["控制符1を100回"]
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from engine.tmpack import TranslationMemory, build_pack, read_pairs
+
+
+def test_build_and_lookup(tmp_path):
+    path = str(tmp_path / "memory.tmpack")
+    pairs = [("こんにちは", "你好"), ("さようなら", "再见"), ("こんにちは", "您好")]
+    assert build_pack(pairs, path) == 2
+    memory = TranslationMemory(path)
+    try:
+        assert len(memory) == 2
+        assert memory.get("こんにちは") == "您好"
+        assert memory.get("さようなら") == "再见"
+        assert memory.get("ありがとう", "原文") == "原文"
+        assert "ありがとう" not in memory
+        assert memory.stats() == {"entries": 2, "lookups": 4, "hits": 2}
+    finally:
+        memory.close()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "other.bin"
+    path.write_bytes(b"not a pack at all")
+    with pytest.raises(ValueError):
+        TranslationMemory(str(path))
+
+
+def test_read_pairs_skips_untranslated(tmp_path):
+    json_path = tmp_path / "ManualTransFile.json"
+    json_path.write_text(json.dumps({"あ": "啊", "い": "い", "う": ""}, ensure_ascii=False), encoding="utf-8")
+    cache_path = tmp_path / "cache.jsonl"
+    cache_path.write_text('["え", "", null, "诶"]\nbroken\n', encoding="utf-8")
+    assert list(read_pairs(str(json_path))) == [("あ", "啊")]
+    assert list(read_pairs(str(cache_path))) == [("え", "诶")]
@@ -0,0 +1,26 @@
+from workqueue import PrefixProgress
+
+
+def test_checkpoint_is_contiguous_prefix():
+    progress = PrefixProgress("a.json", [5, 3, 1, 0])
+    assert progress.pending() == [5, 3, 1, 0]
+    assert not progress.complete(1)
+    assert progress.done == 0
+    assert not progress.complete(5)
+    assert progress.done == 1
+    assert not progress.complete(3)
+    assert progress.done == 3
+    assert progress.complete(0)
+    assert progress.stats() == {"total": 4, "done": 4, "checkpoint": 4, "finished": True}
+
+
+def test_resume_skips_saved_prefix():
+    progress = PrefixProgress("a.json", [2, 0, 1], done=2)
+    assert progress.pending() == [1]
+    assert progress.complete(1)
+
+
+def test_saved_checkpoint_is_clamped():
+    progress = PrefixProgress("a.json", [0, 1], done=5)
+    assert progress.is_finished()
+    assert progress.pending() == []